@@ -2,89 +2,359 @@ import base64
 import json
 import re
 import os
+import time
 from dotenv import load_dotenv
-from zhipuai import ZhipuAI
+import metrics
+import rate_limiter
+from cassette import get_cassette, request_key
 
-# 加载环境变量
-load_dotenv()
+# 模型只返回名称、未给出置信度时使用的默认置信度
+DEFAULT_LABEL_CONFIDENCE = 0.7
+
+# 支持 response_format={"type": "json_object"} 的模型（可用 ZHIPU_JSON_MODELS 覆盖）
+DEFAULT_JSON_MODELS = "glm-4-flash,glm-4-flashx,glm-4-air,glm-4-airx,glm-4-plus,glm-4-long,glm-4"
+
+# 全角括号、标点和中文引号（只在严格解析失败后替换）
+_FULLWIDTH = str.maketrans({
+    "［": "[", "］": "]", "｛": "{", "｝": "}", "【": "[", "】": "]",
+    "，": ",", "：": ":", "“": '"', "”": '"', "＂": '"', "‘": "'", "’": "'",
+})
+_CLOSING = {"[": "]", "{": "}"}
+
+# 提示词和重问时使用的输出格式示例
+ROW_SCHEMA = '{"cells": [{"name": "猫", "confidence": 0.9}, {"name": "狗", "confidence": 0.6}, {"name": "汽车", "confidence": 0.8}]}'
+MATCH_SCHEMA = '{"indices": [1, 3, 5]}'
+
+
+def _json_segments(text):
+    """依次返回文本中每个顶层的 [...] / {...} 片段（忽略字符串内的括号），未闭合的片段自动补全"""
+    i = 0
+    while i < len(text):
+        if text[i] not in _CLOSING:
+            i += 1
+            continue
+        start, stack, in_string, escaped = i, [], False, False
+        while i < len(text):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch in _CLOSING:
+                stack.append(_CLOSING[ch])
+            elif stack and ch == stack[-1]:
+                stack.pop()
+                if not stack:
+                    break
+            i += 1
+        # 输出被截断时补上缺少的引号和括号
+        yield text[start:i + 1] + ('"' if in_string else "") + "".join(reversed(stack))
+        i += 1
+
+
+def iter_json_candidates(text):
+    """宽松解析AI输出：去掉代码块标记、替换全角符号、逐个提取括号片段、去掉多余逗号和单引号，依次返回能解析出的值"""
+    text = re.sub(r"```(?:json)?", "", text or "").strip()
+    seen = set()
+    for variant in (text, text.translate(_FULLWIDTH)):
+        for segment in list(_json_segments(variant)) + [variant]:
+            for fixed in (segment, re.sub(r",\s*([\]}])", r"\1", segment)):
+                for candidate in (fixed, fixed.replace("'", '"')):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    try:
+                        yield json.loads(candidate)
+                    except ValueError:
+                        continue
+
+
+def validate_row_labels(parsed):
+    """行识别结果：{"cells": [...]} 或直接的数组，每项为名称或 {name, confidence}"""
+    items = parsed.get("cells") if isinstance(parsed, dict) else parsed
+    if not isinstance(items, list) or not items:
+        return None
+    if not all(isinstance(item, (str, dict)) for item in items):
+        return None
+    return items
+
+
+def validate_match_indices(parsed):
+    """语义裁决结果：{"indices": [...]} 或直接的数组，每项为序号"""
+    items = parsed.get("indices") if isinstance(parsed, dict) else parsed
+    if not isinstance(items, list):
+        return None
+    for item in items:
+        if isinstance(item, bool) or not (isinstance(item, int) or (isinstance(item, str) and item.strip().isdigit())):
+            return None
+    return items
+
+def _rejects_response_format(error):
+    """400 错误是否因为模型不支持 response_format（其他 400 如参数错误、内容审核不应触发降级）"""
+    if getattr(error, "status_code", None) != 400:
+        return False
+    response = getattr(error, "response", None)
+    try:
+        body = response.text if response is not None else ""
+    except Exception:
+        body = ""
+    return "response_format" in f"{error} {body}"
 
 class AIService:
     """AI服务类，封装所有AI调用逻辑"""
     
-    def __init__(self):
-        """初始化AI服务，从环境变量读取配置"""
+    def __init__(self, base_url=None, raise_errors=False):
+        """初始化AI服务，从环境变量读取配置
+
+        base_url 可指向本地模拟服务器（见 mock_zhipu_server.py），未指定时读取 ZHIPU_BASE_URL
+        raise_errors 为 True 时调用失败直接抛出异常（由识别路由负责故障转移），否则降级为空结果
+        """
+        # zhipuai 及其依赖导入较慢，只在真正需要AI服务时加载
+        from zhipuai import ZhipuAI
+        load_dotenv()
+        self.raise_errors = raise_errors
         self.api_key = os.getenv("ZHIPU_API_KEY", "")
         self.model_vision = os.getenv("ZHIPU_MODEL_VISION", "glm-4v-flash")
         self.model_text = os.getenv("ZHIPU_MODEL_TEXT", "glm-4-flash")
+        self.base_url = base_url or os.getenv("ZHIPU_BASE_URL") or None
+        # 429/5xx 的重试由 _chat 结合限流器完成，SDK 自身不再重试
+        self.max_retries = int(os.getenv("ZHIPU_MAX_RETRIES", "2"))
+        # 单次请求超时（秒），避免卡住的调用拖住整次运行
+        self.timeout = float(os.getenv("ZHIPU_TIMEOUT", "30"))
+        # 结构化输出：支持的模型请求 JSON 模式；本地修复仍失败时最多用文本模型重新整理一次
+        self.json_models = {m.strip() for m in (os.getenv("ZHIPU_JSON_MODELS") or DEFAULT_JSON_MODELS).split(",") if m.strip()}
+        self.json_reask = os.getenv("ZHIPU_JSON_REASK", "1").strip().lower() not in ("0", "false", "no", "off")
+        
+        # AI_CASSETTE_MODE=record/replay 时录制或回放AI调用（见 cassette.py），回放时不需要API Key
+        self.cassette = get_cassette()
+        if not self.api_key and self.cassette is not None and self.cassette.replaying:
+            self.api_key = "cassette.replay"
         
         if not self.api_key:
             raise ValueError("未找到ZHIPU_API_KEY环境变量，请在.env文件中配置")
         
-        self.client = ZhipuAI(api_key=self.api_key)
+        self.client = ZhipuAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, max_retries=0)
     
-    def safe_parse_json(self, text):
-        """强力解析 AI 返回的 JSON 列表"""
+    @staticmethod
+    def _classify_error(e):
+        """将异常归类为指标中的调用结果"""
+        status = getattr(e, "status_code", None)
+        if status == 429:
+            return "rate_limited"
+        if status is not None and status >= 500:
+            return "server_error"
+        if "timeout" in type(e).__name__.lower():
+            return "timeout"
+        return "error"
+    
+    @staticmethod
+    def _retry_after(e):
+        """读取429响应中的 Retry-After（秒）"""
+        response = getattr(e, "response", None)
         try:
-            # 尝试使用正则提取最近的一组方括号内容
-            match = re.search(r'\[.*\]', text, re.DOTALL)
-            if match:
-                return json.loads(match.group())
-            return json.loads(text)
-        except Exception:
+            return float(response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
             return None
     
-    def call_vision(self, image_bytes, prompt):
+    def _create(self, model, messages, json_mode=False):
+        """发送请求；json_mode 为 True 且模型支持时要求返回 JSON 对象，模型拒绝该参数时改用普通模式"""
+        if json_mode and model in self.json_models:
+            try:
+                return self.client.chat.completions.create(
+                    model=model, messages=messages, response_format={"type": "json_object"})
+            except Exception as e:
+                if not _rejects_response_format(e):
+                    raise
+                print(f"[WARNING] 模型 {model} 不支持 JSON 输出模式，改用普通模式: {e}")
+                self.json_models.discard(model)
+        return self.client.chat.completions.create(model=model, messages=messages)
+    
+    def _chat(self, method, model, messages, json_mode=False):
+        """统一的对话调用入口，记录调用次数和耗时；失败时抛出异常，由调用方决定降级方式
+
+        所有调用经过按模型共享的令牌桶限流器；429 会触发限流器退避后重试，5xx/超时按指数退避重试
+        回放磁带时不访问网络，也不经过限流器
+        """
+        # SDK 会原地修改消息（去掉图片的 data URL 前缀），磁带的请求哈希需在发送前计算
+        key = request_key(model, messages, json_mode) if self.cassette is not None else None
+        if self.cassette is not None and self.cassette.replaying:
+            start = time.monotonic()
+            outcome = "ok"
+            try:
+                return self.cassette.replay(key).strip()
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                metrics.observe_ai_call(method, outcome, time.monotonic() - start)
+        limiter = rate_limiter.get_limiter(model)
+        for attempt in range(self.max_retries + 1):
+            start = time.monotonic()
+            outcome = "ok"
+            try:
+                with limiter.slot():
+                    # 耗时只统计模型本身，排队时间由限流器单独记录
+                    start = time.monotonic()
+                    response = self._create(model, messages, json_mode)
+                limiter.on_success()
+                content = response.choices[0].message.content
+                if self.cassette is not None and self.cassette.recording:
+                    self.cassette.record(key, method, model, content, time.monotonic() - start)
+                return content.strip()
+            except Exception as e:
+                outcome = self._classify_error(e)
+                if outcome == "rate_limited":
+                    limiter.on_rate_limited(self._retry_after(e))
+                if attempt >= self.max_retries or outcome not in ("rate_limited", "server_error", "timeout"):
+                    raise
+                print(f"[WARNING] AI调用失败（{outcome}），第 {attempt + 1} 次重试...")
+                if outcome != "rate_limited":
+                    time.sleep(min(8.0, 0.5 * 2 ** attempt))
+            finally:
+                metrics.observe_ai_call(method, outcome, time.monotonic() - start)
+    
+    def safe_parse_json(self, text):
+        """强力解析 AI 返回的 JSON（见 iter_json_candidates），无法解析时返回 None"""
+        return next(iter_json_candidates(text), None)
+    
+    def parse_structured(self, method, content, validate, schema_hint):
+        """解析并校验结构化输出，返回 validate 的结果，失败时返回 None
+
+        依次尝试：严格解析 → 本地修复 → 用文本模型把原回答整理为 schema_hint 格式（只重问一次，不重新发送图片）
+        """
+        try:
+            result = validate(json.loads(content))
+        except ValueError:
+            result = None
+        if result is not None:
+            metrics.AI_JSON_PARSE.inc(method=method, result="ok")
+            return result
+        for parsed in iter_json_candidates(content):
+            result = validate(parsed)
+            if result is not None:
+                metrics.AI_JSON_PARSE.inc(method=method, result="repaired")
+                return result
+        
+        if self.json_reask and content.strip():
+            print(f"[WARNING] {method} 的输出无法解析，请文本模型整理为 JSON")
+            prompt = (f"下面是一段识别结果，请把它整理为 JSON，格式为：{schema_hint}\n"
+                      f"只输出 JSON，不要添加原文中没有的信息。\n\n{content}")
+            try:
+                reply = self._chat(f"{method}_reask", self.model_text, [{"role": "user", "content": prompt}], json_mode=True)
+            except Exception as e:
+                print(f"[WARNING] 整理 JSON 失败: {e}")
+                reply = ""
+            for parsed in iter_json_candidates(reply):
+                result = validate(parsed)
+                if result is not None:
+                    metrics.AI_JSON_PARSE.inc(method=method, result="reasked")
+                    return result
+        metrics.AI_JSON_PARSE.inc(method=method, result="failed")
+        return None
+    
+    def call_vision(self, image_bytes, prompt, method="call_vision"):
         """调用智谱多模态模型"""
         base64_data = base64.b64encode(image_bytes).decode('utf-8')
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_vision,
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_data}"}}
-                    ]
-                }]
-            )
-            return response.choices[0].message.content.strip()
+            return self._chat(method, self.model_vision, [{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_data}"}}
+                ]
+            }])
         except Exception as e:
             print(f"[ERROR] AI API 调用失败: {e}")
+            if self.raise_errors:
+                raise
             return ""
     
+    def identify_target(self, tip_img_bytes):
+        """识别九宫格题目中的图片提示"""
+        return self.call_vision(tip_img_bytes, "图中是什么物体？只回答物体名称，不要带标点。", method="identify_target")
+    
     def identify_captcha_row(self, row_img_bytes, row_index):
         """分行识别逻辑"""
-        prompt = "这是验证码的一行图片，包含3个格子。请从左到右识别这3个格子的物体名称，只返回一个 JSON 字符串数组，例如：[\"猫\", \"狗\", \"汽车\"]。不要有任何解释文字。"
-        res = self.call_vision(row_img_bytes, prompt)
+        labels, _ = self.identify_captcha_row_scored(row_img_bytes, row_index)
+        return labels
+    
+    def identify_captcha_row_scored(self, row_img_bytes, row_index):
+        """分行识别逻辑（带置信度），返回 (3个名称, 3个置信度)"""
+        prompt = f"这是验证码的一行图片，包含3个格子。请从左到右识别这3个格子的物体名称，并给出0到1之间的把握程度，只返回一个 JSON 对象，例如：{ROW_SCHEMA}。不要有任何解释文字。"
+        res = self.call_vision(row_img_bytes, prompt, method="identify_captcha_row")
         print(f"[AI] 第 {row_index} 行识别结果: {res}")
         
-        parsed = self.safe_parse_json(res)
-        if parsed and isinstance(parsed, list):
-            # 确保返回 3 个元素
-            while len(parsed) < 3:
-                parsed.append("未知")
-            return parsed[:3]
-        return ["未知", "未知", "未知"]
+        labels, confidences = [], []
+        parsed = self.parse_structured("identify_captcha_row", res, validate_row_labels, ROW_SCHEMA) if res else None
+        if parsed:
+            for item in parsed[:3]:
+                label, confidence = self._parse_scored_label(item)
+                labels.append(label)
+                confidences.append(confidence)
+        # 确保返回 3 个元素
+        while len(labels) < 3:
+            labels.append("未知")
+            confidences.append(0.0)
+        return labels, confidences
+    
+    @staticmethod
+    def _parse_scored_label(item):
+        """解析单个格子的识别结果，兼容纯字符串和 {name, confidence} 两种格式"""
+        if isinstance(item, dict):
+            label = str(item.get("name") or item.get("label") or "未知").strip()
+            try:
+                confidence = float(item.get("confidence", DEFAULT_LABEL_CONFIDENCE))
+            except (TypeError, ValueError):
+                confidence = DEFAULT_LABEL_CONFIDENCE
+        else:
+            label = str(item).strip()
+            confidence = DEFAULT_LABEL_CONFIDENCE
+        if not label or label == "未知":
+            return "未知", 0.0
+        return label, min(max(confidence, 0.0), 1.0)
     
     def semantic_match(self, target, descriptions):
         """语义裁决逻辑"""
+        indices, _ = self.semantic_match_scored(target, descriptions)
+        return indices
+    
+    def semantic_match_scored(self, target, descriptions):
+        """语义裁决逻辑（带置信度），返回 (序号列表, 置信度)
+
+        置信度：结果可解析且全部为 1-9 的序号时为 1.0；含无效项时为 0.5；无法解析时为 0.0
+        """
         items_text = "\n".join([f"{i+1}. {d}" for i, d in enumerate(descriptions)])
-        prompt = f"题目是：找出图片中所有的【{target}】。\n当前 9 个格子的识别结果如下：\n{items_text}\n请根据描述，判断哪些序号（1-9）最符合题目要求？\n返回格式：只返回 JSON 数组，如 [1, 3, 5]。如果没有符合的，返回空数组 []。"
+        prompt = f"题目是：找出图片中所有的【{target}】。\n当前 9 个格子的识别结果如下：\n{items_text}\n请根据描述，判断哪些序号（1-9）最符合题目要求？\n返回格式：只返回 JSON 对象，如 {MATCH_SCHEMA}。如果没有符合的，返回 {{\"indices\": []}}。"
         
         print(f"[Debug] 正在进行语义裁决，描述列表：\n{items_text}")
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_text,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            content = response.choices[0].message.content.strip()
+            content = self._chat("semantic_match", self.model_text, [{"role": "user", "content": prompt}], json_mode=True)
             print(f"[AI] 语义裁决原始输出: {content}")
-            parsed = self.safe_parse_json(content)
-            return parsed if isinstance(parsed, list) else []
+            parsed = self.parse_structured("semantic_match", content, validate_match_indices, MATCH_SCHEMA)
         except Exception as e:
             print(f"[ERROR] 语义匹配失败: {e}")
-            return []
+            if self.raise_errors:
+                raise
+            return [], 0.0
+        
+        if parsed is None:
+            return [], 0.0
+        valid = []
+        for idx in parsed:
+            try:
+                val = int(idx)
+            except (TypeError, ValueError):
+                continue
+            if 1 <= val <= 9 and val not in valid:
+                valid.append(val)
+        confidence = 1.0 if len(valid) == len(parsed) else 0.5
+        return valid, confidence
     
     def identify_slider_gap(self, bg_img_bytes, slice_img_bytes=None):
         """识别滑块验证码的缺口位置"""
@@ -104,18 +374,14 @@ class AIService:
             base64_slice = base64.b64encode(slice_img_bytes).decode('utf-8')
             
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model_vision,
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_bg}"}},
-                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_slice}"}}
-                        ]
-                    }]
-                )
-                result_text = response.choices[0].message.content.strip()
+                result_text = self._chat("identify_slider_gap", self.model_vision, [{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_bg}"}},
+                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_slice}"}}
+                    ]
+                }])
                 print(f"[AI] 滑块缺口识别结果（原始）: {result_text}")
                 
                 # 提取数字
@@ -129,6 +395,8 @@ class AIService:
                     return 0
             except Exception as e:
                 print(f"[ERROR] AI识别滑块缺口失败: {e}")
+                if self.raise_errors:
+                    raise
                 return 0
         else:
             # 如果只有背景图，尝试识别缺口特征
@@ -142,17 +410,13 @@ class AIService:
             base64_bg = base64.b64encode(bg_img_bytes).decode('utf-8')
             
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model_vision,
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_bg}"}}
-                        ]
-                    }]
-                )
-                result_text = response.choices[0].message.content.strip()
+                result_text = self._chat("identify_slider_gap", self.model_vision, [{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_bg}"}}
+                    ]
+                }])
                 print(f"[AI] 滑块缺口识别结果（原始）: {result_text}")
                 
                 # 提取数字
@@ -166,4 +430,6 @@ class AIService:
                     return 0
             except Exception as e:
                 print(f"[ERROR] AI识别滑块缺口失败: {e}")
+                if self.raise_errors:
+                    raise
                 return 0
@@ -0,0 +1,568 @@
+"""
+异步签到流程（playwright.async_api）
+
+浏览器等待、AI识别和文件写入互不阻塞：
+- 启动浏览器的同时，在线程中初始化AI服务和识别路由、预检查登录状态文件
+- 识别调用放到线程中执行，九宫格三行并发识别
+- 截图等文件在后台写入，账号流程结束前统一等待
+- 多个账号在同一个事件循环中并发签到（ASYNC_MAX_ACCOUNTS 控制并发数）
+
+用法：python main.py --async
+"""
+
+import io
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import traceback
+from pathlib import Path
+from datetime import datetime
+from PIL import Image
+from playwright.async_api import async_playwright
+from grid_cells import plan_grid_rows, fan_out_labels, fan_out_clicks
+from trajectory import TrajectoryTuner, plan_drag, dispatch_drag_async
+from captcha_verdict import AsyncCaptchaVerdictWatcher, PASS, FAIL, REFRESH, TIMEOUT
+from checkin_common import create_recognizer, BASE_DIR, STATE_FILE, SUCCESS_SCREENSHOT, ALREADY_SIGNED_TEXT, SIGNED_ANCESTOR_LEVELS, domain, target_url
+import metrics
+import ledger
+from flight_recorder import FlightRecorder
+from run_deadline import RunWatchdog, thread_stacks
+import proxy_pool
+import browser_profile
+
+GRID_SELECTOR = ".geetest_table_box"
+SLIDER_SELECTORS = ".geetest_slider, .geetest_slider_button, .geetest_canvas_bg"
+CAPTCHA_SELECTOR = f"{GRID_SELECTOR}, {SLIDER_SELECTORS}"
+
+
+def account_concurrency():
+    """同时签到的账号数（ASYNC_MAX_ACCOUNTS）"""
+    return max(1, int(os.getenv("ASYNC_MAX_ACCOUNTS", "3")))
+
+
+def build_recognizer(logger=None):
+    """初始化AI服务和识别路由（在线程中执行，与浏览器启动并行）"""
+    # 与同步流程一致：AI服务初始化失败（如未配置 API Key）时只使用本地后端，而不是让所有账号失败
+    return create_recognizer(logger)
+
+
+def session_precheck(state_file):
+    """检查登录状态文件是否可用：文件损坏或 Cookie 全部过期时返回 False，直接走账号密码登录"""
+    path = Path(state_file)
+    if not path.exists():
+        return False
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return False
+    now = time.time()
+    cookies = state.get("cookies", [])
+    # expires 为 -1 表示会话 Cookie
+    return any(c.get("expires", -1) == -1 or c.get("expires", 0) > now for c in cookies)
+
+
+class AsyncCheckin:
+    """单个账号的异步签到流程"""
+
+    def __init__(self, browser, recognizer_task, username, password, index=0, save_screenshot=True, logger=None, start_at=None,
+                 proxies=None):
+        self.browser = browser
+        # 按代理池排好序的候选代理，页面访问失败时依次切换
+        self.proxies = proxies or [None]
+        self.recognizer_task = recognizer_task
+        self.username = username
+        self.password = password
+        self.save_screenshot = save_screenshot
+        self.logger = logger
+        self.start_at = start_at
+        # index 为账号在账号文件中的位置：第一个账号沿用原有文件名，其他账号加上序号后缀
+        self.suffix = "" if index == 0 else f"_{index + 1}"
+        self.state_file = self.artifact_path(STATE_FILE.name)
+        self.phases = metrics.PhaseTimer()
+        self.pending_writes = []
+        # 供签到台账记录：最后一次遇到的验证码类型和处理次数
+        self.captcha_type = None
+        self.captcha_attempts = 0
+        # 调试截图和日志只保存在内存中，失败时才落盘
+        self.recorder = FlightRecorder()
+        # 看门狗判定超时的原因（run_with_deadline 设置后取消任务，结果记为 timeout）
+        self.expired = None
+
+    # ---------------- 工具方法 ----------------
+    def say(self, level, message):
+        print(f"[{level}] [{self.username}] {message}")
+        self.recorder.log(f"[{level}] {message}")
+        if self.logger:
+            if level == "ERROR":
+                self.logger.log_error(f"[{self.username}] {message}")
+            elif level in ("INFO", "SUCCESS", "WARNING"):
+                self.logger.log_info(f"[{self.username}] {message}")
+            else:
+                self.logger.log_debug(f"[{self.username}] {message}")
+
+    def artifact_path(self, name):
+        path = BASE_DIR / name
+        return path.with_name(f"{path.stem}{self.suffix}{path.suffix}")
+
+    def write_artifact(self, name, data):
+        """在后台线程中写文件，不阻塞页面操作"""
+        path = self.artifact_path(name)
+        self.pending_writes.append(asyncio.create_task(asyncio.to_thread(path.write_bytes, data)))
+        return path
+
+    async def recognizer(self):
+        return await self.recognizer_task
+
+    async def wait_visible(self, locator, timeout):
+        try:
+            await locator.wait_for(state="visible", timeout=timeout * 1000)
+            return True
+        except Exception:
+            return False
+
+    async def wait_signed_or_captcha(self, page, timeout):
+        """同时等待“已签到”提示和验证码出现，返回 signed / captcha，超时返回 None"""
+        waits = {
+            asyncio.create_task(self.wait_visible(page.get_by_text(ALREADY_SIGNED_TEXT).first, timeout)): "signed",
+            asyncio.create_task(self.wait_visible(page.locator(CAPTCHA_SELECTOR).first, timeout)): "captcha",
+        }
+        pending = set(waits)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result():
+                        return waits[task]
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def detect_captcha_type(self, page):
+        if await page.locator(GRID_SELECTOR).first.is_visible():
+            return "grid"
+        if await page.locator(SLIDER_SELECTORS).first.is_visible():
+            return "slider"
+        return "unknown"
+
+    # ---------------- 主流程 ----------------
+    async def run(self):
+        """执行签到，返回结果：success / already_signed / failed / error（超时取消时由 run_with_deadline 返回 timeout）"""
+        self.phases.mark("launch")
+        has_state = await asyncio.to_thread(session_precheck, self.state_file)
+        outcome, context, page = "error", None, None
+        try:
+            for index, proxy in enumerate(self.proxies):
+                if context is not None:
+                    # 上一个代理访问失败
+                    await self.recorder.stop_trace_async(context, keep=False)
+                    await context.close()
+                    self.say("INFO", f"切换到下一个代理: {proxy_pool.display(proxy)}")
+                if proxy:
+                    self.say("INFO", f"使用代理: {proxy_pool.display(proxy)}")
+                context = await self.browser.new_context(
+                    storage_state=str(self.state_file) if has_state else None,
+                    viewport=browser_profile.viewport(),
+                    **proxy_pool.context_options(proxy),
+                )
+                await self.recorder.start_trace_async(context)
+                page = await context.new_page()
+                if await self.navigate(page, proxy, last=index + 1 == len(self.proxies)):
+                    break
+            else:
+                return outcome
+            outcome = await self._run(context, page)
+            return outcome
+        except Exception:
+            self.recorder.log(traceback.format_exc())
+            raise
+        finally:
+            if self.expired:
+                outcome = "timeout"
+            failed = outcome not in ledger.DONE_OUTCOMES
+            if failed and page is not None:
+                await self.recorder.capture_async(page, "final")
+            if context is not None:
+                await self.recorder.stop_trace_async(context, keep=failed)
+                await context.close()
+            if self.pending_writes:
+                await asyncio.gather(*self.pending_writes, return_exceptions=True)
+            self.phases.stop()
+            if failed:
+                await asyncio.to_thread(self.recorder.dump, outcome, self.username)
+            else:
+                self.recorder.discard()
+
+    async def run_with_deadline(self):
+        """按 RUN_DEADLINE_SECONDS 和 PHASE_BUDGETS 限制本账号的运行时间，超时时取消流程并返回 timeout
+
+        各账号共用一个浏览器，不能像同步流程那样结束浏览器进程，只取消本账号的任务
+        """
+        watchdog = RunWatchdog(on_expire=lambda reason, stacks: self.recorder.log(f"[watchdog] {reason}\n{stacks}"))
+        self.phases.listener = watchdog.on_phase
+        task = asyncio.ensure_future(self.run())
+        if not watchdog.arm():
+            return await task
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=watchdog.poll_interval)
+            if done:
+                return task.result()
+            reason = watchdog.check()
+            if reason:
+                break
+        buf = io.StringIO()
+        task.print_stack(file=buf)
+        self.expired = reason
+        watchdog.expire(f"[{self.username}] {reason}", f"--- 账号 {self.username} 的任务 ---\n{buf.getvalue()}\n{thread_stacks()}")
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return "timeout"
+
+    async def navigate(self, page, proxy, last=True):
+        """经由 proxy 访问签到页，失败时降低该代理的健康分"""
+        self.phases.mark("navigate")
+        self.say("INFO", f"正在访问: {target_url}")
+        pool = proxy_pool.get_proxy_pool()
+        try:
+            await page.goto(target_url, timeout=30000)
+        except Exception as e:
+            self.say("ERROR", f"页面访问失败: {e}")
+            if last:
+                pool.report(proxy, False)
+            else:
+                pool.failover(proxy)
+            return False
+        pool.report(proxy, True)
+        return True
+
+    async def _run(self, context, page):
+        self.phases.mark("login")
+        if "login" in page.url or await page.locator("#username").is_visible():
+            self.say("INFO", "检测到需要登录")
+            try:
+                await page.fill("#username", self.username)
+                await page.fill("#password", self.password)
+                await page.click("#login")
+                await page.wait_for_selector("text=账号信息", timeout=10000)
+                await context.storage_state(path=str(self.state_file))
+                self.say("SUCCESS", "登录成功")
+            except Exception as e:
+                self.say("ERROR", f"登录超时或失败: {e}")
+        else:
+            self.say("INFO", "已登录状态")
+            # 刷新登录状态缓存（Cookie 续期）
+            await context.storage_state(path=str(self.state_file))
+
+        self.phases.mark("sign_check")
+        btn_18 = page.get_by_text("是，我已满18岁")
+        if await self.wait_visible(btn_18, 3):
+            await btn_18.click()
+
+        outcome = "failed"
+        if await self.wait_visible(page.get_by_text(ALREADY_SIGNED_TEXT).first, 3):
+            outcome = "already_signed"
+            self.say("INFO", "今日已签到。")
+            if self.logger:
+                self.logger.log_already_signed()
+        else:
+            sign_btn = page.get_by_text("点击这里签到")
+            if await self.wait_visible(sign_btn, 3):
+                outcome = await self.sign(page, sign_btn)
+            else:
+                self.say("ERROR", "未找到签到按钮")
+                if self.logger:
+                    self.logger.log_sign_failed("未找到签到按钮")
+
+        self.phases.mark("screenshot")
+        if self.save_screenshot:
+            success_loc = page.get_by_text(ALREADY_SIGNED_TEXT).first
+            if await self.wait_visible(success_loc, 1):
+                try:
+                    data = await success_loc.locator(f"xpath=ancestor::*[{SIGNED_ANCESTOR_LEVELS}]").first.screenshot()
+                except Exception:
+                    data = await page.screenshot()
+                self.say("INFO", f"截图已保存: {self.write_artifact(SUCCESS_SCREENSHOT.name, data)}")
+        return outcome
+
+    async def sign(self, page, sign_btn):
+        """点击签到并处理验证码"""
+        if self.start_at is not None:
+            # 预热模式：利用剩余时间预热识别模型，然后等到计划时间再点击
+            self.phases.mark("prewarm")
+            try:
+                await asyncio.to_thread((await self.recognizer()).warm_up)
+            except Exception as e:
+                self.say("WARNING", f"识别模型预热失败: {e}")
+            self.say("INFO", f"准备就绪，等待计划签到时间 {self.start_at:%H:%M:%S}...")
+            self.phases.mark("prewarm_wait")
+            await asyncio.sleep(max(0.0, (self.start_at - datetime.now()).total_seconds()))
+
+        self.phases.mark("captcha_wait")
+        await sign_btn.click()
+        self.say("DEBUG", "已点击签到按钮，等待验证码或签到结果...")
+
+        # 最多等待30秒，验证码或已签到提示任一出现即继续
+        first = await self.wait_signed_or_captcha(page, 30)
+        if first == "signed":
+            self.say("SUCCESS", "签到完成（无需验证码）！")
+            if self.logger:
+                self.logger.log_sign_success()
+            metrics.ATTEMPTS_PER_SUCCESS.observe(0)
+            return "success"
+
+        self.phases.mark("captcha")
+        captcha_attempts = 0
+        for attempt in range(1, 4):
+            captcha_type = await self.detect_captcha_type(page)
+            if captcha_type == "unknown":
+                if await self.wait_signed_or_captcha(page, 3) != "captcha":
+                    break
+                continue
+            metrics.CAPTCHA_SEEN.inc(type=captcha_type)
+            captcha_attempts += 1
+            self.captcha_type, self.captcha_attempts = captcha_type, captcha_attempts
+            self.say("DEBUG", f"第 {attempt} 次：处理{('九宫格' if captcha_type == 'grid' else '滑块')}验证码")
+            try:
+                if captcha_type == "grid":
+                    passed = await self.solve_grid(page)
+                else:
+                    passed = await self.solve_slider(page)
+            except Exception as e:
+                self.say("ERROR", f"验证码处理异常: {e}")
+                if self.logger:
+                    self.logger.log_exception(type(e).__name__, str(e), traceback.format_exc())
+                passed = False
+            if self.logger:
+                self.logger.log_captcha_result("成功" if passed else "失败")
+            if passed and await self.wait_signed_or_captcha(page, 5) == "signed":
+                break
+
+        if await self.wait_visible(page.get_by_text(ALREADY_SIGNED_TEXT).first, 1):
+            self.say("SUCCESS", "签到完成！")
+            if self.logger:
+                self.logger.log_sign_success()
+            metrics.ATTEMPTS_PER_SUCCESS.observe(captcha_attempts)
+            return "success"
+        self.say("ERROR", f"签到失败：超时或验证码处理失败（已处理 {captcha_attempts} 次验证码）")
+        if self.logger:
+            self.logger.log_sign_failed("超时或验证码处理失败")
+        return "failed"
+
+    # ---------------- 九宫格 ----------------
+    async def read_target(self, page, recognizer):
+        """读取九宫格题目（图片提示用AI识别，文本提示直接读取）"""
+        target = ""
+        tip_img = page.locator(".geetest_tip_img").first
+        tip_text = page.locator(".geetest_tip_content").first
+        try:
+            if await self.wait_visible(tip_img, 2):
+                target = await asyncio.to_thread(recognizer.identify_target, await tip_img.screenshot())
+            elif await tip_text.is_visible():
+                target = await tip_text.inner_text()
+        except Exception as e:
+            self.say("ERROR", f"识别题目失败: {e}")
+        return re.sub(r'[^\w]', '', target or "")
+
+    async def recognize_grid(self, page, container, min_confidence):
+        """识别九宫格，返回与同步流程相同结构的结果字典"""
+        recognizer = await self.recognizer()
+        target, grid_bytes = await asyncio.gather(self.read_target(page, recognizer), container.screenshot())
+        self.recorder.add("captcha_grid", grid_bytes)
+        self.say("DEBUG", f"识别题目为：【{target}】")
+
+        if target and recognizer.supports("solve_grid"):
+            try:
+                grid_result = await asyncio.to_thread(recognizer.solve_grid, grid_bytes, target)
+            except Exception as e:
+                self.say("WARNING", f"整格识别失败，回退到逐行识别: {e}")
+                grid_result = None
+            if grid_result and grid_result["confidence"] >= min_confidence:
+                return dict(grid_result, target=target)
+
+        # 各行并发识别（调用经过共享限流器，不会超过API并发上限），重复的格子只识别一次
+        plan = await asyncio.to_thread(plan_grid_rows, Image.open(io.BytesIO(grid_bytes)))
+        duplicates = [[i + 1 for i in group] for group in plan["groups"] if len(group) > 1]
+        if duplicates:
+            self.say("DEBUG", f"重复格子: {duplicates}，识别 {len(plan['rows'])} 行")
+        results = await asyncio.gather(*(asyncio.to_thread(recognizer.label_cells, row, i + 1) for i, row in enumerate(plan["rows"])))
+        descriptions, confidences = fan_out_labels(plan, results)
+
+        click_indices, match_confidence = await asyncio.to_thread(recognizer.match, target, descriptions)
+        click_indices = fan_out_clicks(plan, click_indices)
+        if not click_indices:
+            match_confidence = 0.0
+        target_confidence = 1.0 if target and target != "未知" else 0.0
+        self.say("DEBUG", f"识别结果: {descriptions}, 点击: {click_indices}")
+        return {
+            "target": target,
+            "descriptions": descriptions,
+            "cell_confidences": confidences,
+            "click_indices": click_indices,
+            "confidence": min([target_confidence, match_confidence] + confidences),
+        }
+
+    async def refresh_grid(self, page, container, timeout=3.0):
+        """点击刷新按钮并等待九宫格图片变化"""
+        before = await container.screenshot()
+        refresh_btn = page.locator(".geetest_refresh").first
+        if not await refresh_btn.is_visible():
+            return False
+        await refresh_btn.click()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+            if await container.screenshot() != before:
+                await asyncio.sleep(0.3)  # 等待图片渐显动画结束
+                return True
+        self.say("WARNING", "刷新后九宫格图片未变化")
+        return False
+
+    async def solve_grid(self, page):
+        container = page.locator(GRID_SELECTOR).first
+        min_confidence = float(os.getenv("GRID_MIN_CONFIDENCE", "0.5"))
+        max_refreshes = int(os.getenv("GRID_MAX_REFRESHES", "2"))
+
+        for refresh_round in range(max_refreshes + 1):
+            result = await self.recognize_grid(page, container, min_confidence)
+            if result["confidence"] >= min_confidence or refresh_round == max_refreshes:
+                break
+            self.say("INFO", f"识别置信度过低（{result['confidence']:.2f}），提前刷新验证码")
+            if not await self.refresh_grid(page, container):
+                break
+
+        if not result["click_indices"]:
+            await self.refresh_grid(page, container)
+            return False
+
+        box = await container.bounding_box()
+        cell_w, cell_h = box["width"] / 3, box["height"] / 3
+        for idx in result["click_indices"]:
+            r, c = (idx - 1) // 3, (idx - 1) % 3
+            await page.mouse.click(box["x"] + c * cell_w + cell_w / 2, box["y"] + r * cell_h + cell_h / 2)
+            await asyncio.sleep(random.uniform(0.3, 0.5))
+
+        async with AsyncCaptchaVerdictWatcher(page, "grid") as watcher:
+            for sel in [".geetest_commit", "text=确认", ".geetest_submit"]:
+                btn = page.locator(sel).first
+                if await btn.is_visible():
+                    await btn.click()
+                    break
+            else:
+                self.say("WARNING", "未找到提交按钮")
+                return False
+            verdict = await watcher.wait(timeout=3.0)
+        return verdict not in (FAIL, REFRESH)
+
+    # ---------------- 滑块 ----------------
+    async def solve_slider(self, page):
+        slider_button = None
+        for selector in [".geetest_slider_button", ".geetest_slider_knob", ".geetest_btn"]:
+            loc = page.locator(selector).first
+            if await loc.is_visible():
+                slider_button = loc
+                break
+        bg_canvas = page.locator(".geetest_canvas_bg").first
+        if slider_button is None or not await bg_canvas.is_visible():
+            self.say("ERROR", "未找到滑块按钮或背景图")
+            return False
+
+        recognizer, bg_img_bytes, button_box, bg_box = await asyncio.gather(
+            self.recognizer(), bg_canvas.screenshot(), slider_button.bounding_box(), bg_canvas.bounding_box())
+        self.recorder.add("captcha_bg", bg_img_bytes)
+        gap_position, gap_confidence = await asyncio.to_thread(recognizer.find_gap, bg_img_bytes)
+        if gap_position <= 0:
+            self.say("ERROR", "未识别到缺口")
+            return False
+        self.say("INFO", f"缺口识别成功: 缺口位置={gap_position}px, 置信度={gap_confidence:.2f}")
+
+        # 滑动距离 = 缺口位置 + 滑块相对背景图的偏移 + 随机误差
+        button_x = button_box["x"] + button_box["width"] / 2
+        button_y = button_box["y"] + button_box["height"] / 2
+        drag_distance = gap_position + (button_box["x"] - bg_box["x"]) + random.uniform(-5.0, 5.0)
+
+        tuner = await asyncio.to_thread(TrajectoryTuner)
+        drag_params = tuner.choose()
+        plan = plan_drag(button_x, button_y, drag_distance, drag_params)
+        async with AsyncCaptchaVerdictWatcher(page, "slider") as watcher:
+            actual = await dispatch_drag_async(page, plan)
+            self.say("DEBUG", f"轨迹 {drag_params['arm']}：计划耗时 {plan[-1, 0]:.3f}s，实际 {actual:.3f}s")
+            verdict = await watcher.wait(timeout=3.0)
+        if verdict == TIMEOUT:
+            verdict = FAIL if await page.locator(".geetest_slider").is_visible() else PASS
+        await asyncio.to_thread(tuner.record, drag_params, verdict == PASS)
+        await self.recorder.capture_async(page, "slider_after_drag")
+        return verdict == PASS
+
+
+async def launch_browser(p):
+    """按 BROWSER_PROFILE 启动浏览器；代理按账号在上下文中设置"""
+    return await browser_profile.launch_async(p.chromium)
+
+
+async def run_all(accounts, save_screenshot=True, logger=None, start_at=None, positions=None, results=None):
+    """在同一个事件循环中为所有账号签到，返回 {用户名: 结果}
+
+    start_at 不为空时为预热模式：各账号完成准备后等到 start_at 再点击签到；
+    positions 为各账号在账号文件中的位置（决定状态文件和截图文件名），accounts 是过滤后的子集时必须传入；
+    results 不为空时每个账号结束（已写入台账）后立即写入其中，供看门狗找出未完成的账号
+    """
+    if positions is None:
+        positions = range(len(accounts))
+    if results is None:
+        results = {}
+    semaphore = asyncio.Semaphore(account_concurrency())
+    # AI服务初始化与浏览器启动并行
+    recognizer_task = asyncio.create_task(asyncio.to_thread(build_recognizer, logger))
+
+    async def run_one(index, username, password):
+        async with semaphore:
+            start = time.monotonic()
+            outcome = "error"
+            checkin = None
+            try:
+                checkin = AsyncCheckin(browser, recognizer_task, username, password, index, save_screenshot, logger,
+                                       start_at, proxies)
+                outcome = await checkin.run_with_deadline()
+            except Exception as e:
+                print(f"[ERROR] [{username}] 签到流程异常: {e}")
+                if logger:
+                    logger.log_exception(type(e).__name__, str(e), traceback.format_exc())
+            finally:
+                duration = time.monotonic() - start
+                # 看门狗在事件循环卡住后兜底收尾时，已把未结束的账号记为超时
+                if username not in results:
+                    metrics.record_run(outcome, duration)
+                    # 构造 AsyncCheckin 失败时与其他异常一样记为 error
+                    captcha_type = checkin.captcha_type if checkin is not None else "unknown"
+                    attempts = checkin.captcha_attempts if checkin is not None else 0
+                    ledger.safe_record(username, outcome, captcha_type, attempts, duration)
+                    results[username] = outcome
+            return outcome
+
+    # 代理池探测与浏览器启动并行，所有账号使用同一份排序结果
+    pool = proxy_pool.get_proxy_pool()
+    probe_task = asyncio.create_task(asyncio.to_thread(pool.refresh, domain))
+
+    async with async_playwright() as p:
+        browser = await launch_browser(p)
+        await probe_task
+        proxies = pool.candidates()
+        try:
+            outcomes = await asyncio.gather(*(run_one(i, u, pw) for i, (u, pw) in zip(positions, accounts)))
+        finally:
+            await browser.close()
+
+    await asyncio.to_thread(pool.flush)
+    try:
+        (await recognizer_task).flush()
+    except Exception as e:
+        print(f"[ERROR] AI服务初始化失败: {e}")
+        if logger:
+            logger.log_error(f"AI服务初始化失败: {e}")
+    return {username: outcome for (username, _), outcome in zip(accounts, outcomes)}
@@ -0,0 +1,164 @@
+"""
+浏览器启动配置
+
+BROWSER_PROFILE=lean 时使用低内存配置，适合 512MB~1GB 内存的小型 VPS 和青龙容器：
+关闭 GPU、扩展、后台网络和组件更新，限制渲染进程数量和 V8 堆大小，使用较小的窗口，
+可选使用 chromium-headless-shell（BROWSER_HEADLESS_SHELL=1）。
+PeakRssSampler 在运行期间采样浏览器进程树的内存占用，运行结束时报告峰值。
+"""
+
+import os
+import threading
+import metrics
+from run_deadline import descendants
+
+PROFILES = ("default", "lean")
+
+DEFAULT_VIEWPORT = {"width": 1280, "height": 900}
+# natfrp 用户页在 1024 宽度下仍是完整的桌面布局，签到按钮和极验弹窗都能完整显示
+LEAN_VIEWPORT = {"width": 1024, "height": 768}
+
+LEAN_ARGS = [
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-breakpad",
+    "--disable-dev-shm-usage",  # 容器中 /dev/shm 通常只有 64MB
+    "--no-first-run",
+    "--mute-audio",
+    "--renderer-process-limit=2",
+    "--disable-site-isolation-trials",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,BackForwardCache,site-per-process,IsolateOrigins",
+    "--js-flags=--max-old-space-size=192",
+]
+
+BROWSER_PEAK_RSS = metrics.REGISTRY.gauge(
+    "sakurafrp_browser_peak_rss_bytes", "本次运行中浏览器进程树（含 Playwright 驱动）的峰值 RSS", ["profile"])
+
+
+def current_profile():
+    profile = os.getenv("BROWSER_PROFILE", "default").strip().lower() or "default"
+    if profile not in PROFILES:
+        print(f"[WARNING] 未知的 BROWSER_PROFILE: {profile}，使用 default")
+        return "default"
+    return profile
+
+
+def viewport(profile=None):
+    """页面视口大小，BROWSER_VIEWPORT=宽x高 可覆盖配置中的默认值"""
+    spec = os.getenv("BROWSER_VIEWPORT", "").lower().replace("×", "x")
+    if "x" in spec:
+        try:
+            width, height = (int(v) for v in spec.split("x", 1))
+            return {"width": width, "height": height}
+        except ValueError:
+            print(f"[WARNING] 无效的 BROWSER_VIEWPORT: {spec}")
+    return dict(LEAN_VIEWPORT if (profile or current_profile()) == "lean" else DEFAULT_VIEWPORT)
+
+
+def launch_options(profile=None, **overrides):
+    """chromium.launch 的参数"""
+    profile = profile or current_profile()
+    options = {"headless": True}
+    if profile == "lean":
+        options["args"] = list(LEAN_ARGS)
+        if os.getenv("BROWSER_HEADLESS_SHELL", "").strip().lower() in ("1", "true", "yes", "on"):
+            options["channel"] = "chromium-headless-shell"
+    options.update(overrides)
+    return options
+
+
+def launch(browser_type, profile=None, **overrides):
+    """按配置启动浏览器；headless shell 不可用时回退到默认的 Chromium"""
+    options = launch_options(profile, **overrides)
+    try:
+        return browser_type.launch(**options)
+    except Exception as e:
+        if "channel" not in options:
+            raise
+        print(f"[WARNING] 启动 chromium-headless-shell 失败，改用默认 Chromium: {e}")
+        options.pop("channel")
+        return browser_type.launch(**options)
+
+
+async def launch_async(browser_type, profile=None, **overrides):
+    """launch 的异步版本"""
+    options = launch_options(profile, **overrides)
+    try:
+        return await browser_type.launch(**options)
+    except Exception as e:
+        if "channel" not in options:
+            raise
+        print(f"[WARNING] 启动 chromium-headless-shell 失败，改用默认 Chromium: {e}")
+        options.pop("channel")
+        return await browser_type.launch(**options)
+
+
+def tree_rss():
+    """本进程所有子孙进程（浏览器及 Playwright 驱动）的 RSS 之和（字节）；不支持 /proc 时返回 None
+
+    各进程共享的内存会被重复计算，结果偏大，但与 OOM 判定使用的口径一致
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for pid in descendants(os.getpid()):
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+def format_bytes(value):
+    return f"{value / 1024 / 1024:.0f}MB"
+
+
+class PeakRssSampler:
+    """后台线程定期采样浏览器进程树的 RSS，记录峰值"""
+
+    def __init__(self, interval=0.5, profile=None):
+        self.interval = interval
+        self.profile = profile or current_profile()
+        self.peak = None
+        self.finished = threading.Event()
+        self.thread = None
+
+    def _sample(self):
+        value = tree_rss()
+        if value is not None and (self.peak is None or value > self.peak):
+            self.peak = value
+
+    def _loop(self):
+        while not self.finished.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if os.path.isdir("/proc"):
+            self.thread = threading.Thread(target=self._loop, name="rss-sampler", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        """停止采样，打印并记录峰值"""
+        if self.thread is None:
+            return None
+        self.finished.set()
+        self.thread.join()
+        self.thread = None
+        if self.peak:
+            BROWSER_PEAK_RSS.set(self.peak, profile=self.profile)
+            print(f"[INFO] 浏览器进程树峰值内存（RSS）: {format_bytes(self.peak)}（配置: {self.profile}）")
+        return self.peak
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
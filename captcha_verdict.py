@@ -0,0 +1,191 @@
+import re
+import json
+import time
+import metrics
+
+# 极验校验接口（v3: api.geetest.com/ajax.php，v4: gcaptcha4.geetest.com/verify）
+VERIFY_URL_PATTERN = re.compile(r"geetest\.com/.*(ajax\.php|verify)")
+
+PASS, FAIL, REFRESH, TIMEOUT = "pass", "fail", "refresh", "timeout"
+
+CAPTCHA_VERDICTS = metrics.REGISTRY.counter(
+    "sakurafrp_captcha_verdicts_total", "验证码提交后的判定结果（按类型和来源）", ["type", "verdict", "source"])
+VERDICT_LATENCY = metrics.REGISTRY.histogram(
+    "sakurafrp_captcha_verdict_latency_seconds", "拖动/提交后得到判定结果的耗时", ["type"],
+    buckets=(0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8))
+
+# 在页面中读取极验的成功/失败状态；没有成败标记时，验证码容器可见返回 'open'，不可见返回 null
+_DOM_VERDICT_JS = """() => {
+    const visible = el => !!el && el.getClientRects().length > 0 && getComputedStyle(el).visibility !== 'hidden';
+    const any = sel => Array.from(document.querySelectorAll(sel)).some(visible);
+    if (any('.geetest_success, .geetest_panel_success, .geetest_radar_success')) return 'pass';
+    if (any('.geetest_fail, .geetest_panel_error')) return 'fail';
+    if (any('.geetest_forbidden, .geetest_error, .geetest_panel_error_content')) return 'refresh';
+    if (any('.geetest_slider, .geetest_table_box, .geetest_popup_wrap, .geetest_panel_box')) return 'open';
+    return null;
+}"""
+OPEN = "open"
+# 之前见过的验证码容器连续这么多次检查都不可见，才视为已通过（弹窗重新渲染、刷新时会短暂消失）
+GONE_CHECKS = 2
+
+
+def parse_verify_body(body):
+    """解析校验接口响应（JSON 或 JSONP），返回 pass / fail / refresh，无法判断时返回 None"""
+    start, end = body.find("{"), body.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(body[start:end + 1])
+    except ValueError:
+        return None
+    inner = data.get("data") if isinstance(data.get("data"), dict) else {}
+    result = str(inner.get("result") or data.get("result") or data.get("message") or "").lower()
+    if result == "success" or data.get("success") == 1:
+        return PASS
+    if result == "fail":
+        return FAIL
+    if result in ("forbidden", "error") or data.get("status") == "error":
+        return REFRESH
+    # 初始化请求等返回的是验证码类型（slide / click），不是判定结果
+    return None
+
+
+class CaptchaVerdictWatcher:
+    """验证码判定监听器
+
+    在拖动/提交之前进入，监听极验校验接口的响应和页面上的成功/失败样式，
+    wait() 在得到判定后立即返回 pass / fail / refresh，超时返回 timeout。
+
+        with CaptchaVerdictWatcher(page, "slider") as watcher:
+            drag()
+            verdict = watcher.wait()
+    """
+
+    def __init__(self, page, captcha_type="unknown", poll_interval=0.1):
+        self.page = page
+        self.captcha_type = captcha_type
+        self.poll_interval = poll_interval
+        self.responses = []
+        self.container_seen = False
+        self.gone_checks = 0
+
+    def _interpret_dom(self, state):
+        """把页面状态转换为判定：没有成功标记时，只有之前见过的容器持续消失才算通过，否则继续等待"""
+        if state == OPEN:
+            self.container_seen = True
+            self.gone_checks = 0
+            return None
+        if state is None:
+            if not self.container_seen:
+                return None
+            self.gone_checks += 1
+            return PASS if self.gone_checks >= GONE_CHECKS else None
+        return state
+
+    def _on_response(self, response):
+        # 事件回调中只记录响应，读取响应体放到 wait() 中进行
+        if VERIFY_URL_PATTERN.search(response.url):
+            self.responses.append(response)
+
+    def __enter__(self):
+        self.page.on("response", self._on_response)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.page.remove_listener("response", self._on_response)
+        except Exception:
+            pass
+        return False
+
+    def _network_verdict(self):
+        while self.responses:
+            response = self.responses.pop(0)
+            try:
+                verdict = parse_verify_body(response.text())
+            except Exception:
+                continue
+            if verdict:
+                return verdict
+        return None
+
+    def _dom_verdict(self):
+        try:
+            return self._interpret_dom(self.page.evaluate(_DOM_VERDICT_JS))
+        except Exception:
+            return None
+
+    def wait(self, timeout=5.0):
+        """等待判定结果，返回 pass / fail / refresh / timeout"""
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            # 网络响应最可靠，优先使用；其次是页面样式
+            verdict, source = self._network_verdict(), "network"
+            if verdict is None:
+                verdict, source = self._dom_verdict(), "dom"
+            if verdict is not None or time.monotonic() >= deadline:
+                break
+            # wait_for_timeout 期间 Playwright 会派发网络事件
+            self.page.wait_for_timeout(self.poll_interval * 1000)
+        elapsed = time.monotonic() - start
+        if verdict is None:
+            verdict, source = TIMEOUT, "none"
+        else:
+            VERDICT_LATENCY.observe(elapsed, type=self.captcha_type)
+        CAPTCHA_VERDICTS.inc(type=self.captcha_type, verdict=verdict, source=source)
+        print(f"[DEBUG] 验证码判定: {verdict}（来源: {source}，耗时 {elapsed:.2f}s）")
+        return verdict
+
+
+async def _async_sleep(seconds):
+    # asyncio 只在异步模式下需要，避免同步模式启动时导入
+    import asyncio
+    await asyncio.sleep(seconds)
+
+
+class AsyncCaptchaVerdictWatcher(CaptchaVerdictWatcher):
+    """CaptchaVerdictWatcher 的异步版本（playwright.async_api 页面）"""
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+    async def _network_verdict(self):
+        while self.responses:
+            response = self.responses.pop(0)
+            try:
+                verdict = parse_verify_body(await response.text())
+            except Exception:
+                continue
+            if verdict:
+                return verdict
+        return None
+
+    async def _dom_verdict(self):
+        try:
+            return self._interpret_dom(await self.page.evaluate(_DOM_VERDICT_JS))
+        except Exception:
+            return None
+
+    async def wait(self, timeout=5.0):
+        """等待判定结果，返回 pass / fail / refresh / timeout"""
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            verdict, source = await self._network_verdict(), "network"
+            if verdict is None:
+                verdict, source = await self._dom_verdict(), "dom"
+            if verdict is not None or time.monotonic() >= deadline:
+                break
+            await _async_sleep(self.poll_interval)
+        elapsed = time.monotonic() - start
+        if verdict is None:
+            verdict, source = TIMEOUT, "none"
+        else:
+            VERDICT_LATENCY.observe(elapsed, type=self.captcha_type)
+        CAPTCHA_VERDICTS.inc(type=self.captcha_type, verdict=verdict, source=source)
+        print(f"[DEBUG] 验证码判定: {verdict}（来源: {source}，耗时 {elapsed:.2f}s）")
+        return verdict
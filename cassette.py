@@ -0,0 +1,143 @@
+"""
+AI调用录制/回放磁带
+
+AI_CASSETTE_MODE=record 时，每次成功的AI调用都追加一行到磁带文件（默认 ai_cassette.jsonl，路径可用 AI_CASSETTE_PATH 修改）：
+请求的哈希（模型 + JSON 模式 + 全部消息，包括提示词和 base64 图片）、回复文本和实际耗时，不保存图片本身。
+AI_CASSETTE_MODE=replay 时不访问网络，按请求哈希返回录制的回复，并等待录制时的耗时乘以 AI_CASSETTE_LATENCY_SCALE（默认 1，0 表示不等待）；
+同一请求录制了多次时按录制顺序依次返回，用完后重复最后一次；未录制的请求抛出 CassetteMiss。
+磁带只追加不覆盖，重新录制前请删除旧文件。
+
+用法：python cassette.py [磁带文件]   按方法和模型汇总磁带内容
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+OFF, RECORD, REPLAY = "off", "record", "replay"
+MODES = (OFF, RECORD, REPLAY)
+
+
+class CassetteMiss(Exception):
+    """回放时磁带中没有对应的请求"""
+
+
+def request_key(model, messages, json_mode=False):
+    """请求的哈希：消息按规范化 JSON 序列化，图片以 data URL 的形式包含在内"""
+    payload = json.dumps([model, bool(json_mode), messages], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Cassette:
+    """磁带文件：key -> 按录制顺序排列的 [回复文本, 耗时]"""
+
+    def __init__(self, path=None, mode=None, latency_scale=None):
+        mode = (mode or os.getenv("AI_CASSETTE_MODE") or OFF).strip().lower()
+        if mode not in MODES:
+            print(f"[WARNING] 未知的 AI_CASSETTE_MODE: {mode}，不使用磁带")
+            mode = OFF
+        self.mode = mode
+        self.path = Path(path or os.getenv("AI_CASSETTE_PATH") or BASE_DIR / "ai_cassette.jsonl")
+        self.latency_scale = latency_scale if latency_scale is not None else float(os.getenv("AI_CASSETTE_LATENCY_SCALE", "1"))
+        self.lock = threading.Lock()
+        self.cursors = {}
+        self.entries = self._load() if mode != OFF else defaultdict(list)
+        if self.mode == REPLAY:
+            count = sum(len(v) for v in self.entries.values())
+            print(f"[INFO] AI磁带回放: {self.path}（{count} 条录制，耗时缩放 {self.latency_scale:g}）")
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    @property
+    def recording(self):
+        return self.mode == RECORD
+
+    def _load(self):
+        entries = defaultdict(list)
+        if not self.path.exists():
+            if self.mode == REPLAY:
+                print(f"[WARNING] AI磁带文件不存在: {self.path}")
+            return entries
+        with open(self.path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                    entries[item["key"]].append((item["content"], float(item["latency"])))
+                except (ValueError, KeyError, TypeError):
+                    print(f"[WARNING] 忽略AI磁带中无法解析的第 {lineno} 行")
+        return entries
+
+    def record(self, key, method, model, content, latency):
+        """追加一条录制，key 为 request_key 的结果"""
+        line = json.dumps({"key": key, "method": method, "model": model, "latency": round(latency, 4), "content": content},
+                          ensure_ascii=False)
+        with self.lock:
+            self.entries[key].append((content, latency))
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                print(f"[WARNING] 写入AI磁带失败: {e}")
+
+    def replay(self, key):
+        """返回录制的回复文本，并模拟录制时的耗时"""
+        with self.lock:
+            recorded = self.entries.get(key)
+            if not recorded:
+                raise CassetteMiss(f"AI磁带中没有该请求（key {key}）")
+            index = self.cursors.get(key, 0)
+            self.cursors[key] = index + 1
+            content, latency = recorded[min(index, len(recorded) - 1)]
+        if self.latency_scale > 0:
+            time.sleep(latency * self.latency_scale)
+        return content
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """进程内共享的磁带（未启用时返回 None）"""
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette()
+        return _cassette if _cassette.mode != OFF else None
+
+
+def main():
+    """python cassette.py [磁带文件]：按方法和模型汇总录制条数和平均耗时"""
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else None
+    cassette = Cassette(path=path, mode=RECORD)
+    if not cassette.path.exists():
+        print(f"[INFO] 磁带文件不存在: {cassette.path}")
+        return 1
+    summary = defaultdict(list)
+    with open(cassette.path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+                summary[(item.get("method", "-"), item.get("model", "-"))].append(float(item["latency"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+    print(f"{cassette.path}：{sum(len(v) for v in summary.values())} 条录制，{len(cassette.entries)} 个不同请求")
+    for (method, model), latencies in sorted(summary.items()):
+        print(f"  {method:<28}{model:<16}{len(latencies):>5} 条  平均耗时 {sum(latencies) / len(latencies):.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+"""
+同步流程（main.py）和异步流程（async_checkin.py）共用的配置与识别路由初始化
+
+async_checkin.py 不能直接从 main.py 导入：python main.py --async 运行时入口脚本的模块名是 __main__，
+再导入 main 会把 main.py 作为另一个模块重新执行一遍。
+"""
+
+import os
+import time
+from pathlib import Path
+from recognition import build_router
+import metrics
+
+BASE_DIR = Path(__file__).resolve().parent
+domain = "www.natfrp.com"
+target_url = f"https://{domain}/user/"
+
+# 账号文件和登录状态文件可通过环境变量覆盖（worker_pool.py 为每个账号单独指定）
+ACCOUNT_FILE = Path(os.getenv("CHECKIN_ACCOUNT_FILE") or BASE_DIR / "account.txt")
+STATE_FILE = Path(os.getenv("CHECKIN_STATE_FILE") or BASE_DIR / "state.json")
+SUCCESS_SCREENSHOT = BASE_DIR / "checkin.png"
+
+ALREADY_SIGNED_TEXT = "今天已经签到过啦"
+SIGNED_ANCESTOR_LEVELS = 3
+
+
+def create_recognizer(logger=None):
+    """初始化AI服务并创建识别路由；AI服务不可用时仅使用本地后端"""
+    start = time.monotonic()
+    from ai_service import AIService
+    try:
+        ai_service = AIService()
+    except Exception as e:
+        error_msg = f"AI服务初始化失败: {e}"
+        print(f"[ERROR] {error_msg}")
+        if logger:
+            logger.log_error(error_msg)
+        ai_service = None
+    recognizer = build_router(ai_service, logger=logger)
+    metrics.PHASE_DURATION.observe(time.monotonic() - start, phase="ai_init")
+    return recognizer
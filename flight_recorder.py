@@ -0,0 +1,240 @@
+"""
+飞行记录器
+
+运行过程中把页面截图（JPEG 压缩）、验证码图片、DOM 快照和最近的日志行保存在内存中的环形缓冲区里，
+只有签到失败时才写到 flight_records/<时间>_<结果>/ 目录；成功时不产生任何磁盘写入。
+开启 FLIGHT_RECORDER_TRACE 后还会录制 Playwright trace，失败时保存为同目录下的 trace.zip。
+"""
+
+import os
+import io
+import re
+import sys
+import json
+import time
+import zlib
+import shutil
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+
+def _env_flag(name):
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class _Frame:
+    __slots__ = ("time", "name", "url", "image", "ext", "dom")
+
+    def __init__(self, name, url, image, ext, dom):
+        self.time = time.time()
+        self.name = name
+        self.url = url
+        self.image = image
+        self.ext = ext
+        self.dom = dom  # zlib 压缩后的 HTML
+
+    @property
+    def size(self):
+        return len(self.image or b"") + len(self.dom or b"")
+
+
+class _StdoutTee(io.TextIOBase):
+    """把 print 输出同时写入原 stdout 和记录器"""
+
+    def __init__(self, stream, recorder):
+        self.stream = stream
+        self.recorder = recorder
+        self.buffer_line = ""
+
+    def write(self, text):
+        self.stream.write(text)
+        self.buffer_line += text
+        while "\n" in self.buffer_line:
+            line, self.buffer_line = self.buffer_line.split("\n", 1)
+            self.recorder.log(line)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    @property
+    def encoding(self):
+        return self.stream.encoding
+
+    def isatty(self):
+        return self.stream.isatty()
+
+
+class FlightRecorder:
+    """内存中的环形缓冲区：最多 max_frames 帧、max_bytes 字节、max_lines 行日志，超出时丢弃最旧的"""
+
+    def __init__(self, max_frames=None, max_bytes=None, max_lines=500, directory=None, trace=None, keep=None):
+        self.max_frames = max_frames or int(os.getenv("FLIGHT_RECORDER_FRAMES", "20"))
+        self.max_bytes = max_bytes or int(float(os.getenv("FLIGHT_RECORDER_MAX_MB", "20")) * 1024 * 1024)
+        self.directory = Path(directory or os.getenv("FLIGHT_RECORDER_DIR") or BASE_DIR / "flight_records")
+        self.trace = _env_flag("FLIGHT_RECORDER_TRACE") if trace is None else trace
+        self.keep = keep or int(os.getenv("FLIGHT_RECORDER_KEEP", "10"))
+        self.lock = threading.Lock()
+        self.frames = deque()
+        self.lines = deque(maxlen=max_lines)
+        self.total_bytes = 0
+        self.tracing = False
+        self.trace_path = None
+
+    # ---------------- 记录 ----------------
+    def log(self, line):
+        self.lines.append(f"{datetime.now():%H:%M:%S.%f}"[:-3] + f" {line}")
+
+    def add(self, name, image, ext="png", url=None, dom=None):
+        """保存一帧已有的图片数据（如验证码 canvas 截图），dom 为页面 HTML 文本"""
+        frame = _Frame(name, url, image, ext, zlib.compress(dom.encode("utf-8"), 6) if dom else None)
+        with self.lock:
+            self.frames.append(frame)
+            self.total_bytes += frame.size
+            while self.frames and (len(self.frames) > self.max_frames or self.total_bytes > self.max_bytes):
+                self.total_bytes -= self.frames.popleft().size
+
+    def capture(self, page, name, dom=True):
+        """截取整页（JPEG）并保存 DOM 快照；失败时只记录一行日志"""
+        try:
+            image = page.screenshot(type="jpeg", quality=60)
+            html = page.content() if dom else None
+            self.add(name, image, "jpg", page.url, html)
+        except Exception as e:
+            self.log(f"[recorder] 截图 {name} 失败: {e}")
+
+    async def capture_async(self, page, name, dom=True):
+        """capture 的异步版本（playwright.async_api 页面）"""
+        try:
+            image = await page.screenshot(type="jpeg", quality=60)
+            html = await page.content() if dom else None
+            self.add(name, image, "jpg", page.url, html)
+        except Exception as e:
+            self.log(f"[recorder] 截图 {name} 失败: {e}")
+
+    @contextmanager
+    def tee_stdout(self):
+        """期间的 print 输出同时记入日志缓冲区"""
+        original = sys.stdout
+        tee = _StdoutTee(original, self)
+        sys.stdout = tee
+        try:
+            yield self
+        finally:
+            sys.stdout = original
+            if tee.buffer_line:
+                self.log(tee.buffer_line)
+
+    # ---------------- Playwright trace ----------------
+    def start_trace(self, context):
+        if not self.trace:
+            return
+        try:
+            context.tracing.start(screenshots=True, snapshots=True)
+            self.tracing = True
+        except Exception as e:
+            print(f"[WARNING] 启动 Playwright trace 失败: {e}")
+
+    def stop_trace(self, context, keep):
+        """结束 trace；keep 为 True 时先保存到临时文件，dump() 时移入记录目录"""
+        if not self.tracing:
+            return
+        self.tracing = False
+        path = None
+        if keep:
+            path = self.directory / f".trace_{os.getpid()}_{id(self)}.zip"
+            self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            context.tracing.stop(path=str(path) if path else None)
+        except Exception as e:
+            print(f"[WARNING] 保存 Playwright trace 失败: {e}")
+            return
+        self.trace_path = path
+
+    async def start_trace_async(self, context):
+        if not self.trace:
+            return
+        try:
+            await context.tracing.start(screenshots=True, snapshots=True)
+            self.tracing = True
+        except Exception as e:
+            print(f"[WARNING] 启动 Playwright trace 失败: {e}")
+
+    async def stop_trace_async(self, context, keep):
+        if not self.tracing:
+            return
+        self.tracing = False
+        path = None
+        if keep:
+            path = self.directory / f".trace_{os.getpid()}_{id(self)}.zip"
+            self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            await context.tracing.stop(path=str(path) if path else None)
+        except Exception as e:
+            print(f"[WARNING] 保存 Playwright trace 失败: {e}")
+            return
+        self.trace_path = path
+
+    # ---------------- 落盘 ----------------
+    def dump(self, reason, label=None):
+        """把缓冲区写到带时间戳的目录，返回目录路径（写入失败返回 None）"""
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        name = "_".join(re.sub(r"[^\w.-]", "_", part) for part in (stamp, label, reason) if part)
+        target = self.directory / name
+        suffix = 1
+        while target.exists():
+            suffix += 1
+            target = self.directory / f"{name}-{suffix}"
+        with self.lock:
+            frames = list(self.frames)
+        try:
+            target.mkdir(parents=True, exist_ok=True)
+            index = []
+            for i, frame in enumerate(frames, 1):
+                stem = f"{i:02d}_{frame.name}"
+                entry = {"time": datetime.fromtimestamp(frame.time).strftime("%H:%M:%S.%f")[:-3],
+                         "name": frame.name, "url": frame.url}
+                if frame.image:
+                    (target / f"{stem}.{frame.ext}").write_bytes(frame.image)
+                    entry["image"] = f"{stem}.{frame.ext}"
+                if frame.dom:
+                    (target / f"{stem}.html").write_bytes(zlib.decompress(frame.dom))
+                    entry["dom"] = f"{stem}.html"
+                index.append(entry)
+            (target / "log.txt").write_text("\n".join(self.lines) + "\n", encoding="utf-8")
+            if self.trace_path is not None and self.trace_path.exists():
+                os.replace(self.trace_path, target / "trace.zip")
+                self.trace_path = None
+            (target / "index.json").write_text(
+                json.dumps({"reason": reason, "label": label, "frames": index}, ensure_ascii=False, indent=2),
+                encoding="utf-8")
+        except Exception as e:
+            print(f"[WARNING] 保存飞行记录失败: {e}")
+            return None
+        self._prune()
+        print(f"[INFO] 飞行记录已保存: {target}")
+        return target
+
+    def discard(self):
+        """成功时丢弃缓冲区（和已保存的临时 trace）"""
+        if self.trace_path is not None and self.trace_path.exists():
+            self.trace_path.unlink()
+        self.trace_path = None
+        with self.lock:
+            self.frames.clear()
+            self.total_bytes = 0
+        self.lines.clear()
+
+    def _prune(self):
+        """只保留最近 keep 次失败的记录"""
+        try:
+            records = sorted(p for p in self.directory.iterdir() if p.is_dir())
+            for old in records[:-self.keep]:
+                shutil.rmtree(old, ignore_errors=True)
+        except OSError:
+            pass
@@ -0,0 +1,113 @@
+import io
+import threading
+import metrics
+
+# ---------------- 使用专业库识别缺口 ----------------
+_slider_lock = threading.Lock()
+_slider = None
+
+def get_slider():
+    """获取共享的 captcha-recognizer 滑块模型（首次调用时加载）"""
+    global _slider
+    with _slider_lock:
+        if _slider is None:
+            from captcha_recognizer.slider import Slider
+            _slider = Slider()
+        return _slider
+
+def warm_up_gap_model():
+    """预热缺口识别模型：加载模型并对空白图做一次推理，返回是否成功"""
+    try:
+        import numpy as np
+        get_slider().identify(source=np.zeros((160, 320, 3), dtype=np.uint8), show=False)
+        return True
+    except ImportError as e:
+        print(f"[WARNING] captcha-recognizer 库未安装，跳过预热: {e}")
+    except Exception as e:
+        print(f"[WARNING] 缺口识别模型预热失败: {e}")
+    return False
+
+def identify_gap_with_library(bg_img_bytes, logger=None):
+    """使用 captcha-recognizer 库识别滑块验证码缺口位置"""
+    gap_position, _ = identify_gap_with_library_scored(bg_img_bytes, logger)
+    return gap_position
+
+def identify_gap_with_library_scored(bg_img_bytes, logger=None):
+    """使用 captcha-recognizer 库识别缺口位置，返回 (缺口位置, 置信度)，未识别到时位置为 0"""
+    try:
+        import numpy as np
+        from PIL import Image
+        
+        # 将字节数据转换为 numpy 数组（库支持这种格式）
+        bg_img = Image.open(io.BytesIO(bg_img_bytes))
+        bg_arr = np.array(bg_img)
+        
+        # 使用 captcha-recognizer 库识别缺口
+        # box 格式: [x1, y1, x2, y2] 对应缺口的左上角和右下角坐标
+        # confidence: 置信度
+        box, confidence = get_slider().identify(source=bg_arr, show=False)
+        if confidence is not None:
+            metrics.GAP_CONFIDENCE.observe(float(confidence))
+        
+        if box and len(box) >= 4:
+            x1, y1, x2, y2 = box
+            gap_position = int(x1)  # 使用左上角的x坐标作为缺口位置
+            print(f"[DEBUG] captcha-recognizer 识别结果: 缺口位置={gap_position}px, 置信度={confidence:.2f}")
+            print(f"[DEBUG] 缺口完整坐标: 左上角({x1}, {y1}), 右下角({x2}, {y2})")
+            
+            if logger:
+                logger.log_debug(f"captcha-recognizer: 缺口={gap_position}px, 置信度={confidence:.2f}")
+            
+            return gap_position, float(confidence)
+        else:
+            print("[WARNING] captcha-recognizer 未识别到缺口")
+            return 0, 0.0
+        
+    except ImportError as e:
+        print(f"[WARNING] captcha-recognizer 库未安装: {e}")
+        print("[INFO] 请运行: pip install captcha-recognizer")
+        return 0, 0.0
+    except Exception as e:
+        print(f"[ERROR] captcha-recognizer 识别异常: {e}")
+        import traceback
+        traceback.print_exc()
+        return 0, 0.0
+
+def identify_gap_local(bg_img_bytes):
+    """备用方案：使用简单的边缘检测识别缺口位置"""
+    try:
+        import numpy as np
+        from PIL import Image
+        
+        # 读取背景图
+        bg_img = Image.open(io.BytesIO(bg_img_bytes))
+        bg_arr = np.array(bg_img.convert('RGB'))
+        
+        # 转换为灰度图
+        if len(bg_arr.shape) == 3:
+            gray = np.mean(bg_arr, axis=2).astype(np.uint8)
+        else:
+            gray = bg_arr
+        
+        height, width = gray.shape
+        
+        # 计算每列的边缘强度
+        edge_strength = np.zeros(width)
+        for x in range(1, width - 1):
+            gradient = np.abs(gray[:, x+1].astype(int) - gray[:, x-1].astype(int))
+            edge_strength[x] = np.sum(gradient)
+        
+        # 找到边缘强度最大的位置
+        margin = width // 10
+        search_range = edge_strength[margin:width-margin]
+        if len(search_range) > 0:
+            max_idx = np.argmax(search_range) + margin
+            print(f"[DEBUG] 简单边缘检测找到位置: {max_idx}px")
+            return max_idx
+        
+        # 默认返回中间偏右位置
+        return int(width * 0.6)
+        
+    except Exception as e:
+        print(f"[ERROR] 简单边缘检测异常: {e}")
+        return 0
@@ -0,0 +1,131 @@
+import io
+from PIL import Image
+
+# dHash 汉明距离不超过该值的格子视为同一张图片（重复格子的图片通常逐像素相同，留少量余量给缩放误差）
+DUPLICATE_DISTANCE = 4
+# 同时要求 16×16 灰度缩略图的平均像素差不超过该值
+DUPLICATE_MEAN_DIFF = 8
+
+
+def load_grid_image(grid_bytes):
+    """读取九宫格截图并转换为RGB"""
+    return Image.open(io.BytesIO(grid_bytes)).convert("RGB")
+
+
+def crop_cells(grid_img, rows=3, cols=3, inset=0.04):
+    """将九宫格图片按行优先顺序裁剪为单个格子（序号1-9对应返回列表的下标0-8）
+
+    inset 为每个格子四周裁掉的比例，去掉格子之间的边框和间隙
+    """
+    w, h = grid_img.size
+    cell_w, cell_h = w / cols, h / rows
+    pad_x, pad_y = cell_w * inset, cell_h * inset
+    cells = []
+    for r in range(rows):
+        for c in range(cols):
+            box = (
+                int(c * cell_w + pad_x),
+                int(r * cell_h + pad_y),
+                int((c + 1) * cell_w - pad_x),
+                int((r + 1) * cell_h - pad_y),
+            )
+            cells.append(grid_img.crop(box))
+    return cells
+
+
+def dhash(img, size=8):
+    """差值哈希：缩放为 (size+1)×size 灰度图，比较相邻像素，返回 size*size 位整数"""
+    small = img.convert("L").resize((size + 1, size), Image.BILINEAR)
+    pixels = small.tobytes()  # "L" 模式每像素一个字节
+    value = 0
+    for y in range(size):
+        for x in range(size):
+            left = pixels[y * (size + 1) + x]
+            right = pixels[y * (size + 1) + x + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _thumbnail(img, size=16):
+    return img.convert("L").resize((size, size), Image.BILINEAR).tobytes()
+
+
+def group_duplicates(cells, max_distance=DUPLICATE_DISTANCE, max_mean_diff=DUPLICATE_MEAN_DIFF):
+    """把图片相同的格子分组，返回按首次出现顺序排列的分组（每组为格子下标列表，第一个为代表）
+
+    dHash 只反映明暗变化的方向，颜色不同但纹理平坦的格子哈希也可能相同，因此还要求缩略图的平均灰度差足够小
+    """
+    groups, signatures = [], []
+    for index, cell in enumerate(cells):
+        h, thumb = dhash(cell), _thumbnail(cell)
+        for group, (rep_hash, rep_thumb) in zip(groups, signatures):
+            if bin(h ^ rep_hash).count("1") > max_distance:
+                continue
+            if sum(abs(a - b) for a, b in zip(thumb, rep_thumb)) / len(thumb) <= max_mean_diff:
+                group.append(index)
+                break
+        else:
+            groups.append([index])
+            signatures.append((h, thumb))
+    return groups
+
+
+def _png(img):
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def plan_grid_rows(grid_img, rows=3, cols=3):
+    """规划逐行识别：重复的格子只识别一次
+
+    返回 dict：
+    - rows: 需要识别的行图片（PNG），不同的格子不超过 (rows-1)*cols 个时把它们重新拼成更少的行，
+      否则使用原始的行截图（识别结果与不去重时完全一致）
+    - slots: 每个格子的识别结果取自哪一行的第几格 (行下标, 列下标)，重复格子指向同一个位置
+    - groups: group_duplicates 的分组结果
+    """
+    w, h = grid_img.size
+    row_h = h / rows
+    groups = group_duplicates(crop_cells(grid_img, rows, cols))
+    slots = [None] * (rows * cols)
+    if len(groups) > (rows - 1) * cols:
+        # 拼接无法减少行数：识别原始行，重复格子统一取代表格子的结果
+        row_images = [_png(grid_img.crop((0, i * row_h, w, (i + 1) * row_h))) for i in range(rows)]
+        for group in groups:
+            for index in group:
+                slots[index] = divmod(group[0], cols)
+        return {"rows": row_images, "slots": slots, "groups": groups}
+
+    # 按原有格子位置把各组的代表格子依次摆到新的行里，空位留白
+    cell_w = w / cols
+    packed = []
+    for n, group in enumerate(groups):
+        row, col = divmod(n, cols)
+        if col == 0:
+            packed.append(Image.new(grid_img.mode, (w, int(row_h)), "white"))
+        src_row, src_col = divmod(group[0], cols)
+        box = (int(src_col * cell_w), int(src_row * row_h), int((src_col + 1) * cell_w), int((src_row + 1) * row_h))
+        packed[row].paste(grid_img.crop(box), (int(col * cell_w), 0))
+        for index in group:
+            slots[index] = (row, col)
+    return {"rows": [_png(img) for img in packed], "slots": slots, "groups": groups}
+
+
+def fan_out_labels(plan, row_results):
+    """把各行的识别结果 [(名称列表, 置信度列表), ...] 展开为 9 个格子的 (名称列表, 置信度列表)"""
+    labels, confidences = [], []
+    for row, col in plan["slots"]:
+        row_labels, row_confs = row_results[row]
+        labels.append(row_labels[col] if col < len(row_labels) else "未知")
+        confidences.append(row_confs[col] if col < len(row_confs) else 0.0)
+    return labels, confidences
+
+
+def fan_out_clicks(plan, click_indices):
+    """匹配结果扩展到重复格子：组内任一格子被选中时整组都点击（序号从1开始，保持升序）"""
+    selected = set(click_indices)
+    for group in plan["groups"]:
+        if selected.intersection(i + 1 for i in group):
+            selected.update(i + 1 for i in group)
+    return sorted(selected)
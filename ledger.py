@@ -0,0 +1,166 @@
+"""
+签到台账（SQLite）
+
+每次签到结束后记录账号、日期、结果、验证码类型、处理次数和耗时。
+各入口在启动浏览器之前先查询台账：账号当天已签到成功则记录一条 already_signed 后直接退出；台账也用于 --history 查询历史记录。
+"""
+
+import os
+import sys
+import time
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 视为“当天已完成”的结果
+DONE_OUTCOMES = ("success", "already_signed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    day TEXT NOT NULL,
+    finished_at TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    captcha_type TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    duration_seconds REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_account_day ON runs (account, day);
+CREATE INDEX IF NOT EXISTS runs_day ON runs (day);
+"""
+
+
+class Ledger:
+    """签到台账，默认路径为 checkin_ledger.db（可用 CHECKIN_LEDGER_FILE 指定）"""
+
+    def __init__(self, path=None):
+        self.path = Path(path or os.getenv("CHECKIN_LEDGER_FILE") or BASE_DIR / "checkin_ledger.db")
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def is_done(self, account, day=None):
+        """账号在 day（默认今天）是否已签到成功；按 (account, day) 索引查询，台账不存在时不创建文件"""
+        if not self.path.exists():
+            return False
+        day = (day or date.today()).isoformat()
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        try:
+            row = conn.execute(
+                "SELECT 1 FROM runs WHERE account = ? AND day = ? AND outcome IN (?, ?) LIMIT 1",
+                (account, day) + DONE_OUTCOMES).fetchone()
+        except sqlite3.OperationalError:
+            # 文件存在但尚未建表
+            return False
+        finally:
+            conn.close()
+        return row is not None
+
+    def record(self, account, outcome, captcha_type=None, attempts=0, duration=0.0, day=None):
+        """记录一次签到结果"""
+        day = (day or date.today()).isoformat()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO runs (account, day, finished_at, outcome, captcha_type, attempts, duration_seconds)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (account, day, time.strftime("%Y-%m-%d %H:%M:%S"), outcome, captcha_type, int(attempts), float(duration)))
+        finally:
+            conn.close()
+
+    def last_id(self):
+        """当前最大的记录 id（台账不存在或为空时为 0），配合 last_outcome 的 after_id 使用"""
+        if not self.path.exists():
+            return 0
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT MAX(id) FROM runs").fetchone()
+        finally:
+            conn.close()
+        return row[0] or 0
+
+    def last_outcome(self, account, day=None, after_id=0):
+        """账号在 day（默认今天）最近一次记录的结果，只考虑 id 大于 after_id 的记录，没有记录时返回 None"""
+        if not self.path.exists():
+            return None
+        day = (day or date.today()).isoformat()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT outcome FROM runs WHERE account = ? AND day = ? AND id > ? ORDER BY id DESC LIMIT 1",
+                (account, day, after_id)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def history(self, days=30, account=None):
+        """最近 days 天的记录（新的在前），每行为 dict"""
+        if not self.path.exists():
+            return []
+        since = (date.today() - timedelta(days=max(0, days - 1))).isoformat()
+        query = "SELECT account, day, finished_at, outcome, captcha_type, attempts, duration_seconds FROM runs WHERE day >= ?"
+        params = [since]
+        if account:
+            query += " AND account = ?"
+            params.append(account)
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(query + " ORDER BY id DESC", params)]
+        finally:
+            conn.close()
+
+
+def safe_is_done(account, ledger=None):
+    """查询失败时视为未完成（台账损坏不应阻止签到）"""
+    try:
+        return (ledger or Ledger()).is_done(account)
+    except Exception as e:
+        print(f"[WARNING] 读取签到台账失败: {e}")
+        return False
+
+
+def safe_record(account, outcome, captcha_type=None, attempts=0, duration=0.0, ledger=None):
+    """写入失败时只打印警告，不影响签到结果"""
+    try:
+        (ledger or Ledger()).record(account, outcome, captcha_type, attempts, duration)
+    except Exception as e:
+        print(f"[WARNING] 写入签到台账失败: {e}")
+
+
+def print_history(rows):
+    """打印历史记录和按账号汇总的成功率"""
+    if not rows:
+        print("[INFO] 签到台账中没有记录")
+        return
+    print(f"{'完成时间':<20}{'账号':<20}{'结果':<16}{'验证码':<8}{'次数':>4}{'耗时':>9}")
+    for row in rows:
+        print(f"{row['finished_at']:<24}{row['account']:<22}{row['outcome']:<18}{row['captcha_type'] or '-':<11}"
+              f"{row['attempts']:>6}{row['duration_seconds']:>10.1f}s")
+
+    print("\n按账号汇总（按天统计）:")
+    summary = {}
+    for row in rows:
+        done_days, all_days = summary.setdefault(row["account"], (set(), set()))
+        all_days.add(row["day"])
+        if row["outcome"] in DONE_OUTCOMES:
+            done_days.add(row["day"])
+    for account, (done_days, all_days) in sorted(summary.items()):
+        print(f"  {account}: {len(done_days)}/{len(all_days)} 天完成签到")
+
+
+def main():
+    """python ledger.py [天数]：打印最近的签到记录"""
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    print_history(Ledger().history(days))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+离线九宫格格子分类器（CPU，ONNX 图文模型）
+
+九个格子裁剪后一次批量推理得到图片向量，与预先缓存的物体名称文本向量表做余弦相似度，
+无需网络即可完成打标签和匹配。推荐使用 Chinese-CLIP 导出的 ONNX 模型（标签为中文）。
+
+准备文件（默认放在 models/ 目录）:
+  models/clip_image.onnx    图片编码器（输入 NCHW float32，输出图片向量）
+  models/label_table.npz    文本向量表（labels: 物体名称数组, embeddings: 向量矩阵）
+
+生成文本向量表（需要文本编码器 ONNX 和 tokenizers 库的 tokenizer.json）:
+  python local_classifier.py build-table --text-model models/clip_text.onnx \\
+      --tokenizer models/tokenizer.json --out models/label_table.npz
+"""
+
+import os
+import sys
+import argparse
+import threading
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 极验九宫格中常见的物体名称
+GEETEST_LABELS = [
+    "飞机", "自行车", "摩托车", "汽车", "公交车", "卡车", "火车", "船", "帆船", "热气球",
+    "猫", "狗", "马", "牛", "羊", "猪", "鸡", "鸭子", "鸟", "企鹅", "熊", "熊猫", "老虎", "狮子",
+    "大象", "长颈鹿", "斑马", "猴子", "兔子", "松鼠", "鱼", "海豚", "乌龟", "青蛙", "蛇", "蝴蝶", "蜜蜂",
+    "苹果", "香蕉", "橙子", "西瓜", "葡萄", "草莓", "菠萝", "梨", "柠檬", "桃子", "樱桃",
+    "胡萝卜", "西兰花", "玉米", "蘑菇", "南瓜", "辣椒", "面包", "蛋糕", "冰淇淋", "披萨", "汉堡",
+    "杯子", "茶壶", "椅子", "沙发", "床", "桌子", "时钟", "台灯", "雨伞", "书", "剪刀", "钥匙",
+    "眼镜", "帽子", "鞋子", "背包", "手表", "电话", "电脑", "电视", "相机", "吉他", "钢琴", "足球",
+    "篮球", "网球", "花", "树", "仙人掌", "房子", "桥", "灯塔", "帐篷", "风车", "红绿灯", "消防栓",
+]
+
+# CLIP 图片预处理参数
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+LOGIT_SCALE = 100.0
+
+_model_lock = threading.Lock()
+_model_cache = {}
+
+
+def _softmax(x, axis=-1):
+    import numpy as np
+    x = x - np.max(x, axis=axis, keepdims=True)
+    e = np.exp(x)
+    return e / np.sum(e, axis=axis, keepdims=True)
+
+
+def _normalize(x):
+    import numpy as np
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+class LocalGridClassifier:
+    """ONNX 图文模型格子分类器"""
+
+    def __init__(self, image_model_path=None, label_table_path=None, threads=None):
+        import numpy as np
+        import onnxruntime as ort
+
+        self.image_model_path = Path(image_model_path or os.getenv("LOCAL_CLASSIFIER_MODEL") or BASE_DIR / "models" / "clip_image.onnx")
+        self.label_table_path = Path(label_table_path or os.getenv("LOCAL_CLASSIFIER_LABELS") or BASE_DIR / "models" / "label_table.npz")
+        if not self.image_model_path.exists():
+            raise FileNotFoundError(f"图片编码器模型不存在: {self.image_model_path}")
+        if not self.label_table_path.exists():
+            raise FileNotFoundError(f"文本向量表不存在: {self.label_table_path}")
+
+        options = ort.SessionOptions()
+        threads = threads or int(os.getenv("LOCAL_CLASSIFIER_THREADS", "0"))
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(self.image_model_path), options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape
+        self.input_size = shape[-1] if isinstance(shape[-1], int) else 224
+
+        table = np.load(self.label_table_path, allow_pickle=False)
+        self.labels = [str(label) for label in table["labels"]]
+        self.embeddings = _normalize(table["embeddings"].astype(np.float32))
+        self.label_index = {label: i for i, label in enumerate(self.labels)}
+
+    def preprocess(self, images):
+        """缩放、中心裁剪并标准化，返回 NCHW 批量数组"""
+        import numpy as np
+        from PIL import Image
+
+        size = self.input_size
+        mean = np.array(CLIP_MEAN, dtype=np.float32)
+        std = np.array(CLIP_STD, dtype=np.float32)
+        batch = np.empty((len(images), 3, size, size), dtype=np.float32)
+        for i, img in enumerate(images):
+            img = img.convert("RGB")
+            w, h = img.size
+            scale = size / min(w, h)
+            img = img.resize((max(size, round(w * scale)), max(size, round(h * scale))), Image.BICUBIC)
+            w, h = img.size
+            left, top = (w - size) // 2, (h - size) // 2
+            img = img.crop((left, top, left + size, top + size))
+            arr = (np.asarray(img, dtype=np.float32) / 255.0 - mean) / std
+            batch[i] = arr.transpose(2, 0, 1)
+        return batch
+
+    def embed_images(self, images):
+        """一次批量推理得到归一化的图片向量"""
+        outputs = self.session.run(None, {self.input_name: self.preprocess(images)})
+        return _normalize(outputs[0].astype("float32"))
+
+    def resolve_target(self, target):
+        """将题目文本映射到向量表中的物体名称（取题目中包含的最长名称）"""
+        if target in self.label_index:
+            return target
+        matched = [label for label in self.labels if label and label in target]
+        if not matched:
+            return None
+        return max(matched, key=len)
+
+    def classify(self, images):
+        """返回每张图片的 (最可能名称, 概率)"""
+        probs = _softmax(LOGIT_SCALE * self.embed_images(images) @ self.embeddings.T)
+        top = probs.argmax(axis=1)
+        return [(self.labels[j], float(probs[i, j])) for i, j in enumerate(top)]
+
+    def solve(self, cell_images, target):
+        """对九个格子一次推理，返回 (名称列表, 每格置信度, 应点击的序号列表) ；题目无法映射时返回 None"""
+        target_label = self.resolve_target(target)
+        if target_label is None:
+            return None
+        probs = _softmax(LOGIT_SCALE * self.embed_images(cell_images) @ self.embeddings.T)
+        target_probs = probs[:, self.label_index[target_label]]
+        top = probs.argmax(axis=1)
+
+        labels = [self.labels[j] for j in top]
+        click_indices = [i + 1 for i, p in enumerate(target_probs) if p >= 0.5 or labels[i] == target_label]
+        # 每格置信度：对“是否为目标”这一判断的把握程度
+        confidences = [float(max(p, 1.0 - p)) for p in target_probs]
+        return labels, confidences, click_indices
+
+
+def get_classifier():
+    """获取进程内共享的分类器（首次调用时加载模型，可用于预热）"""
+    with _model_lock:
+        if "classifier" not in _model_cache:
+            _model_cache["classifier"] = LocalGridClassifier()
+        return _model_cache["classifier"]
+
+
+def build_label_table(text_model_path, tokenizer_path, out_path, labels=None, template="一张{}的照片", context_length=None):
+    """使用文本编码器 ONNX 生成物体名称向量表"""
+    import numpy as np
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+
+    labels = labels or GEETEST_LABELS
+    session = ort.InferenceSession(str(text_model_path), providers=["CPUExecutionProvider"])
+    inputs = session.get_inputs()
+    if context_length is None:
+        length = inputs[0].shape[-1]
+        context_length = length if isinstance(length, int) else 52
+    tokenizer = Tokenizer.from_file(str(tokenizer_path))
+
+    ids = np.zeros((len(labels), context_length), dtype=np.int64)
+    for i, label in enumerate(labels):
+        tokens = tokenizer.encode(template.format(label)).ids[:context_length]
+        ids[i, :len(tokens)] = tokens
+    feed = {inputs[0].name: ids}
+    for extra in inputs[1:]:
+        if "mask" in extra.name:
+            feed[extra.name] = (ids != 0).astype(np.int64)
+    embeddings = _normalize(session.run(None, feed)[0].astype(np.float32))
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(out_path, labels=np.array(labels), embeddings=embeddings)
+    print(f"[INFO] 文本向量表已保存: {out_path}（{len(labels)} 个名称，维度 {embeddings.shape[1]}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线九宫格格子分类器工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build-table', help='生成物体名称文本向量表')
+    build.add_argument('--text-model', required=True, help='文本编码器 ONNX 模型')
+    build.add_argument('--tokenizer', required=True, help='tokenizer.json 路径')
+    build.add_argument('--out', default=str(BASE_DIR / "models" / "label_table.npz"), help='输出路径')
+    build.add_argument('--template', default='一张{}的照片', help='提示词模板')
+    build.add_argument('--labels', help='自定义名称列表文件（每行一个）')
+    args = parser.parse_args()
+
+    if args.command == 'build-table':
+        labels = None
+        if args.labels:
+            labels = [l.strip() for l in Path(args.labels).read_text(encoding="utf-8").splitlines() if l.strip()]
+        build_label_table(args.text_model, args.tokenizer, args.out, labels, args.template)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,30 +6,29 @@ import random
 import re
 import argparse
 import traceback
+import threading
 from pathlib import Path
 from datetime import datetime, timedelta
-from PIL import Image
-from playwright.sync_api import sync_playwright
-from ai_service import AIService
+from dotenv import load_dotenv
 from logger import CheckinLogger
-import pytweening  # 用于缓动函数（无GUI依赖）
+from recognition import LazyRouter
+from gap_detection import identify_gap_with_library, identify_gap_local
+import metrics
+import ledger
+from selector_cache import get_selector_cache
+from flight_recorder import FlightRecorder
+from captcha_verdict import CaptchaVerdictWatcher, PASS, FAIL, REFRESH, TIMEOUT
+from scheduler import sleep_until
+from run_deadline import RunWatchdog, EXIT_DEADLINE
+import browser_profile
+from proxy_pool import get_proxy_pool, display as display_proxy, context_options as proxy_context_options
+from checkin_common import (BASE_DIR, domain, target_url, ACCOUNT_FILE, STATE_FILE, SUCCESS_SCREENSHOT,
+                            ALREADY_SIGNED_TEXT, SIGNED_ANCESTOR_LEVELS, create_recognizer)
 
 # 强制 Windows 终端使用 UTF-8 编码
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
-# ========= 配置 =========
-BASE_DIR = Path(__file__).resolve().parent
-domain = "www.natfrp.com"
-target_url = f"https://{domain}/user/"
-
-ACCOUNT_FILE = BASE_DIR / "account.txt"  
-STATE_FILE = BASE_DIR / "state.json"     
-SUCCESS_SCREENSHOT = BASE_DIR / "checkin.png"
-
-ALREADY_SIGNED_TEXT = "今天已经签到过啦"       
-SIGNED_ANCESTOR_LEVELS = 3                
-
 # ---------------- 工具函数 ----------------
 def load_file_content(path: Path):
     if not path.exists():
@@ -43,6 +42,14 @@ def load_username_password(path: Path):
         raise ValueError("account.txt 格式错误：需两行分别存放用户名和密码")
     return lines[0], lines[1]
 
+def load_accounts(path: Path):
+    """读取全部账号：每两行为一组（用户名、密码），兼容只有一个账号的旧格式"""
+    content = load_file_content(path)
+    lines = [l.strip() for l in content.splitlines() if l.strip()]
+    if len(lines) < 2:
+        raise ValueError("account.txt 格式错误：需两行分别存放用户名和密码")
+    return [(lines[i], lines[i + 1]) for i in range(0, len(lines) - 1, 2)]
+
 def clean_old_logs(base_dir: Path, days: int = 30):
     """清理指定天数前的日志文件"""
     logs_dir = base_dir / "logs"
@@ -77,86 +84,6 @@ def clean_old_logs(base_dir: Path, days: int = 30):
     if deleted_count > 0:
         print(f"[INFO] 清理完成，共删除 {deleted_count} 个30天前的日志文件")
 
-# ---------------- 使用专业库识别缺口 ----------------
-def identify_gap_with_library(bg_img_bytes, logger=None):
-    """使用 captcha-recognizer 库识别滑块验证码缺口位置"""
-    try:
-        from captcha_recognizer.slider import Slider
-        import numpy as np
-        from PIL import Image
-        
-        # 将字节数据转换为 numpy 数组（库支持这种格式）
-        bg_img = Image.open(io.BytesIO(bg_img_bytes))
-        bg_arr = np.array(bg_img)
-        
-        # 使用 captcha-recognizer 库识别缺口
-        # box 格式: [x1, y1, x2, y2] 对应缺口的左上角和右下角坐标
-        # confidence: 置信度
-        box, confidence = Slider().identify(source=bg_arr, show=False)
-        
-        if box and len(box) >= 4:
-            x1, y1, x2, y2 = box
-            gap_position = int(x1)  # 使用左上角的x坐标作为缺口位置
-            print(f"[DEBUG] captcha-recognizer 识别结果: 缺口位置={gap_position}px, 置信度={confidence:.2f}")
-            print(f"[DEBUG] 缺口完整坐标: 左上角({x1}, {y1}), 右下角({x2}, {y2})")
-            
-            if logger:
-                logger.log_debug(f"captcha-recognizer: 缺口={gap_position}px, 置信度={confidence:.2f}")
-            
-            return gap_position
-        else:
-            print("[WARNING] captcha-recognizer 未识别到缺口")
-            return 0
-        
-    except ImportError as e:
-        print(f"[WARNING] captcha-recognizer 库未安装: {e}")
-        print("[INFO] 请运行: pip install captcha-recognizer")
-        return 0
-    except Exception as e:
-        print(f"[ERROR] captcha-recognizer 识别异常: {e}")
-        import traceback
-        traceback.print_exc()
-        return 0
-
-def identify_gap_local(bg_img_bytes):
-    """备用方案：使用简单的边缘检测识别缺口位置"""
-    try:
-        import numpy as np
-        from PIL import Image
-        
-        # 读取背景图
-        bg_img = Image.open(io.BytesIO(bg_img_bytes))
-        bg_arr = np.array(bg_img.convert('RGB'))
-        
-        # 转换为灰度图
-        if len(bg_arr.shape) == 3:
-            gray = np.mean(bg_arr, axis=2).astype(np.uint8)
-        else:
-            gray = bg_arr
-        
-        height, width = gray.shape
-        
-        # 计算每列的边缘强度
-        edge_strength = np.zeros(width)
-        for x in range(1, width - 1):
-            gradient = np.abs(gray[:, x+1].astype(int) - gray[:, x-1].astype(int))
-            edge_strength[x] = np.sum(gradient)
-        
-        # 找到边缘强度最大的位置
-        margin = width // 10
-        search_range = edge_strength[margin:width-margin]
-        if len(search_range) > 0:
-            max_idx = np.argmax(search_range) + margin
-            print(f"[DEBUG] 简单边缘检测找到位置: {max_idx}px")
-            return max_idx
-        
-        # 默认返回中间偏右位置
-        return int(width * 0.6)
-        
-    except Exception as e:
-        print(f"[ERROR] 简单边缘检测异常: {e}")
-        return 0
-
 # ---------------- 验证码类型检测 ----------------
 def detect_captcha_type(page, logger=None):
     """检测验证码类型：九宫格或滑块"""
@@ -270,28 +197,11 @@ def detect_captcha_type(page, logger=None):
         return "unknown"
 
 # ---------------- 验证码核心处理 ----------------
-def solve_geetest_multistep(page, ai_service, logger=None):
-    """使用AI服务处理九宫格验证码"""
-    print("[INFO] 开始处理九宫格验证码...")
-    if logger:
-        logger.log_captcha_step("开始", "初始化验证码处理")
-    
-    img_container = page.locator(".geetest_table_box").first
-    container_visible = False
-    try:
-        container_visible = img_container.is_visible(timeout=3000)
-    except:
-        pass
-    
-    if not container_visible:
-        print("[DEBUG] 验证码容器不可见")
-        if logger:
-            logger.log_element_status("验证码容器", False)
-        return False
-    
-    if logger:
-        logger.log_element_status("验证码容器", True)
-        
+def recognize_grid_captcha(page, img_container, recognizer, logger=None, min_confidence=0.5):
+    """识别九宫格题目和格子，返回识别结果字典；识别过程出错时返回 None
+
+    结果中的 confidence 为整体置信度：题目、9个格子和语义裁决中最低的一项
+    """
     # 步骤 1: 识别题目
     target_object = ""
     tip_img = page.locator(".geetest_tip_img").first
@@ -306,7 +216,7 @@ def solve_geetest_multistep(page, ai_service, logger=None):
         if logger:
             logger.log_captcha_step("步骤1", "检测到图片提示，使用AI识别")
         try:
-            target_object = ai_service.call_vision(tip_img.screenshot(), "图中是什么物体？只回答物体名称，不要带标点。")
+            target_object = recognizer.identify_target(tip_img.screenshot())
             print(f"[DEBUG] AI识别结果（原始）: {target_object}")
         except Exception as e:
             print(f"[ERROR] AI识别图片提示失败: {e}")
@@ -341,74 +251,180 @@ def solve_geetest_multistep(page, ai_service, logger=None):
     if logger:
         logger.log_captcha_step("步骤1完成", f"识别题目: {target_object}")
 
+    # 优先尝试整格一次性识别（如本地CPU分类器，无需网络），置信度不足时回退到逐行识别
+    if target_object and recognizer.supports("solve_grid"):
+        try:
+            grid_result = recognizer.solve_grid(img_container.screenshot(), target_object)
+        except Exception as e:
+            print(f"[WARNING] 整格识别失败，回退到逐行识别: {e}")
+            grid_result = None
+        if grid_result:
+            print(f"[DEBUG] 整格识别结果: {grid_result['descriptions']}, 点击: {grid_result['click_indices']}, 置信度: {grid_result['confidence']:.2f}")
+            if logger:
+                logger.log_captcha_step("步骤2-5", f"整格识别: {grid_result['click_indices']}, 置信度: {grid_result['confidence']:.2f}")
+            if grid_result["confidence"] >= min_confidence:
+                return dict(grid_result, target=target_object)
+            print("[DEBUG] 整格识别置信度不足，回退到逐行识别")
+
     # 步骤 2-4: 逐行抠图识别
     print("[DEBUG] 开始逐行识别九宫格...")
     if logger:
         logger.log_captcha_step("步骤2-4", "开始逐行识别九宫格")
     
     all_descriptions = []
+    all_confidences = []
     try:
         # 获取整个九宫格的截图并在内存中处理
         grid_bytes = img_container.screenshot()
+        from PIL import Image
+        from grid_cells import plan_grid_rows, fan_out_labels, fan_out_clicks
         grid_img = Image.open(io.BytesIO(grid_bytes))
         w, h = grid_img.size
-        row_h = h / 3
-        print(f"[DEBUG] 九宫格尺寸: {w}x{h}, 每行高度: {row_h}")
+        print(f"[DEBUG] 九宫格尺寸: {w}x{h}")
         if logger:
             logger.log_captcha_step("步骤2-4", f"九宫格尺寸: {w}x{h}")
         
-        for i in range(3):
+        # 重复的格子只识别一次：不同的格子较少时重新拼成更少的行
+        plan = plan_grid_rows(grid_img)
+        duplicates = [[i + 1 for i in group] for group in plan["groups"] if len(group) > 1]
+        if duplicates:
+            print(f"[DEBUG] 重复格子: {duplicates}，共 {len(plan['groups'])} 种图片，识别 {len(plan['rows'])} 行")
+            if logger:
+                logger.log_captcha_step("步骤2-4", f"重复格子: {duplicates}，识别 {len(plan['rows'])} 行")
+        
+        row_results = []
+        for i, row_bytes in enumerate(plan["rows"]):
             print(f"[DEBUG] 正在识别第 {i+1} 行...")
             if logger:
                 logger.log_captcha_step(f"步骤{i+2}", f"识别第 {i+1} 行")
             
-            # 裁剪出每一行
-            top = i * row_h
-            bottom = (i + 1) * row_h
-            row_crop = grid_img.crop((0, top, w, bottom))
-            
-            buf = io.BytesIO()
-            row_crop.save(buf, format='PNG')
-            row_res = ai_service.identify_captcha_row(buf.getvalue(), i+1)
-            print(f"[DEBUG] 第 {i+1} 行识别结果: {row_res}")
+            row_res, row_conf = recognizer.label_cells(row_bytes, i+1)
+            print(f"[DEBUG] 第 {i+1} 行识别结果: {row_res}, 置信度: {row_conf}")
             if logger:
-                logger.log_captcha_step(f"步骤{i+2}完成", f"第 {i+1} 行: {row_res}")
-            all_descriptions.extend(row_res)
+                logger.log_captcha_step(f"步骤{i+2}完成", f"第 {i+1} 行: {row_res}, 置信度: {row_conf}")
+            row_results.append((row_res, row_conf))
+        all_descriptions, all_confidences = fan_out_labels(plan, row_results)
     except Exception as e:
         print(f"[ERROR] 九宫格识别过程出错: {e}")
         if logger:
             logger.log_exception(type(e).__name__, str(e), traceback.format_exc())
-        return False
+        return None
 
-    # 步骤 5: 语义匹配并模拟点击
+    # 步骤 5: 语义匹配
     print(f"[DEBUG] 开始语义匹配，目标: {target_object}, 描述列表: {all_descriptions}")
     if logger:
         logger.log_captcha_step("步骤5", f"语义匹配 - 目标: {target_object}")
     
     try:
-        click_indices = ai_service.semantic_match(target_object, all_descriptions)
+        click_indices, match_confidence = recognizer.match(target_object, all_descriptions)
+        # 重复格子与代表格子的点击决定保持一致
+        click_indices = fan_out_clicks(plan, click_indices)
         print(f">>> [Final] 最终决定点击序号: {click_indices}")
         if logger:
-            logger.log_captcha_step("步骤5完成", f"匹配结果: {click_indices}")
+            logger.log_captcha_step("步骤5完成", f"匹配结果: {click_indices}, 置信度: {match_confidence}")
     except Exception as e:
         print(f"[ERROR] 语义匹配失败: {e}")
+        if logger:
+            logger.log_exception(type(e).__name__, str(e), traceback.format_exc())
+        return None
+    
+    # 没有匹配项时无法提交，视为完全没有把握
+    if not click_indices:
+        match_confidence = 0.0
+    target_confidence = 1.0 if target_object and target_object != "未知" else 0.0
+    confidence = min([target_confidence, match_confidence] + all_confidences)
+    
+    return {
+        "target": target_object,
+        "descriptions": all_descriptions,
+        "cell_confidences": all_confidences,
+        "click_indices": click_indices,
+        "confidence": confidence,
+    }
+
+def refresh_grid_captcha(page, img_container, logger=None, timeout=3.0):
+    """点击刷新按钮并等待九宫格图片变化，返回是否刷新成功"""
+    try:
+        before = img_container.screenshot()
+    except Exception:
+        before = None
+    try:
+        refresh_btn = page.locator(".geetest_refresh").first
+        if not refresh_btn.is_visible(timeout=1000):
+            print("[WARNING] 未找到刷新按钮")
+            return False
+        refresh_btn.click()
+    except Exception as e:
+        print(f"[ERROR] 刷新验证码失败: {e}")
         if logger:
             logger.log_exception(type(e).__name__, str(e), traceback.format_exc())
         return False
     
+    # 等待新图片加载（截图发生变化即可），而不是固定等待
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        try:
+            if before is None or img_container.screenshot() != before:
+                time.sleep(0.3)  # 等待图片渐显动画结束
+                return True
+        except Exception:
+            continue
+    print("[WARNING] 刷新后九宫格图片未变化")
+    return False
+
+def solve_geetest_multistep(page, recognizer, logger=None, recorder=None):
+    """使用识别路由处理九宫格验证码"""
+    print("[INFO] 开始处理九宫格验证码...")
+    if logger:
+        logger.log_captcha_step("开始", "初始化验证码处理")
+    
+    img_container = page.locator(".geetest_table_box").first
+    container_visible = False
+    try:
+        container_visible = img_container.is_visible(timeout=3000)
+    except:
+        pass
+    
+    if not container_visible:
+        print("[DEBUG] 验证码容器不可见")
+        if logger:
+            logger.log_element_status("验证码容器", False)
+        return False
+    
+    if logger:
+        logger.log_element_status("验证码容器", True)
+    
+    # 识别置信度过低时直接刷新重来：提交错误答案比刷新一次代价更高
+    min_confidence = float(os.getenv("GRID_MIN_CONFIDENCE", "0.5"))
+    max_refreshes = int(os.getenv("GRID_MAX_REFRESHES", "2"))
+    
+    for refresh_round in range(max_refreshes + 1):
+        result = recognize_grid_captcha(page, img_container, recognizer, logger, min_confidence)
+        if result is None:
+            return False
+        
+        confidence = result["confidence"]
+        print(f"[DEBUG] 九宫格识别整体置信度: {confidence:.2f} (阈值: {min_confidence:.2f})")
+        if logger:
+            logger.log_captcha_step("置信度", f"{confidence:.2f} (阈值 {min_confidence:.2f}, 第 {refresh_round + 1} 轮)")
+        
+        if confidence >= min_confidence or refresh_round == max_refreshes:
+            break
+        
+        print(f"[INFO] 识别置信度过低，提前刷新验证码（{refresh_round + 1}/{max_refreshes}）...")
+        if logger:
+            logger.log_captcha_step("提前刷新", f"置信度 {confidence:.2f} 低于阈值")
+        if not refresh_grid_captcha(page, img_container, logger):
+            break
+    
+    click_indices = result["click_indices"]
+    
     if not click_indices:
         print("[INFO] 未找到匹配项，刷新验证码...")
         if logger:
             logger.log_captcha_step("步骤5", "未找到匹配项，刷新验证码")
-        try:
-            refresh_btn = page.locator(".geetest_refresh").first
-            if refresh_btn.is_visible():
-                refresh_btn.click()
-                time.sleep(2)
-        except Exception as e:
-            print(f"[ERROR] 刷新验证码失败: {e}")
-            if logger:
-                logger.log_exception(type(e).__name__, str(e), traceback.format_exc())
+        refresh_grid_captcha(page, img_container, logger)
         return False
 
     try:
@@ -455,18 +471,22 @@ def solve_geetest_multistep(page, ai_service, logger=None):
         logger.log_captcha_step("提交", "查找提交按钮")
     
     submit_success = False
-    for sel in [".geetest_commit", "text=确认", ".geetest_submit"]:
-        try:
-            btn = page.locator(sel).first
-            if btn.is_visible(timeout=2000):
-                print(f"[DEBUG] 找到提交按钮: {sel}")
-                if logger:
-                    logger.log_captcha_step("提交", f"找到按钮: {sel}")
+    verdict = TIMEOUT
+    if recorder is not None:
+        recorder.capture(page, "grid_before_submit")
+    with CaptchaVerdictWatcher(page, "grid") as watcher:
+        btn, sel = get_selector_cache().find(page, "grid_submit", [".geetest_commit", "text=确认", ".geetest_submit"], timeout=2000)
+        if btn is not None:
+            print(f"[DEBUG] 找到提交按钮: {sel}")
+            if logger:
+                logger.log_captcha_step("提交", f"找到按钮: {sel}")
+            try:
                 btn.click()
                 submit_success = True
-                break
-        except:
-            continue
+            except Exception as e:
+                print(f"[WARNING] 点击提交按钮失败: {e}")
+        if submit_success:
+            verdict = watcher.wait(timeout=3.0)
     
     if not submit_success:
         print("[WARNING] 未找到提交按钮")
@@ -474,20 +494,27 @@ def solve_geetest_multistep(page, ai_service, logger=None):
             logger.log_captcha_step("提交", "未找到提交按钮")
         return False
     
+    if verdict in (FAIL, REFRESH):
+        print(f"[DEBUG] 九宫格验证未通过（{verdict}）")
+        if logger:
+            logger.log_captcha_step("完成", f"验证未通过: {verdict}")
+        return False
+    
     print("[DEBUG] 验证码处理完成")
     if logger:
-        logger.log_captcha_step("完成", "验证码处理完成")
+        logger.log_captcha_step("完成", f"验证码处理完成（判定: {verdict}）")
     return True
 
-def solve_geetest_slider(page, ai_service, logger=None):
-    """使用AI服务处理滑块验证码"""
+def solve_geetest_slider(page, recognizer, logger=None, recorder=None):
+    """使用识别路由处理滑块验证码（recorder 为飞行记录器，调试截图只保存在内存中）"""
+    if recorder is None:
+        recorder = FlightRecorder()
     print("[INFO] 开始处理滑块验证码...")
     if logger:
         logger.log_captcha_step("开始", "初始化滑块验证码处理")
     
-    # 查找滑块相关元素
-    slider_button = None
-    slider_track = None
+    # 查找滑块相关元素（按上次命中的顺序探测选择器）
+    selector_cache = get_selector_cache()
     
     # 尝试多种选择器找到滑块按钮
     slider_selectors = [
@@ -497,17 +524,11 @@ def solve_geetest_slider(page, ai_service, logger=None):
         "[class*='slider'][class*='button']"
     ]
     
-    for selector in slider_selectors:
-        try:
-            btn = page.locator(selector).first
-            if btn.is_visible(timeout=1000):
-                slider_button = btn
-                print(f"[DEBUG] 找到滑块按钮: {selector}")
-                if logger:
-                    logger.log_element_status("滑块按钮", True, f"选择器: {selector}")
-                break
-        except:
-            continue
+    slider_button, selector = selector_cache.find(page, "slider_button", slider_selectors)
+    if slider_button:
+        print(f"[DEBUG] 找到滑块按钮: {selector}")
+        if logger:
+            logger.log_element_status("滑块按钮", True, f"选择器: {selector}")
     
     if not slider_button:
         print("[ERROR] 未找到滑块按钮")
@@ -535,17 +556,11 @@ def solve_geetest_slider(page, ai_service, logger=None):
         "[class*='slider'][class*='track']"
     ]
     
-    for selector in track_selectors:
-        try:
-            track = page.locator(selector).first
-            if track.is_visible(timeout=1000):
-                slider_track = track
-                print(f"[DEBUG] 找到滑块轨道: {selector}")
-                if logger:
-                    logger.log_element_status("滑块轨道", True, f"选择器: {selector}")
-                break
-        except:
-            continue
+    slider_track, selector = selector_cache.find(page, "slider_track", track_selectors)
+    if slider_track:
+        print(f"[DEBUG] 找到滑块轨道: {selector}")
+        if logger:
+            logger.log_element_status("滑块轨道", True, f"选择器: {selector}")
     
     # 获取验证码图片
     print("[DEBUG] 正在获取验证码图片...")
@@ -583,10 +598,15 @@ def solve_geetest_slider(page, ai_service, logger=None):
     bg_canvas = None
     slice_canvas = None
     
-    for selector in canvas_selectors:
+    for selector in selector_cache.ordered(page, "canvas", canvas_selectors):
+        # 背景和缺口canvas都已找到时不再探测剩余选择器
+        if bg_canvas and slice_canvas:
+            break
         try:
             canvas = page.locator(selector).first
-            if canvas.is_visible(timeout=1000):
+            visible = canvas.is_visible(timeout=1000)
+            selector_cache.record(page, "canvas", selector, visible)
+            if visible:
                 try:
                     box = canvas.bounding_box()
                     size_info = f"位置: ({box['x']:.0f}, {box['y']:.0f}), 尺寸: {box['width']:.0f}x{box['height']:.0f}" if box else "无法获取位置"
@@ -611,13 +631,9 @@ def solve_geetest_slider(page, ai_service, logger=None):
         try:
             bg_img_bytes = bg_canvas.screenshot()
             print("[DEBUG] 成功获取背景图")
-            # 保存背景图到文件
-            bg_img_path = BASE_DIR / "captcha_bg.png"
-            with open(bg_img_path, "wb") as f:
-                f.write(bg_img_bytes)
-            print(f"[DEBUG] 背景图已保存到: {bg_img_path}")
+            recorder.add("captcha_bg", bg_img_bytes)
             if logger:
-                logger.log_captcha_step("步骤1", f"成功获取背景图，已保存到: {bg_img_path}")
+                logger.log_captcha_step("步骤1", "成功获取背景图")
         except Exception as e:
             print(f"[ERROR] 获取背景图失败: {e}")
             if logger:
@@ -627,13 +643,9 @@ def solve_geetest_slider(page, ai_service, logger=None):
         try:
             slice_img_bytes = slice_canvas.screenshot()
             print("[DEBUG] 成功获取缺口图")
-            # 保存缺口图到文件
-            slice_img_path = BASE_DIR / "captcha_slice.png"
-            with open(slice_img_path, "wb") as f:
-                f.write(slice_img_bytes)
-            print(f"[DEBUG] 缺口图已保存到: {slice_img_path}")
+            recorder.add("captcha_slice", slice_img_bytes)
             if logger:
-                logger.log_captcha_step("步骤1", f"成功获取缺口图，已保存到: {slice_img_path}")
+                logger.log_captcha_step("步骤1", "成功获取缺口图")
         except Exception as e:
             print(f"[ERROR] 获取缺口图失败: {e}")
             if logger:
@@ -646,20 +658,14 @@ def solve_geetest_slider(page, ai_service, logger=None):
             ".geetest_slice_bg img",
             "[class*='bg'] img"
         ]
-        for selector in img_selectors:
+        img, selector = selector_cache.find(page, "bg_img", img_selectors)
+        if img:
             try:
-                img = page.locator(selector).first
-                if img.is_visible(timeout=1000):
-                    bg_img_bytes = img.screenshot()
-                    print(f"[DEBUG] 从img标签获取背景图: {selector}")
-                    # 保存从img标签获取的背景图
-                    bg_img_path = BASE_DIR / "captcha_bg.png"
-                    with open(bg_img_path, "wb") as f:
-                        f.write(bg_img_bytes)
-                    print(f"[DEBUG] 背景图已保存到: {bg_img_path}")
-                    break
+                bg_img_bytes = img.screenshot()
+                print(f"[DEBUG] 从img标签获取背景图: {selector}")
+                recorder.add("captcha_bg", bg_img_bytes)
             except:
-                continue
+                pass
     
     if not bg_img_bytes:
         print("[WARNING] 无法获取验证码图片，尝试截图整个验证码区域")
@@ -671,13 +677,9 @@ def solve_geetest_slider(page, ai_service, logger=None):
             if captcha_container.is_visible(timeout=2000):
                 bg_img_bytes = captcha_container.screenshot()
                 print("[DEBUG] 成功截图验证码容器")
-                # 保存整个验证码区域截图
-                container_img_path = BASE_DIR / "captcha_container.png"
-                with open(container_img_path, "wb") as f:
-                    f.write(bg_img_bytes)
-                print(f"[DEBUG] 验证码容器截图已保存到: {container_img_path}")
+                recorder.add("captcha_container", bg_img_bytes)
                 if logger:
-                    logger.log_captcha_step("步骤1", f"验证码容器截图已保存到: {container_img_path}")
+                    logger.log_captcha_step("步骤1", "成功截图验证码容器")
         except Exception as e:
             print(f"[ERROR] 截图验证码容器失败: {e}")
             if logger:
@@ -685,7 +687,6 @@ def solve_geetest_slider(page, ai_service, logger=None):
             return False
     
     # 查找缺口块元素（拼图块）
-    slice_element = None
     slice_element_selectors = [
         ".geetest_slice",
         ".geetest_slice_box",
@@ -693,58 +694,45 @@ def solve_geetest_slider(page, ai_service, logger=None):
         "[class*='puzzle']"
     ]
     
-    for selector in slice_element_selectors:
+    slice_element, selector = selector_cache.find(page, "slice_element", slice_element_selectors)
+    if slice_element:
         try:
-            elem = page.locator(selector).first
-            if elem.is_visible(timeout=1000):
-                slice_element = elem
-                try:
-                    box = elem.bounding_box()
-                    if box:
-                        print(f"[DEBUG] 找到缺口块元素: {selector}, 位置: ({box['x']:.0f}, {box['y']:.0f}), 尺寸: {box['width']:.0f}x{box['height']:.0f}")
-                        if logger:
-                            logger.log_element_status("缺口块元素", True, f"位置: ({box['x']:.0f}, {box['y']:.0f})")
-                except:
-                    print(f"[DEBUG] 找到缺口块元素: {selector}")
-                break
+            box = slice_element.bounding_box()
+            if box:
+                print(f"[DEBUG] 找到缺口块元素: {selector}, 位置: ({box['x']:.0f}, {box['y']:.0f}), 尺寸: {box['width']:.0f}x{box['height']:.0f}")
+                if logger:
+                    logger.log_element_status("缺口块元素", True, f"位置: ({box['x']:.0f}, {box['y']:.0f})")
         except:
-            continue
+            print(f"[DEBUG] 找到缺口块元素: {selector}")
     
-    # 额外保存整个页面的验证码区域截图（用于调试）
+    # 额外记录整个验证码区域截图（失败时写入飞行记录，用于调试）
     try:
-        full_captcha_path = BASE_DIR / "captcha_full.png"
-        # 尝试找到验证码弹窗并截图
         captcha_popup = page.locator(".geetest_popup, .geetest_wrap").first
         if captcha_popup.is_visible(timeout=1000):
-            full_captcha_bytes = captcha_popup.screenshot()
-            with open(full_captcha_path, "wb") as f:
-                f.write(full_captcha_bytes)
-            print(f"[DEBUG] 完整验证码区域已保存到: {full_captcha_path}")
-            if logger:
-                logger.log_debug(f"完整验证码区域已保存到: {full_captcha_path}")
+            recorder.add("captcha_full", captcha_popup.screenshot())
     except Exception as e:
-        print(f"[DEBUG] 保存完整验证码区域失败（非关键错误）: {e}")
+        print(f"[DEBUG] 截取完整验证码区域失败（非关键错误）: {e}")
     
-    # 使用 captcha-recognizer 专业库识别缺口位置
-    print("[DEBUG] 使用 captcha-recognizer 库识别缺口位置...")
+    # 通过识别路由定位缺口（默认优先使用本地 captcha-recognizer 专业库）
+    print("[DEBUG] 识别缺口位置...")
     if logger:
-        logger.log_captcha_step("步骤2", "使用 captcha-recognizer 库识别缺口")
+        logger.log_captcha_step("步骤2", "识别缺口位置")
     
     gap_position = 0
     
     try:
-        gap_position = identify_gap_with_library(bg_img_bytes, logger)
+        gap_position, gap_confidence = recognizer.find_gap(bg_img_bytes)
         if gap_position > 0:
-            print(f"[INFO] captcha-recognizer 识别成功: 缺口位置={gap_position}px")
+            print(f"[INFO] 缺口识别成功: 缺口位置={gap_position}px, 置信度={gap_confidence:.2f}")
             if logger:
-                logger.log_captcha_step("步骤2完成", f"识别成功: {gap_position}px")
+                logger.log_captcha_step("步骤2完成", f"识别成功: {gap_position}px, 置信度={gap_confidence:.2f}")
         else:
-            print("[ERROR] captcha-recognizer 未识别到缺口")
+            print("[ERROR] 未识别到缺口")
             if logger:
                 logger.log_captcha_step("步骤2", "未识别到缺口")
             return False
     except Exception as e:
-        error_msg = f"captcha-recognizer 识别失败: {e}"
+        error_msg = f"缺口识别失败: {e}"
         print(f"[ERROR] {error_msg}")
         if logger:
             logger.log_exception(type(e).__name__, str(e), traceback.format_exc())
@@ -841,15 +829,8 @@ def solve_geetest_slider(page, ai_service, logger=None):
     if logger:
         logger.log_captcha_step("步骤3完成", f"起点={button_x:.1f}, 终点={target_x:.1f}, 距离={drag_distance:.1f}")
     
-    # ===== 拖动前截图 =====
-    try:
-        before_drag_path = BASE_DIR / "slider_before_drag.png"
-        page.screenshot(path=str(before_drag_path))
-        print(f"[INFO] 拖动前截图已保存: {before_drag_path}")
-        if logger:
-            logger.log_debug(f"拖动前截图已保存: {before_drag_path}")
-    except Exception as e:
-        print(f"[WARNING] 保存拖动前截图失败: {e}")
+    # ===== 拖动前截图（仅保存在内存中） =====
+    recorder.capture(page, "slider_before_drag", dom=False)
     
     # 执行拖动
     try:
@@ -857,98 +838,47 @@ def solve_geetest_slider(page, ai_service, logger=None):
         if logger:
             logger.log_captcha_step("步骤4", f"拖动: {button_x:.1f} -> {target_x:.1f}")
         
-        # 先移动到按钮位置
-        page.mouse.move(button_x, button_y)
-        time.sleep(random.uniform(0.1, 0.2))
-        
-        # 按下鼠标
-        page.mouse.down()
-        time.sleep(random.uniform(0.1, 0.2))
-        
-        # 模拟人类拖动轨迹（使用 pytweening 缓动函数）
-        steps = random.randint(20, 30)  # 增加步数，轨迹更平滑
-        
-        # 随机选择一个缓动函数，模拟不同人的操作习惯
-        easing_functions = [
-            pytweening.easeInOutQuad,    # 先加速后减速（最常见）
-            pytweening.easeOutQuad,      # 快速启动，逐渐减速
-            pytweening.easeInOutCubic,   # 更平滑的加速减速
-        ]
-        easing_func = random.choice(easing_functions)
-        
-        print(f"[DEBUG] 使用缓动函数: {easing_func.__name__}, 步数: {steps}")
-        
-        for i in range(steps):
-            # 使用 pytweening 的缓动函数计算进度
-            progress = easing_func(i / steps)
-            
-            # 添加随机抖动（水平和垂直）
-            jitter_x = random.uniform(-1.5, 1.5)
-            jitter_y = random.uniform(-2, 2)
-            
-            current_x = button_x + drag_distance * progress + jitter_x
-            current_y = button_y + jitter_y
-            
-            page.mouse.move(current_x, current_y)
-            
-            # 根据速度调整时间间隔（移动快的时候间隔短，移动慢的时候间隔长）
-            if i < steps * 0.3:  # 前30%，快速移动
-                time.sleep(random.uniform(0.005, 0.015))
-            elif i > steps * 0.7:  # 后30%，减速
-                time.sleep(random.uniform(0.02, 0.04))
-            else:  # 中间阶段
-                time.sleep(random.uniform(0.01, 0.025))
-        
-        # 添加轻微的超调和回调（模拟人类操作的不精确性）
-        if random.random() > 0.5:  # 50% 概率出现超调
-            overshoot = random.uniform(2, 5)  # 超调2-5像素
-            page.mouse.move(target_x + overshoot, button_y + random.uniform(-1, 1))
-            time.sleep(random.uniform(0.05, 0.1))
-            print(f"[DEBUG] 模拟超调: +{overshoot:.1f}px")
-        
-        # 最后精确移动到目标位置
-        page.mouse.move(target_x, button_y)
-        time.sleep(random.uniform(0.15, 0.25))
-        
-        # 释放鼠标
-        page.mouse.up()
-        time.sleep(random.uniform(0.5, 1.0))
+        # 根据历史通过率选择轨迹参数，预先计算完整轨迹（缓动、抖动、超调），再按计划时刻一次性下发
+        from trajectory import TrajectoryTuner, plan_drag, dispatch_drag
+        tuner = TrajectoryTuner()
+        drag_params = tuner.choose()
+        plan = plan_drag(button_x, button_y, target_x - button_x, drag_params)
+        planned = plan[-1, 0]
+        print(f"[DEBUG] 轨迹参数组合: {drag_params['arm']}, 步数: {drag_params['steps']}, 超调: {drag_params['overshoot']:.1f}px")
         
-        print("[DEBUG] 滑块拖动完成")
-        if logger:
-            logger.log_captcha_step("步骤4完成", "滑块拖动完成")
-        
-        # ===== 拖动后截图 =====
-        try:
-            after_drag_path = BASE_DIR / "slider_after_drag.png"
-            page.screenshot(path=str(after_drag_path))
-            print(f"[INFO] 拖动后截图已保存: {after_drag_path}")
+        # 拖动前开始监听判定结果，避免错过校验接口的响应
+        with CaptchaVerdictWatcher(page, "slider") as watcher:
+            actual = dispatch_drag(page, plan)
+            print(f"[DEBUG] 轨迹计划耗时 {planned:.3f}s，实际 {actual:.3f}s")
+            print("[DEBUG] 滑块拖动完成")
             if logger:
-                logger.log_debug(f"拖动后截图已保存: {after_drag_path}")
-        except Exception as e:
-            print(f"[WARNING] 保存拖动后截图失败: {e}")
+                logger.log_captcha_step("步骤4完成", "滑块拖动完成")
+            
+            # 等待验证结果（得到判定即返回）
+            verdict = watcher.wait(timeout=3.0)
         
-        # 等待验证结果
-        time.sleep(2)
+        if verdict == TIMEOUT:
+            # 未得到明确判定时退回到检查验证码是否仍存在
+            verdict = PASS
+            try:
+                if page.locator(".geetest_slider").is_visible(timeout=1000):
+                    verdict = FAIL
+            except:
+                pass
+        tuner.record(drag_params, verdict == PASS)
         
-        # 检查是否验证成功（验证码消失或出现成功提示）
-        captcha_gone = True
-        try:
-            # 检查验证码是否还存在
-            if page.locator(".geetest_slider").is_visible(timeout=1000):
-                captcha_gone = False
-        except:
-            pass
+        # ===== 拖动后截图（仅保存在内存中） =====
+        recorder.capture(page, "slider_after_drag")
         
-        if captcha_gone:
-            print("[DEBUG] 验证码已消失，可能验证成功")
+        if verdict == PASS:
+            print("[DEBUG] 滑块验证通过")
             if logger:
-                logger.log_captcha_step("完成", "验证码已消失")
+                logger.log_captcha_step("完成", "验证通过")
             return True
         else:
-            print("[DEBUG] 验证码仍存在，可能验证失败")
+            print(f"[DEBUG] 滑块验证未通过（{verdict}）")
             if logger:
-                logger.log_captcha_step("完成", "验证码仍存在，可能失败")
+                logger.log_captcha_step("完成", f"验证未通过: {verdict}")
             return False
         
     except Exception as e:
@@ -967,44 +897,20 @@ def find_signed_text_locator(page, timeout=3000):
         pass
     return None
 
-def main():
-    # 解析命令行参数
-    parser = argparse.ArgumentParser(description='SakuraFRP自动签到脚本')
-    parser.add_argument('--screenshot-only', action='store_true', help='仅记录截图，不记录日志')
-    parser.add_argument('--log-only', action='store_true', help='仅记录日志，不保存截图')
-    parser.add_argument('--both', action='store_true', help='同时记录截图和日志（默认）')
-    args = parser.parse_args()
-    
-    # 确定记录模式
-    if args.screenshot_only:
-        save_screenshot = True
-        save_log = False
-    elif args.log_only:
-        save_screenshot = False
-        save_log = True
-    else:
-        # 默认或--both都是两者都要
-        save_screenshot = True
-        save_log = True
-    
-    # 清理30天前的旧日志
-    clean_old_logs(BASE_DIR, days=30)
-    
-    # 初始化日志记录器（如果需要）
-    logger = None
-    if save_log:
-        logger = CheckinLogger(BASE_DIR)
-        logger.log_start()
-    
-    # 初始化AI服务
-    try:
-        ai_service = AIService()
-    except Exception as e:
-        error_msg = f"AI服务初始化失败: {e}"
-        print(f"[ERROR] {error_msg}")
-        if logger:
-            logger.log_error(error_msg)
-        return
+def run_checkin(save_screenshot, logger, phases, start_at=None, report=None, recorder=None):
+    """执行一次签到流程，返回结果：success / already_signed / failed / error
+
+    start_at 为预热模式下的计划签到时间：启动浏览器、登录、打开用户页和预热模型都在此之前完成，
+    到点后只剩点击签到和处理验证码。
+    report 为 dict 时写入本次遇到的验证码类型（captcha_type）和处理次数（attempts），供签到台账使用；
+    recorder 为飞行记录器，调试截图只保存在内存中，由调用方在失败时落盘
+    """
+    if report is None:
+        report = {}
+    if recorder is None:
+        recorder = FlightRecorder()
+    # AI服务和识别路由在第一次需要识别时才初始化，已签到时无需加载 zhipuai 等模块
+    recognizer = LazyRouter(lambda: create_recognizer(logger))
     
     # 加载账号信息
     try:
@@ -1014,46 +920,61 @@ def main():
         print(f"[ERROR] {error_msg}")
         if logger:
             logger.log_error(error_msg)
-        return
+        return "error"
 
+    phases.mark("launch")
+    from playwright.sync_api import sync_playwright
     with sync_playwright() as p:
-        # 从环境变量读取代理配置（可选）
-        proxy_url = os.getenv("HTTP_PROXY") or os.getenv("http_proxy")
-        
-        if proxy_url:
-            print(f"[INFO] 使用代理: {proxy_url}")
-            if logger:
-                logger.log_info(f"使用代理: {proxy_url}")
-            browser = p.chromium.launch(
-                headless=True, 
-                slow_mo=100,
-                proxy={"server": proxy_url}
-            )
-        else:
-            browser = p.chromium.launch(headless=True, slow_mo=100)
-        context = browser.new_context(storage_state=STATE_FILE if STATE_FILE.exists() else None)
-        page = context.new_page()
-        page.set_viewport_size({"width": 1280, "height": 900})
-        
-        print(f"[INFO] 正在访问: {target_url}")
-        if logger:
-            logger.log_info(f"正在访问: {target_url}")
+        # 代理池在浏览器启动的同时探测各代理的延迟（未配置 PROXY_POOL 时只有 HTTP_PROXY 或直连）
+        proxy_pool = get_proxy_pool()
+        proxy_pool.start_refresh(domain)
+        browser = browser_profile.launch(p.chromium, slow_mo=100)
+        candidates = proxy_pool.candidates()
         
-        try:
-            page.goto(target_url, timeout=30000)
-            current_url = page.url
-            print(f"[DEBUG] 页面加载完成，当前URL: {current_url}")
-            if logger:
-                logger.log_page_url(current_url)
-        except Exception as e:
-            error_msg = f"页面访问失败: {e}"
-            print(f"[ERROR] {error_msg}")
+        # 按代理池顺序创建上下文并访问签到页，访问失败时换下一个代理
+        for index, proxy in enumerate(candidates):
+            if proxy:
+                print(f"[INFO] 使用代理: {display_proxy(proxy)}")
+                if logger:
+                    logger.log_info(f"使用代理: {display_proxy(proxy)}")
+            context = browser.new_context(storage_state=STATE_FILE if STATE_FILE.exists() else None,
+                                          viewport=browser_profile.viewport(), **proxy_context_options(proxy))
+            recorder.start_trace(context)
+            page = context.new_page()
+            
+            phases.mark("navigate")
+            print(f"[INFO] 正在访问: {target_url}")
             if logger:
-                logger.log_exception(type(e).__name__, str(e), traceback.format_exc())
-            browser.close()
-            return
+                logger.log_info(f"正在访问: {target_url}")
+            
+            try:
+                page.goto(target_url, timeout=30000)
+                current_url = page.url
+                print(f"[DEBUG] 页面加载完成，当前URL: {current_url}")
+                if logger:
+                    logger.log_page_url(current_url)
+                proxy_pool.report(proxy, True)
+                break
+            except Exception as e:
+                error_msg = f"页面访问失败: {e}"
+                print(f"[ERROR] {error_msg}")
+                if logger:
+                    logger.log_exception(type(e).__name__, str(e), traceback.format_exc())
+                recorder.capture(page, "navigate_failed")
+                if index + 1 < len(candidates):
+                    proxy_pool.failover(proxy)
+                    print(f"[INFO] 切换到下一个代理: {display_proxy(candidates[index + 1])}")
+                    recorder.stop_trace(context, keep=False)
+                    context.close()
+                    continue
+                proxy_pool.report(proxy, False)
+                proxy_pool.flush()
+                recorder.stop_trace(context, keep=True)
+                browser.close()
+                return "error"
 
         # 登录判断
+        phases.mark("login")
         current_url_after_load = page.url
         print(f"[DEBUG] 登录检查前URL: {current_url_after_load}")
         if logger:
@@ -1110,8 +1031,14 @@ def main():
             print("[INFO] 已登录状态")
             if logger:
                 logger.log_login_status(True)
+            # 刷新登录状态缓存（Cookie 续期）
+            try:
+                context.storage_state(path=STATE_FILE)
+            except Exception as e:
+                print(f"[DEBUG] 刷新登录状态缓存失败: {e}")
 
         # 18岁弹窗
+        phases.mark("sign_check")
         try:
             btn_18 = page.get_by_text("是，我已满18岁")
             if btn_18.is_visible(timeout=3000): 
@@ -1130,8 +1057,10 @@ def main():
         if logger:
             logger.log_debug("开始检查签到状态...")
         
+        outcome = "failed"
         signed_locator = find_signed_text_locator(page)
         if signed_locator:
+            outcome = "already_signed"
             print("[INFO] 今日已签到。")
             if logger:
                 logger.log_already_signed()
@@ -1152,26 +1081,33 @@ def main():
                 logger.log_element_status("签到按钮", sign_btn_visible)
             
             if sign_btn_visible:
+                if start_at is not None:
+                    # 预热模式：利用剩余时间加载识别模型，然后等到计划时间再点击
+                    phases.mark("prewarm")
+                    recognizer.warm_up()
+                    print(f"[INFO] 准备就绪，等待计划签到时间 {start_at:%H:%M:%S}...")
+                    if logger:
+                        logger.log_info(f"准备就绪，等待计划签到时间 {start_at:%H:%M:%S}")
+                    phases.mark("prewarm_wait")
+                    sleep_until(start_at)
+                
                 print("[INFO] 点击签到按钮...")
                 if logger:
                     logger.log_info("点击签到按钮...")
                 
                 # 初始化签到成功标志
                 sign_success = False
+                captcha_attempts = 0
                 
+                phases.mark("captcha_wait")
                 try:
                     sign_btn.click()
                     print("[DEBUG] 已点击签到按钮，等待验证码加载...")
                     if logger:
                         logger.log_debug("已点击签到按钮，等待验证码加载")
                     
-                    # 保存点击前的页面状态（用于对比）
-                    try:
-                        before_screenshot = BASE_DIR / "before_click.png"
-                        page.screenshot(path=str(before_screenshot))
-                        print(f"[DEBUG] 点击前页面截图已保存: {before_screenshot}")
-                    except:
-                        pass
+                    # 记录点击前的页面状态（用于对比）
+                    recorder.capture(page, "before_click")
                     
                     # 获取点击后的URL
                     current_url = page.url
@@ -1228,13 +1164,8 @@ def main():
                                 else:
                                     print(f"[DEBUG] 第 {check_round + 1} 轮检查：仍未检测到验证码")
                     
-                    # 保存点击后的页面状态
-                    try:
-                        after_screenshot = BASE_DIR / "after_click.png"
-                        page.screenshot(path=str(after_screenshot))
-                        print(f"[DEBUG] 点击后页面截图已保存: {after_screenshot}")
-                    except:
-                        pass
+                    # 记录点击后的页面状态
+                    recorder.capture(page, "after_click")
                     
                     if sign_success:
                         # 如果已经签到成功，不需要继续处理验证码
@@ -1252,6 +1183,7 @@ def main():
                 
                 # 如果已经签到成功，跳过验证码处理
                 if not sign_success:
+                    phases.mark("captcha")
                     # 如果检测到验证码，进入处理流程；否则再尝试检查
                     if captcha_appeared:
                         max_attempts = 3
@@ -1284,15 +1216,19 @@ def main():
                         captcha_type = detect_captcha_type(page, logger)
                         
                         if captcha_type != "unknown":
+                            metrics.CAPTCHA_SEEN.inc(type=captcha_type)
                             print(f"[DEBUG] 第 {attempt} 次检查：检测到{('九宫格' if captcha_type == 'grid' else '滑块')}验证码")
                             if logger:
                                 logger.log_captcha_step(f"第 {attempt} 次", f"检测到{('九宫格' if captcha_type == 'grid' else '滑块')}验证码")
                             
                             try:
+                                captcha_attempts += 1
+                                report["captcha_type"] = captcha_type
+                                report["attempts"] = captcha_attempts
                                 if captcha_type == "grid":
-                                    captcha_result = solve_geetest_multistep(page, ai_service, logger)
+                                    captcha_result = solve_geetest_multistep(page, recognizer, logger, recorder)
                                 elif captcha_type == "slider":
-                                    captcha_result = solve_geetest_slider(page, ai_service, logger)
+                                    captcha_result = solve_geetest_slider(page, recognizer, logger, recorder)
                                 else:
                                     captcha_result = False
                                 
@@ -1303,7 +1239,8 @@ def main():
                                     logger.log_captcha_step(f"第 {attempt} 次", f"处理结果: {result_text}")
                                 
                                 if captcha_result:
-                                    time.sleep(3)  # 等待验证码处理后的页面响应
+                                    # 等待页面出现已签到提示（出现即返回），下一轮检查随即确认结果
+                                    find_signed_text_locator(page, timeout=3000)
                                 else:
                                     print("[DEBUG] 验证码处理失败，继续等待...")
                                     if logger:
@@ -1345,6 +1282,10 @@ def main():
                             except:
                                 pass
                             logger.log_debug(f"最终状态检查 - 已签到: {final_signed is not None}, 验证码可见: {final_captcha}")
+                
+                if sign_success:
+                    outcome = "success"
+                    metrics.ATTEMPTS_PER_SUCCESS.observe(captcha_attempts)
             else:
                 current_url_final = page.url
                 error_msg = "未找到签到按钮"
@@ -1363,7 +1304,13 @@ def main():
                     except:
                         pass
 
+        # 保存本次识别结果缓存、选择器统计和代理健康分
+        recognizer.flush()
+        get_selector_cache().flush()
+        proxy_pool.flush()
+        
         # 截图存证（如果需要）
+        phases.mark("screenshot")
         if save_screenshot:
             success_loc = find_signed_text_locator(page)
             if success_loc:
@@ -1375,8 +1322,213 @@ def main():
                     page.screenshot(path=str(SUCCESS_SCREENSHOT))
                     print(f"[INFO] 截图已保存: {SUCCESS_SCREENSHOT}")
         
+        # 失败时记录最终页面状态，成功时丢弃 trace
+        failed = outcome not in ledger.DONE_OUTCOMES
+        if failed:
+            recorder.capture(page, "final")
+        recorder.stop_trace(context, keep=failed)
+        
         print("[INFO] 脚本运行结束。")
         browser.close()
+    return outcome
+
+def run_once(save_screenshot, save_log, use_async=False, start_at=None, force=False, profiler=None, daemon=False):
+    """执行一次完整签到（清理日志、记录指标和台账），返回结果：success / already_signed / failed / error / timeout
+
+    start_at 不为空时为预热模式：立即开始准备，到 start_at 才点击签到；
+    force 为 True 时忽略台账中的当天记录；台账显示当天已完成而跳过的账号也会记录一条 already_signed，
+    读取台账的一方（worker 池、--history）据此区分“已完成而跳过”和“子进程未写入结果就退出”；
+    profiler 为 profiler.Profiler 时按阶段记录剖析数据（同步流程）；
+    daemon 为 True 时（守护进程模式）看门狗超时后不退出进程
+    """
+    # 台账中当天已签到成功的账号不再启动浏览器（账号文件读取失败时交给签到流程报错）
+    try:
+        accounts = load_accounts(ACCOUNT_FILE) if use_async else [load_username_password(ACCOUNT_FILE)]
+    except Exception:
+        accounts = None
+    # 账号在账号文件中的原始位置：异步流程按它选择各账号的状态文件和截图文件名，过滤后不能重新编号
+    positions = None
+    if accounts and not force:
+        positions = []
+        for i, (username, _) in enumerate(accounts):
+            if ledger.safe_is_done(username):
+                ledger.safe_record(username, "already_signed")
+            else:
+                positions.append(i)
+        if not positions:
+            print(f"[INFO] 台账显示{'所有账号' if len(accounts) > 1 else f'账号 {accounts[0][0]} '}今天已签到，跳过")
+            return "already_signed"
+        accounts = [accounts[i] for i in positions]
+    
+    # 清理30天前的旧日志
+    clean_old_logs(BASE_DIR, days=30)
+    
+    # 初始化日志记录器（如果需要）
+    logger = None
+    if save_log:
+        logger = CheckinLogger(BASE_DIR)
+        logger.log_start()
+    
+    if use_async:
+        import asyncio
+        from async_checkin import run_all, account_concurrency
+        outcome = "error"
+        results = {}
+        recorder = FlightRecorder()
+        if accounts is None:
+            try:
+                accounts = load_accounts(ACCOUNT_FILE)
+            except Exception as e:
+                print(f"[ERROR] 读取账号文件失败: {e}")
+                accounts = []
+        
+        def record_unfinished(reason):
+            """事件循环卡住、看门狗强制收尾时：未结束的账号记为超时，并保存各线程调用栈"""
+            for username, _ in accounts:
+                if username not in results:
+                    results[username] = "timeout"
+                    metrics.record_run("timeout", 0.0)
+                    ledger.safe_record(username, "timeout")
+            recorder.dump("timeout", "async")
+            metrics.export_textfile(logger)
+        
+        # 各账号在事件循环中分别检查期限和阶段预算（见 AsyncCheckin.run_with_deadline）；
+        # 这里的看门狗线程只在事件循环本身卡住时兜底，期限按账号分批数放大，预热模式下等待计划时间的部分不计入
+        watchdog = RunWatchdog(budgets={}, on_expire=lambda reason, stacks: recorder.log(f"[watchdog] {reason}\n{stacks}"),
+                               before_exit=record_unfinished, hard_exit=not daemon)
+        if watchdog.enabled:
+            batches = -(-max(1, len(accounts)) // account_concurrency())
+            watchdog.deadline = watchdog.deadline * batches + watchdog.grace
+            if start_at is not None:
+                watchdog.deadline += max(0.0, (start_at - datetime.now()).total_seconds())
+        watchdog.start()
+        rss = browser_profile.PeakRssSampler().start()
+        try:
+            outcomes = asyncio.run(run_all(accounts, save_screenshot, logger, start_at, positions, results))
+            for username, account_outcome in outcomes.items():
+                print(f"[INFO] {username}: {account_outcome}")
+            # 多个账号时取最差的结果
+            for candidate in ("error", "timeout", "failed", "success", "already_signed"):
+                if candidate in outcomes.values():
+                    outcome = candidate
+                    break
+        except Exception as e:
+            print(f"[ERROR] 异步签到失败: {e}")
+            if logger:
+                logger.log_exception(type(e).__name__, str(e), traceback.format_exc())
+        finally:
+            watchdog.stop()
+            rss.stop()
+            if watchdog.expired:
+                outcome = "timeout"
+            metrics.export_textfile(logger)
+        return outcome
+    
+    run_start = time.monotonic()
+    outcome = "error"
+    report = {}
+    recorder = FlightRecorder()
+    finished = threading.Lock()
+    
+    def finish(result):
+        """保存飞行记录、记录指标和台账；看门狗强制退出前也会调用，只执行一次"""
+        if not finished.acquire(blocking=False):
+            return
+        # 飞行记录只在失败时落盘
+        if result in ledger.DONE_OUTCOMES:
+            recorder.discard()
+        else:
+            recorder.dump(result)
+        duration = time.monotonic() - run_start
+        metrics.record_run(result, duration)
+        metrics.export_textfile(logger)
+        if accounts:
+            ledger.safe_record(accounts[0][0], result, report.get("captcha_type"), report.get("attempts", 0), duration)
+    
+    def on_deadline_expired(reason, stacks):
+        recorder.log(f"[watchdog] {reason}\n{stacks}")
+        if logger:
+            logger.log_error(f"看门狗: {reason}")
+    
+    watchdog = RunWatchdog(on_expire=on_deadline_expired, before_exit=lambda reason: finish("timeout"), hard_exit=not daemon)
+    
+    def on_phase(phase):
+        watchdog.on_phase(phase)
+        if profiler:
+            profiler.on_phase(phase)
+    
+    phases = metrics.PhaseTimer(listener=on_phase)
+    watchdog.start()
+    rss = browser_profile.PeakRssSampler().start()
+    try:
+        with recorder.tee_stdout():
+            outcome = run_checkin(save_screenshot, logger, phases, start_at, report, recorder)
+    except Exception:
+        recorder.log(traceback.format_exc())
+        # 看门狗结束浏览器后，卡住的调用抛出的异常属于预期
+        if not watchdog.expired:
+            raise
+    finally:
+        watchdog.stop()
+        rss.stop()
+        phases.stop()
+        if profiler:
+            profiler.on_phase("finish")
+        if watchdog.expired:
+            outcome = "timeout"
+        finish(outcome)
+    return outcome
+
+def main():
+    load_dotenv()
+    
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description='SakuraFRP自动签到脚本')
+    parser.add_argument('--screenshot-only', action='store_true', help='仅记录截图，不记录日志')
+    parser.add_argument('--log-only', action='store_true', help='仅记录日志，不保存截图')
+    parser.add_argument('--both', action='store_true', help='同时记录截图和日志（默认）')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='使用异步流程（account.txt 中的多个账号并发签到）')
+    parser.add_argument('--daemon', action='store_true', help='守护进程模式：每天在 SCHEDULE_TIME ±30分钟内随机时间自动签到')
+    parser.add_argument('--force', action='store_true', help='忽略签到台账，即使今天已签到成功也重新执行')
+    parser.add_argument('--history', nargs='?', type=int, const=30, metavar='DAYS', help='显示最近 DAYS 天（默认30）的签到记录后退出')
+    parser.add_argument('--profile', action='store_true', help='剖析本次运行：输出火焰图折叠栈、各阶段CPU/等待时间和内存分配（保存在 profiles/ 下）')
+    args = parser.parse_args()
+    
+    if args.history is not None:
+        ledger.print_history(ledger.Ledger().history(args.history))
+        return 0
+    
+    # 确定记录模式
+    if args.screenshot_only:
+        save_screenshot = True
+        save_log = False
+    elif args.log_only:
+        save_screenshot = False
+        save_log = True
+    else:
+        # 默认或--both都是两者都要
+        save_screenshot = True
+        save_log = True
+    
+    if args.daemon:
+        if args.profile:
+            print("[WARNING] --profile 只用于单次运行，守护进程模式下忽略")
+        from scheduler import run_daemon
+        return run_daemon(lambda start_at=None: run_once(save_screenshot, save_log, args.use_async, start_at, args.force, daemon=True))
+    
+    if args.profile:
+        from profiler import Profiler
+        profiler = Profiler()
+        try:
+            with profiler:
+                outcome = run_once(save_screenshot, save_log, args.use_async, force=args.force, profiler=profiler)
+        finally:
+            profiler.write()
+    else:
+        outcome = run_once(save_screenshot, save_log, args.use_async, force=args.force)
+    # 超过运行期限时使用单独的退出码，便于调度器区分
+    if outcome == "timeout":
+        return EXIT_DEADLINE
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
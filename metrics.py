@@ -0,0 +1,290 @@
+import os
+import time
+import threading
+from pathlib import Path
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_value(value):
+    """格式化数值：整数不带小数点，无穷大使用 +Inf"""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for k, v in pairs:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{k}="{v}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Metric:
+    """指标基类，按标签值保存样本"""
+    type_name = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """只增计数器"""
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self, openmetrics=False):
+        # OpenMetrics 的计数器族名不带 _total，样本名带 _total
+        base = self.name[:-len("_total")] if self.name.endswith("_total") else self.name
+        family = base if openmetrics else base + "_total"
+        lines = [f"# HELP {family} {self.documentation}", f"# TYPE {family} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{base}_total{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """可任意设置的数值"""
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels))
+
+    def render(self, openmetrics=False):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def get_count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state["count"] if state else 0
+
+    def render(self, openmetrics=False):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state["counts"]):
+                    labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+                lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self, openmetrics=False):
+        """渲染为 Prometheus 文本格式（openmetrics=True 时为 OpenMetrics 格式）"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(openmetrics))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+RUNS = REGISTRY.counter(
+    "sakurafrp_checkin_runs_total", "签到运行次数（按结果）", ["outcome"])
+RUN_DURATION = REGISTRY.histogram(
+    "sakurafrp_checkin_run_duration_seconds", "单次签到运行总耗时")
+PHASE_DURATION = REGISTRY.histogram(
+    "sakurafrp_checkin_phase_duration_seconds", "签到各阶段耗时", ["phase"])
+LAST_RUN = REGISTRY.gauge(
+    "sakurafrp_checkin_last_run_timestamp_seconds", "最近一次运行结束时间（按结果）", ["outcome"])
+AI_CALLS = REGISTRY.counter(
+    "sakurafrp_ai_calls_total", "AI调用次数（按方法和结果）", ["method", "outcome"])
+AI_LATENCY = REGISTRY.histogram(
+    "sakurafrp_ai_latency_seconds", "AI调用耗时", ["method"],
+    buckets=(0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60))
+AI_JSON_PARSE = REGISTRY.counter(
+    "sakurafrp_ai_json_parse_total", "AI结构化输出的解析结果（ok / repaired / reasked / failed）", ["method", "result"])
+CAPTCHA_SEEN = REGISTRY.counter(
+    "sakurafrp_captcha_seen_total", "检测到的验证码次数（按类型）", ["type"])
+ATTEMPTS_PER_SUCCESS = REGISTRY.histogram(
+    "sakurafrp_captcha_attempts_per_success", "签到成功时消耗的验证码尝试次数",
+    buckets=(0, 1, 2, 3, 4, 5, 8))
+GAP_CONFIDENCE = REGISTRY.histogram(
+    "sakurafrp_gap_recognizer_confidence", "滑块缺口识别置信度",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0))
+
+
+class PhaseTimer:
+    """阶段计时器：mark() 结束上一个阶段并开始下一个阶段；listener(phase) 在每次切换阶段时调用"""
+
+    def __init__(self, histogram=PHASE_DURATION, listener=None):
+        self.histogram = histogram
+        self.listener = listener
+        self.current = None
+        self.started = None
+        self.durations = {}
+
+    def mark(self, phase):
+        """切换到新阶段，返回上一阶段耗时"""
+        elapsed = self.stop()
+        self.current = phase
+        self.started = time.monotonic()
+        if self.listener:
+            self.listener(phase)
+        return elapsed
+
+    def stop(self):
+        """结束当前阶段"""
+        if self.current is None:
+            return None
+        elapsed = time.monotonic() - self.started
+        self.durations[self.current] = self.durations.get(self.current, 0.0) + elapsed
+        self.histogram.observe(elapsed, phase=self.current)
+        self.current = None
+        self.started = None
+        return elapsed
+
+
+def observe_ai_call(method, outcome, elapsed):
+    """记录一次AI调用"""
+    AI_CALLS.inc(method=method, outcome=outcome)
+    AI_LATENCY.observe(elapsed, method=method)
+
+
+def record_run(outcome, duration):
+    """记录一次签到运行结果"""
+    RUNS.inc(outcome=outcome)
+    RUN_DURATION.observe(duration)
+    LAST_RUN.set(time.time(), outcome=outcome)
+
+
+def write_textfile(path, registry=REGISTRY):
+    """以 node_exporter textfile 格式原子写入指标文件"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(registry.render(), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def export_textfile(logger=None):
+    """如果配置了 METRICS_TEXTFILE，则写出指标文件"""
+    path = os.getenv("METRICS_TEXTFILE", "").strip()
+    if not path:
+        return
+    try:
+        write_textfile(path)
+        print(f"[DEBUG] 指标已写入: {path}")
+    except Exception as e:
+        print(f"[WARNING] 写入指标文件失败: {e}")
+        if logger:
+            logger.log_error(f"写入指标文件失败: {e}")
+
+
+def start_http_server(port, host="0.0.0.0", registry=REGISTRY):
+    """在后台线程中通过HTTP暴露 /metrics（守护进程模式使用）"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            data = registry.render(openmetrics).encode("utf-8")
+            self.send_response(200)
+            if openmetrics:
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            else:
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    print(f"[INFO] 指标HTTP服务已启动: http://{host}:{httpd.server_address[1]}/metrics")
+    return httpd
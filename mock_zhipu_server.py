@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+本地智谱/OpenAI 兼容模拟服务器
+
+用于在无网络、无API费用的情况下测试 AIService 和验证码求解器的并发、重试和超时行为。
+支持：脚本化响应、可配置的延迟分布、按比例注入 429 限流和 5xx 错误。
+
+运行方式:
+  python mock_zhipu_server.py --port 8765 --latency uniform:0.2,0.8 --rate-429 0.1 --rate-5xx 0.05
+  然后在 .env 中设置 ZHIPU_BASE_URL=http://127.0.0.1:8765/api/paas/v4
+
+在代码中使用:
+  with MockZhipuServer(latency="fixed:0.1") as server:
+      ai_service = AIService(base_url=server.base_url)
+"""
+
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_PATH = "/api/paas/v4/chat/completions"
+
+# 未命中脚本规则时的默认回复（按提示词关键字匹配）
+DEFAULT_RULES = [
+    {"match": "包含3个格子", "content": "[\"猫\", \"狗\", \"汽车\"]"},
+    {"match": "题目是", "content": "[1]"},
+    {"match": "缺口", "content": "120"},
+    {"match": "图中是什么物体", "content": "猫"},
+]
+DEFAULT_CONTENT = "测试成功"
+
+
+def parse_latency(spec):
+    """解析延迟分布描述，返回 rng -> 秒数 的函数
+
+    支持的格式：
+      fixed:0.2            固定延迟
+      uniform:0.1,0.5      均匀分布
+      normal:0.3,0.1       正态分布（均值, 标准差），截断到 >= 0
+      lognormal:-1.2,0.5   对数正态分布（mu, sigma）
+      exp:0.3              指数分布（均值）
+    """
+    if not spec:
+        return lambda rng: 0.0
+    if ":" in spec:
+        kind, _, args = spec.partition(":")
+    else:
+        kind, args = "fixed", spec
+    try:
+        params = [float(x) for x in args.split(",") if x.strip()]
+    except ValueError:
+        raise ValueError(f"无效的延迟参数: {spec}")
+
+    kind = kind.strip().lower()
+    if kind == "fixed" and len(params) == 1:
+        return lambda rng: params[0]
+    if kind == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "normal" and len(params) == 2:
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if kind == "lognormal" and len(params) == 2:
+        return lambda rng: rng.lognormvariate(params[0], params[1])
+    if kind == "exp" and len(params) == 1:
+        return lambda rng: rng.expovariate(1.0 / params[0]) if params[0] > 0 else 0.0
+    raise ValueError(f"无效的延迟分布: {spec}")
+
+
+def extract_prompt(body):
+    """从请求体中提取所有文本内容，并统计图片数量"""
+    texts = []
+    image_count = 0
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    image_count += 1
+    return "\n".join(texts), image_count
+
+
+class MockZhipuServer:
+    """智谱 API 模拟服务器，在后台线程中运行"""
+
+    def __init__(self, host="127.0.0.1", port=0, script=None, latency="fixed:0",
+                 rate_429=0.0, rate_5xx=0.0, retry_after=None, seed=None):
+        """初始化模拟服务器
+
+        script 为规则列表（或JSON文件路径），每条规则可包含：
+          match: 提示词中需包含的子串（可选）
+          model: 需匹配的模型名（可选）
+          content: 返回的文本内容
+          status: 返回的HTTP状态码（可选，用于固定注入错误）
+          latency: 该规则的延迟分布（可选，覆盖全局设置）
+          times: 规则可用次数（可选，用完后跳过，可用于编排响应顺序）
+        """
+        self.host = host
+        self.port = port
+        self.rules = self._load_script(script)
+        self.latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "in_flight": 0, "max_in_flight": 0}
+        self.requests = []
+        self._httpd = None
+        self._thread = None
+
+    @staticmethod
+    def _load_script(script):
+        if script is None:
+            return []
+        if isinstance(script, (str, Path)):
+            data = json.loads(Path(script).read_text(encoding="utf-8"))
+        else:
+            data = script
+        rules = []
+        for rule in data:
+            rule = dict(rule)
+            if "latency" in rule:
+                rule["latency"] = parse_latency(rule["latency"])
+            rules.append(rule)
+        return rules
+
+    @property
+    def base_url(self):
+        """供 AIService / ZhipuAI 使用的 base_url"""
+        return f"http://{self.host}:{self.port}/api/paas/v4"
+
+    def _pick_rule(self, model, prompt):
+        """按顺序匹配脚本规则，最后回退到默认规则"""
+        with self.lock:
+            for rule in self.rules:
+                if rule.get("times") is not None and rule["times"] <= 0:
+                    continue
+                if rule.get("model") and rule["model"] != model:
+                    continue
+                if rule.get("match") and rule["match"] not in prompt:
+                    continue
+                if rule.get("times") is not None:
+                    rule["times"] -= 1
+                return rule
+        for rule in DEFAULT_RULES:
+            if rule["match"] in prompt:
+                return rule
+        return {"content": DEFAULT_CONTENT}
+
+    def handle_chat(self, body):
+        """处理一次对话请求，返回 (状态码, 响应体, 额外响应头)"""
+        model = body.get("model", "")
+        prompt, image_count = extract_prompt(body)
+        rule = self._pick_rule(model, prompt)
+
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            self.requests.append({"model": model, "prompt": prompt, "images": image_count, "time": time.time(),
+                                  "json_mode": (body.get("response_format") or {}).get("type") == "json_object"})
+            roll = self.rng.random()
+            delay = (rule.get("latency") or self.latency)(self.rng)
+
+        try:
+            time.sleep(delay)
+
+            status = rule.get("status")
+            if status is None:
+                if roll < self.rate_429:
+                    status = 429
+                elif roll < self.rate_429 + self.rate_5xx:
+                    status = self.rng.choice([500, 502, 503])
+                else:
+                    status = 200
+
+            if status == 429:
+                with self.lock:
+                    self.stats["429"] += 1
+                headers = {}
+                if self.retry_after is not None:
+                    headers["Retry-After"] = str(self.retry_after)
+                return 429, {"error": {"code": "1302", "message": "您当前使用该API的并发数过高，请降低并发"}}, headers
+            if status >= 500:
+                with self.lock:
+                    self.stats["5xx"] += 1
+                return status, {"error": {"code": "500", "message": "服务内部错误"}}, {}
+
+            with self.lock:
+                self.stats["ok"] += 1
+            content = rule.get("content", DEFAULT_CONTENT)
+            return 200, {
+                "id": uuid.uuid4().hex,
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content}
+                }],
+                "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(content),
+                          "total_tokens": len(prompt) + len(content)}
+            }, {}
+        finally:
+            with self.lock:
+                self.stats["in_flight"] -= 1
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length) if length else b"{}"
+                if self.path.rstrip("/") != CHAT_PATH:
+                    self._send_json(404, {"error": {"code": "404", "message": f"未知路径: {self.path}"}})
+                    return
+                try:
+                    body = json.loads(raw.decode("utf-8"))
+                except ValueError:
+                    self._send_json(400, {"error": {"code": "400", "message": "请求体不是有效的JSON"}})
+                    return
+                status, payload, headers = server.handle_chat(body)
+                self._send_json(status, payload, headers)
+
+            def log_message(self, format, *args):
+                # 静默，避免刷屏
+                pass
+
+        return Handler
+
+    def start(self):
+        """在后台线程中启动服务器"""
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务器"""
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='智谱API本地模拟服务器')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--script', help='脚本化响应规则（JSON文件）')
+    parser.add_argument('--latency', default='fixed:0', help='延迟分布，如 uniform:0.1,0.5')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='返回429限流的比例（0-1）')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='返回5xx错误的比例（0-1）')
+    parser.add_argument('--retry-after', type=float, help='429响应中的Retry-After秒数')
+    parser.add_argument('--seed', type=int, help='随机种子（用于复现）')
+    args = parser.parse_args()
+
+    server = MockZhipuServer(
+        host=args.host, port=args.port, script=args.script, latency=args.latency,
+        rate_429=args.rate_429, rate_5xx=args.rate_5xx, retry_after=args.retry_after, seed=args.seed
+    ).start()
+    print(f"[INFO] 模拟服务器已启动: {server.base_url}")
+    print(f"[INFO] 在 .env 中设置 ZHIPU_BASE_URL={server.base_url} 即可使用")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n[INFO] 统计: {server.stats}")
+        server.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+性能剖析（python main.py --profile）
+
+签到运行期间由后台线程定时采样各线程的调用栈，同时开启 tracemalloc，运行结束后在 profiles/<时间>/ 下输出：
+- stacks.collapsed：折叠栈格式（flamegraph.pl / speedscope 可直接打开生成火焰图）
+- report.txt：各阶段的墙钟时间、主线程 Python CPU 时间和等待时间，按类别（本地计算 / 远程等待 / 其他等待）的采样分布，
+  以及内存分配最多的代码位置
+"""
+
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 按调用栈从内到外匹配模块路径，第一个命中的类别即该样本的类别
+CATEGORIES = (
+    ("remote:playwright", ("playwright", "greenlet")),
+    ("remote:http", ("zhipuai", "httpx", "httpcore", "urllib3", "requests", "ssl.py", "socket.py", "http/client.py")),
+    ("local:base64", ("base64.py",)),
+    ("local:image", ("PIL",)),
+    ("local:gap_detection", ("numpy", "captcha_recognizer", "onnxruntime", "cv2", "gap_detection.py")),
+)
+LOCAL_OTHER = "local:python"
+# 未匹配到上述类别、且采样间隔内主线程几乎没有占用CPU（sleep、锁等待等）
+WAIT_OTHER = "wait:other"
+
+# 不采样的辅助线程
+IGNORED_THREADS = ("profiler", "watchdog", "rss-sampler")
+
+
+def _category(frames):
+    """frames 为从内到外的 (文件名, 函数名)"""
+    for filename, _ in frames:
+        path = filename.replace("\\", "/")
+        for category, markers in CATEGORIES:
+            if any(marker in path for marker in markers):
+                return category
+    return LOCAL_OTHER
+
+
+def _frame_label(filename, function):
+    return f"{function} ({os.path.basename(filename)})"
+
+
+def _thread_cpu_clock(ident):
+    """读取指定线程CPU时间的函数（仅 Linux 等支持 pthread_getcpuclockid 的平台），不支持时返回 None"""
+    try:
+        clock = time.pthread_getcpuclockid(ident)
+        time.clock_gettime(clock)
+    except (AttributeError, OSError, OverflowError):
+        return None
+    return lambda: time.clock_gettime(clock)
+
+
+class Profiler:
+    """采样剖析器：on_phase 接到 PhaseTimer 的 listener 上以便按阶段统计"""
+
+    def __init__(self, interval=None, directory=None, top=15):
+        self.interval = interval or float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+        self.directory = Path(directory or os.getenv("PROFILE_DIR") or BASE_DIR / "profiles")
+        self.top = top
+        self.main_ident = threading.main_thread().ident
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        # 阶段 -> 类别 -> 主线程样本数
+        self.phase_samples = defaultdict(Counter)
+        self.samples = 0
+        self.phase = "startup"
+        self.phase_started = None
+        self.cpu_started = None
+        # 阶段 -> [墙钟时间, 主线程CPU时间]
+        self.phase_times = defaultdict(lambda: [0.0, 0.0])
+        self.finished = threading.Event()
+        self.thread = None
+        self.snapshot = None
+        self.snapshot_size = 0
+        self.snapshot_phase = None
+        self.peak_traced = 0
+        self.wall = 0.0
+
+    # ---------------- 阶段 ----------------
+    def on_phase(self, phase):
+        """切换阶段（在主线程中调用，thread_time 即主线程的CPU时间）"""
+        now, cpu = time.monotonic(), time.thread_time()
+        self._maybe_snapshot()
+        with self.lock:
+            self._close_phase(now, cpu)
+            self.phase = phase
+
+    def _maybe_snapshot(self):
+        """阶段结束时若存活的分配比已保存的快照更多，则重新拍快照（近似峰值时刻的分配分布）"""
+        if not tracemalloc.is_tracing():
+            return
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.snapshot_size:
+            self.snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ))
+            self.snapshot_size = current
+            self.snapshot_phase = self.phase
+
+    def _close_phase(self, now, cpu):
+        if self.phase_started is not None:
+            times = self.phase_times[self.phase]
+            times[0] += now - self.phase_started
+            times[1] += cpu - self.cpu_started
+        self.phase_started, self.cpu_started = now, cpu
+
+    # ---------------- 采样 ----------------
+    def _loop(self):
+        names = {}
+        main_cpu = _thread_cpu_clock(self.main_ident)
+        last_cpu = main_cpu() if main_cpu else None
+        while not self.finished.wait(self.interval):
+            # 主线程在本次采样间隔内是否在占用CPU（用于区分本地计算和等待）
+            busy = True
+            if main_cpu:
+                cpu = main_cpu()
+                busy = cpu - last_cpu >= self.interval * 0.5
+                last_cpu = cpu
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            own = threading.get_ident()
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if ident == own or name.startswith(IGNORED_THREADS):
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append((frame.f_code.co_filename, frame.f_code.co_name))
+                    frame = frame.f_back
+                stack = ";".join([name] + [_frame_label(f, fn) for f, fn in reversed(frames)])
+                with self.lock:
+                    self.stacks[stack] += 1
+                    if ident == self.main_ident:
+                        category = _category(frames)
+                        if category == LOCAL_OTHER and not busy:
+                            category = WAIT_OTHER
+                        self.phase_samples[self.phase][category] += 1
+                        self.samples += 1
+
+    def start(self):
+        tracemalloc.start(10)
+        self.started = time.monotonic()
+        self.on_phase("startup")
+        self.thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.finished.set()
+        self.thread.join()
+        self.thread = None
+        with self.lock:
+            self._close_phase(time.monotonic(), time.thread_time())
+        self.wall = time.monotonic() - self.started
+        self.peak_traced = tracemalloc.get_traced_memory()[1]
+        self._maybe_snapshot()
+        tracemalloc.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    # ---------------- 报告 ----------------
+    def render(self):
+        lines = [f"总耗时 {self.wall:.2f}s，主线程样本 {self.samples} 个（采样间隔 {self.interval * 1000:g}ms）", ""]
+
+        lines.append("各阶段耗时（CPU 为主线程的 Python CPU 时间，等待 = 墙钟 - CPU）")
+        lines.append(f"{'阶段':<14}{'墙钟':>9}{'CPU':>9}{'等待':>9}  主要类别（样本占比）")
+        for phase, (wall, cpu) in self.phase_times.items():
+            if wall < 0.001:
+                continue
+            samples = self.phase_samples.get(phase, Counter())
+            total = sum(samples.values()) or 1
+            top = "，".join(f"{c} {n * 100 / total:.0f}%" for c, n in samples.most_common(3))
+            lines.append(f"{phase:<16}{wall:>8.2f}s{cpu:>8.2f}s{max(0.0, wall - cpu):>8.2f}s  {top or '-'}")
+        lines.append("")
+
+        totals = Counter()
+        for samples in self.phase_samples.values():
+            totals.update(samples)
+        total = sum(totals.values()) or 1
+        lines.append("按类别（主线程样本，local 为本地计算，remote 为等待浏览器/网络，wait 为 sleep 等其他等待）")
+        for group in ("local", "remote", "wait"):
+            group_total = sum(n for c, n in totals.items() if c.startswith(group))
+            lines.append(f"  {group:<22}{group_total * self.interval:>8.2f}s  {group_total * 100 / total:5.1f}%")
+            for category, n in totals.most_common():
+                if category.startswith(group):
+                    lines.append(f"    {category:<20}{n * self.interval:>8.2f}s  {n * 100 / total:5.1f}%")
+        lines.append("")
+
+        lines.append(f"内存分配最多的位置（tracemalloc 峰值 {self.peak_traced / 1024 / 1024:.1f}MB，"
+                     f"以下为存活分配最多的时刻——{self.snapshot_phase or '-'} 阶段结束时——的分布）")
+        if self.snapshot is not None:
+            for stat in self.snapshot.statistics("lineno")[:self.top]:
+                frame = stat.traceback[0]
+                lines.append(f"  {stat.size / 1024:>9.1f}KB {stat.count:>7} 次  {frame.filename}:{frame.lineno}")
+        return "\n".join(lines)
+
+    def write(self):
+        """写出折叠栈和报告，返回输出目录"""
+        target = self.directory / datetime.now().strftime("%Y%m%d-%H%M%S")
+        suffix = 1
+        while target.exists():
+            suffix += 1
+            target = self.directory / f"{datetime.now():%Y%m%d-%H%M%S}-{suffix}"
+        target.mkdir(parents=True)
+        with open(target / "stacks.collapsed", "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        report = self.render()
+        (target / "report.txt").write_text(report + "\n", encoding="utf-8")
+        print("\n" + report)
+        print(f"\n[INFO] 剖析结果已保存: {target}（stacks.collapsed 可用 flamegraph.pl 或 https://www.speedscope.app 打开）")
+        return target
@@ -0,0 +1,254 @@
+"""
+代理池
+
+PROXY_POOL 配置多个代理（逗号分隔，direct 表示直连），每次运行前并发探测经由各代理连接目标站点的耗时，
+按滚动健康分和延迟排序：健康的代理中最快的优先使用，页面访问失败时按顺序切换到下一个。
+探测结果和健康分保存在 proxy_pool.json（路径可用 PROXY_POOL_STATE_FILE 修改），不保存代理密码。
+未配置 PROXY_POOL 时沿用 HTTP_PROXY 单个代理，不做探测。
+
+用法：python proxy_pool.py [目标域名]   探测并打印各代理的延迟和健康分
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit, unquote
+import metrics
+
+BASE_DIR = Path(__file__).resolve().parent
+
+DIRECT = "direct"
+DEFAULT_PORTS = {"http": 80, "https": 443, "socks5": 1080, "socks5h": 1080}
+# 健康分低于该值视为不健康，排到健康的代理之后
+HEALTHY = 0.5
+# 健康分和延迟的滚动平均系数
+ALPHA = 0.3
+
+PROXY_LATENCY = metrics.REGISTRY.gauge(
+    "sakurafrp_proxy_latency_seconds", "经由代理连接目标站点的滚动平均耗时", ["proxy"])
+PROXY_HEALTH = metrics.REGISTRY.gauge(
+    "sakurafrp_proxy_health", "代理滚动健康分（0~1）", ["proxy"])
+PROXY_FAILOVERS = metrics.REGISTRY.counter(
+    "sakurafrp_proxy_failovers_total", "页面访问失败后切换代理的次数", ["proxy"])
+
+
+def display(proxy):
+    """用于日志和指标的代理名称（去掉用户名密码）"""
+    if proxy is None:
+        return DIRECT
+    parts = urlsplit(proxy)
+    host = parts.hostname or ""
+    return f"{parts.scheme}://{host}:{parts.port}" if parts.port else f"{parts.scheme}://{host}"
+
+
+def context_options(proxy):
+    """Playwright new_context / launch 的 proxy 参数（直连时为空）"""
+    if proxy is None:
+        return {}
+    parts = urlsplit(proxy)
+    option = {"server": display(proxy)}
+    if parts.username:
+        option["username"] = unquote(parts.username)
+        option["password"] = unquote(parts.password or "")
+    return {"proxy": option}
+
+
+def probe(proxy, host, port=443, timeout=3.0):
+    """测量经由 proxy 与目标站点建立 TCP 隧道的耗时（秒），失败时抛出异常
+
+    HTTP(S) 代理发送 CONNECT，SOCKS5 代理完成握手和 CONNECT，直连只建立 TCP 连接
+    """
+    start = time.monotonic()
+    if proxy is None:
+        socket.create_connection((host, port), timeout).close()
+        return time.monotonic() - start
+
+    parts = urlsplit(proxy)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS:
+        raise ValueError(f"不支持的代理类型: {scheme}")
+    sock = socket.create_connection((parts.hostname, parts.port or DEFAULT_PORTS[scheme]), timeout)
+    try:
+        sock.settimeout(timeout)
+        if scheme == "https":
+            import ssl
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+        if scheme in ("http", "https"):
+            request = f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+            if parts.username:
+                credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+                request += f"Proxy-Authorization: Basic {base64.b64encode(credentials.encode()).decode()}\r\n"
+            sock.sendall((request + "\r\n").encode())
+            status = sock.recv(1024).split(b"\r\n", 1)[0].decode("latin-1")
+            if status.split(" ")[1:2] != ["200"]:
+                raise ConnectionError(f"代理返回 {status or '空响应'}")
+        else:
+            sock.sendall(b"\x05\x01\x00")
+            if sock.recv(2) != b"\x05\x00":
+                raise ConnectionError("SOCKS5 握手失败")
+            name = host.encode("idna")
+            sock.sendall(b"\x05\x01\x00\x03" + bytes([len(name)]) + name + port.to_bytes(2, "big"))
+            reply = sock.recv(10)
+            if len(reply) < 2 or reply[1] != 0:
+                raise ConnectionError(f"SOCKS5 连接失败（{reply[1:2].hex() or '空响应'}）")
+    finally:
+        sock.close()
+    return time.monotonic() - start
+
+
+def parse_pool(spec):
+    """解析 PROXY_POOL，direct 解析为 None"""
+    proxies = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        proxy = None if item.lower() == DIRECT else item
+        if proxy not in proxies:
+            proxies.append(proxy)
+    return proxies
+
+
+class ProxyPool:
+    """代理列表及其滚动健康分、延迟"""
+
+    def __init__(self, proxies=None, path=None, probe_timeout=None, probe_interval=None):
+        if proxies is None:
+            proxies = parse_pool(os.getenv("PROXY_POOL"))
+            if not proxies:
+                single = os.getenv("HTTP_PROXY") or os.getenv("http_proxy")
+                proxies = [single or None]
+        self.proxies = proxies
+        self.path = Path(path or os.getenv("PROXY_POOL_STATE_FILE") or BASE_DIR / "proxy_pool.json")
+        self.probe_timeout = probe_timeout or float(os.getenv("PROXY_PROBE_TIMEOUT", "3"))
+        # 距上次探测不足该秒数时直接使用已有结果（守护进程连续重试时避免重复探测）
+        self.probe_interval = probe_interval if probe_interval is not None else float(os.getenv("PROXY_PROBE_INTERVAL", "300"))
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.probe_thread = None
+        try:
+            if self.path.exists():
+                self.stats = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"[WARNING] 读取代理池状态失败，将重新探测: {e}")
+
+    def _entry(self, proxy):
+        return self.stats.setdefault(display(proxy), {"score": 1.0, "latency": None, "probed_at": 0.0})
+
+    def report(self, proxy, ok, latency=None):
+        """记录一次探测或页面访问的结果，latency 只在探测时传入"""
+        name = display(proxy)
+        with self.lock:
+            entry = self._entry(proxy)
+            entry["score"] = (1 - ALPHA) * entry["score"] + ALPHA * (1.0 if ok else 0.0)
+            if ok and latency is not None:
+                previous = entry["latency"]
+                entry["latency"] = latency if previous is None else (1 - ALPHA) * previous + ALPHA * latency
+            score, avg = entry["score"], entry["latency"]
+        PROXY_HEALTH.set(score, proxy=name)
+        if avg is not None:
+            PROXY_LATENCY.set(avg, proxy=name)
+
+    def refresh(self, host):
+        """并发探测所有代理（只有一个代理时无需探测）"""
+        if len(self.proxies) < 2:
+            return
+        now = time.time()
+
+        def run(proxy):
+            with self.lock:
+                entry = self._entry(proxy)
+                if now - entry["probed_at"] < self.probe_interval:
+                    return
+                entry["probed_at"] = now
+            try:
+                self.report(proxy, True, probe(proxy, host, timeout=self.probe_timeout))
+            except Exception as e:
+                print(f"[DEBUG] 代理 {display(proxy)} 探测失败: {e}")
+                self.report(proxy, False)
+
+        threads = [threading.Thread(target=run, args=(proxy,), daemon=True) for proxy in self.proxies]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def start_refresh(self, host):
+        """在后台线程中探测（与浏览器启动并行），candidates() 时等待结果"""
+        self.probe_thread = threading.Thread(target=self.refresh, args=(host,), name="proxy-probe", daemon=True)
+        self.probe_thread.start()
+
+    def candidates(self):
+        """按使用顺序返回代理：健康的在前，其中延迟低的在前；不健康的保留在最后作为兜底"""
+        if self.probe_thread is not None:
+            self.probe_thread.join()
+            self.probe_thread = None
+        with self.lock:
+            stats = {display(p): dict(self._entry(p)) for p in self.proxies}
+
+        def key(item):
+            index, proxy = item
+            s = stats[display(proxy)]
+            latency = s["latency"] if s["latency"] is not None else float("inf")
+            return (s["score"] < HEALTHY, latency, index)
+
+        return [proxy for _, proxy in sorted(enumerate(self.proxies), key=key)]
+
+    def failover(self, proxy):
+        """页面访问失败：降低健康分并计数"""
+        self.report(proxy, False)
+        PROXY_FAILOVERS.inc(proxy=display(proxy))
+
+    def flush(self):
+        """写回磁盘（只有一个代理时不写）"""
+        if len(self.proxies) < 2:
+            return
+        with self.lock:
+            data = json.dumps(self.stats, ensure_ascii=False, indent=2)
+        try:
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            tmp_path.write_text(data, encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[WARNING] 保存代理池状态失败: {e}")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_proxy_pool():
+    """进程内共享的代理池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProxyPool()
+        return _pool
+
+
+def main():
+    """python proxy_pool.py [目标域名]：探测并打印各代理的延迟和健康分"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    pool = ProxyPool(probe_interval=0)
+    host = sys.argv[1] if len(sys.argv) > 1 else "www.natfrp.com"
+    if len(pool.proxies) < 2:
+        print("[INFO] 未配置 PROXY_POOL（或只有一个代理），无需探测")
+        return 0
+    pool.refresh(host)
+    pool.flush()
+    for proxy in pool.candidates():
+        s = pool.stats[display(proxy)]
+        latency = f"{s['latency'] * 1000:.0f} ms" if s["latency"] is not None else "-"
+        flag = "" if s["score"] >= HEALTHY else "（不健康）"
+        print(f"{display(proxy):<36} 延迟 {latency:>8}  健康分 {s['score']:.2f}{flag}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
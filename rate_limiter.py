@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows 无 fcntl，只能使用进程内限流
+    fcntl = None
+
+RATE_LIMIT_WAIT = metrics.REGISTRY.histogram(
+    "sakurafrp_ai_ratelimit_wait_seconds", "AI调用在限流队列中的等待时间", ["model"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30))
+RATE_LIMIT_BACKOFF = metrics.REGISTRY.counter(
+    "sakurafrp_ai_ratelimit_backoff_total", "收到429后触发退避的次数", ["model"])
+RATE_LIMIT_RATE = metrics.REGISTRY.gauge(
+    "sakurafrp_ai_ratelimit_rate", "当前生效的每秒请求数上限", ["model"])
+
+
+class _MemoryStore:
+    """进程内共享的令牌桶状态"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+
+    def update(self, init, fn):
+        with self.lock:
+            if self.state is None:
+                self.state = init()
+            return fn(self.state)
+
+
+class _FileStore:
+    """跨进程共享的令牌桶状态（JSON文件 + flock 文件锁）"""
+
+    def __init__(self, path, key):
+        self.path = Path(path)
+        self.key = key
+        self.lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def update(self, init, fn):
+        with self.lock, open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    data = json.loads(f.read() or "{}")
+                except ValueError:
+                    data = {}
+                state = data.get(self.key) or init()
+                result = fn(state)
+                data[self.key] = state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(data))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RateLimiter:
+    """单个模型的令牌桶限流器
+
+    - 每秒补充 rate 个令牌，最多积攒 burst 个；同时最多 max_concurrency 个请求在途
+    - 收到429时速率减半并暂停一段时间（乘性减），之后每次成功逐步恢复（加性增）
+    """
+
+    def __init__(self, model, qps=2.0, burst=2, max_concurrency=2, state_file=None, min_qps=0.1):
+        self.model = model
+        self.base_rate = qps
+        self.min_rate = min(min_qps, qps)
+        self.burst = max(1, burst)
+        self.semaphore = threading.BoundedSemaphore(max(1, max_concurrency))
+        if state_file and fcntl is not None:
+            self.store = _FileStore(state_file, model)
+        else:
+            if state_file:
+                print("[WARNING] 当前平台不支持文件锁，跨进程限流已降级为进程内限流")
+            self.store = _MemoryStore()
+        RATE_LIMIT_RATE.set(qps, model=model)
+
+    def _init_state(self):
+        return {"tokens": float(self.burst), "updated": time.time(), "rate": self.base_rate, "paused_until": 0.0}
+
+    def _try_take(self, state):
+        """尝试取走一个令牌，返回还需等待的秒数（0 表示已取得）"""
+        now = time.time()
+        if now < state["paused_until"]:
+            return state["paused_until"] - now
+        elapsed = max(0.0, now - state["updated"])
+        state["tokens"] = min(float(self.burst), state["tokens"] + elapsed * state["rate"])
+        state["updated"] = now
+        if state["tokens"] >= 1.0:
+            state["tokens"] -= 1.0
+            return 0.0
+        return (1.0 - state["tokens"]) / state["rate"]
+
+    def acquire(self):
+        """阻塞直到取得并发槽位和令牌，返回排队等待的秒数"""
+        start = time.monotonic()
+        self.semaphore.acquire()
+        try:
+            while True:
+                wait = self.store.update(self._init_state, self._try_take)
+                if wait <= 0:
+                    break
+                time.sleep(min(wait, 1.0))
+        except BaseException:
+            self.semaphore.release()
+            raise
+        waited = time.monotonic() - start
+        RATE_LIMIT_WAIT.observe(waited, model=self.model)
+        return waited
+
+    def release(self):
+        self.semaphore.release()
+
+    @contextmanager
+    def slot(self):
+        """占用一个调用名额：with limiter.slot(): ..."""
+        waited = self.acquire()
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def on_rate_limited(self, retry_after=None):
+        """收到429：速率减半，并暂停到 Retry-After（未给出时按当前速率推算）"""
+        def penalize(state):
+            state["rate"] = max(self.min_rate, state["rate"] / 2.0)
+            pause = retry_after if retry_after is not None else 1.0 / state["rate"]
+            state["paused_until"] = max(state["paused_until"], time.time() + pause)
+            state["tokens"] = 0.0
+            return state["rate"]
+        rate = self.store.update(self._init_state, penalize)
+        RATE_LIMIT_BACKOFF.inc(model=self.model)
+        RATE_LIMIT_RATE.set(rate, model=self.model)
+        print(f"[WARNING] 模型 {self.model} 触发限流，速率降至 {rate:.2f} 次/秒")
+
+    def on_success(self):
+        """调用成功：速率逐步恢复到配置值"""
+        def reward(state):
+            if state["rate"] < self.base_rate:
+                state["rate"] = min(self.base_rate, state["rate"] + self.base_rate * 0.1)
+            return state["rate"]
+        rate = self.store.update(self._init_state, reward)
+        RATE_LIMIT_RATE.set(rate, model=self.model)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _parse_qps(value):
+    """每秒请求数必须为正的有限数，否则返回 None"""
+    try:
+        qps = float(value)
+    except (TypeError, ValueError):
+        return None
+    return qps if 0 < qps < float("inf") else None
+
+
+def _parse_model_limits(spec):
+    """解析 ZHIPU_RATE_LIMITS，例如 glm-4v-flash=1,glm-4-flash=5"""
+    limits = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        model, _, value = item.partition("=")
+        qps = _parse_qps(value)
+        if qps is None:
+            print(f"[WARNING] 无效的限流配置（每秒请求数须大于0）: {item}")
+            continue
+        limits[model.strip()] = qps
+    return limits
+
+
+def _default_qps():
+    value = os.getenv("ZHIPU_QPS", "2")
+    qps = _parse_qps(value)
+    if qps is None:
+        print(f"[WARNING] 无效的 ZHIPU_QPS（须大于0）: {value}，使用默认值 2")
+        return 2.0
+    return qps
+
+
+def get_limiter(model):
+    """获取进程内共享的模型限流器（所有 AIService 实例共用）"""
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            qps = _parse_model_limits(os.getenv("ZHIPU_RATE_LIMITS")).get(model) or _default_qps()
+            limiter = RateLimiter(
+                model,
+                qps=qps,
+                burst=int(os.getenv("ZHIPU_BURST", "2")),
+                max_concurrency=int(os.getenv("ZHIPU_MAX_CONCURRENCY", "2")),
+                state_file=os.getenv("ZHIPU_RATE_LIMIT_FILE") or None,
+            )
+            _limiters[model] = limiter
+        return limiter
@@ -0,0 +1,517 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+import metrics
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 识别方法：九宫格单行打标签、识别题目、语义裁决、滑块缺口定位、整格一次性求解
+METHODS = ("label_cells", "identify_target", "match", "find_gap", "solve_grid")
+
+BACKEND_CALLS = metrics.REGISTRY.counter(
+    "sakurafrp_recognition_backend_calls_total", "识别后端调用次数（按后端、方法和结果）",
+    ["backend", "method", "outcome"])
+BREAKER_OPEN = metrics.REGISTRY.gauge(
+    "sakurafrp_recognition_breaker_open", "识别后端熔断状态（1为已熔断）", ["backend"])
+
+
+class BackendUnavailable(Exception):
+    """后端无法处理本次请求（如缓存未命中、不支持），不计为故障"""
+
+
+class RecognitionBackend:
+    """识别后端接口
+
+    各方法返回值：
+      label_cells(row_img_bytes, row_index) -> (3个名称, 3个置信度)
+      identify_target(tip_img_bytes)        -> 题目物体名称
+      match(target, descriptions)           -> (序号列表, 置信度)
+      find_gap(bg_img_bytes)                -> (缺口x坐标, 置信度)
+      solve_grid(grid_img_bytes, target)    -> {descriptions, cell_confidences, click_indices, confidence}
+    不支持的方法保持 NotImplementedError 即可，路由会自动跳过。
+    """
+    name = "base"
+    cost = 0.0              # 每次调用的相对成本（API费用等）
+    expected_latency = 1.0  # 尚无统计数据时的预估延迟（秒）
+
+    def supports(self, method):
+        return getattr(type(self), method) is not getattr(RecognitionBackend, method)
+
+    def label_cells(self, row_img_bytes, row_index):
+        raise NotImplementedError
+
+    def identify_target(self, tip_img_bytes):
+        raise NotImplementedError
+
+    def match(self, target, descriptions):
+        raise NotImplementedError
+
+    def find_gap(self, bg_img_bytes):
+        raise NotImplementedError
+
+    def solve_grid(self, grid_img_bytes, target):
+        raise NotImplementedError
+
+    def warm_up(self):
+        """预先加载模型等耗时资源（默认无需预热）"""
+
+
+BACKENDS = {}
+
+
+def register_backend(name):
+    """注册识别后端类，供 RECOGNITION_BACKENDS 按名称启用"""
+    def decorator(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+@register_backend("zhipu")
+class ZhipuBackend(RecognitionBackend):
+    """智谱AI后端"""
+    cost = 1.0
+    expected_latency = 3.0
+
+    def __init__(self, ai_service=None, **kwargs):
+        if ai_service is None:
+            from ai_service import AIService
+            ai_service = AIService()
+        # 调用失败时抛出异常，交给路由做熔断和故障转移
+        ai_service.raise_errors = True
+        self.ai_service = ai_service
+
+    def label_cells(self, row_img_bytes, row_index):
+        return self.ai_service.identify_captcha_row_scored(row_img_bytes, row_index)
+
+    def identify_target(self, tip_img_bytes):
+        return self.ai_service.identify_target(tip_img_bytes)
+
+    def match(self, target, descriptions):
+        return self.ai_service.semantic_match_scored(target, descriptions)
+
+    def find_gap(self, bg_img_bytes):
+        gap_position = self.ai_service.identify_slider_gap(bg_img_bytes)
+        if gap_position <= 0:
+            raise BackendUnavailable("AI未识别到缺口")
+        # 大模型给出的像素坐标误差较大，置信度按较低值处理
+        return gap_position, 0.3
+
+
+@register_backend("cache")
+class CacheBackend(RecognitionBackend):
+    """本地结果缓存：相同图片/输入直接返回之前的识别结果"""
+    cost = 0.0
+    expected_latency = 0.001
+
+    def __init__(self, path=None, max_entries=5000, **kwargs):
+        self.path = Path(path or os.getenv("RECOGNITION_CACHE_FILE") or BASE_DIR / "recognition_cache.json")
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.dirty = False
+        try:
+            if self.path.exists():
+                self.entries.update(json.loads(self.path.read_text(encoding="utf-8")))
+        except Exception as e:
+            print(f"[WARNING] 读取识别缓存失败，将重新创建: {e}")
+
+    @staticmethod
+    def make_key(method, *args):
+        h = hashlib.sha256(method.encode("utf-8"))
+        for arg in args:
+            if isinstance(arg, (bytes, bytearray)):
+                h.update(bytes(arg))
+            else:
+                h.update(json.dumps(arg, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _get(self, method, *args):
+        key = self.make_key(method, *args)
+        with self.lock:
+            if key not in self.entries:
+                raise BackendUnavailable("缓存未命中")
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def store(self, method, args, result):
+        """保存其他后端的识别结果（只缓存有把握的结果）"""
+        if not self.supports(method):
+            return
+        if method == "label_cells" and "未知" in result[0]:
+            return
+        if method == "identify_target" and not result:
+            return
+        key = self.make_key(method, *args)
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def flush(self):
+        """写回磁盘"""
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps(self.entries, ensure_ascii=False)
+            self.dirty = False
+        try:
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            tmp_path.write_text(data, encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[WARNING] 保存识别缓存失败: {e}")
+
+    def label_cells(self, row_img_bytes, row_index):
+        labels, confidences = self._get("label_cells", row_img_bytes)
+        return list(labels), list(confidences)
+
+    def identify_target(self, tip_img_bytes):
+        return self._get("identify_target", tip_img_bytes)
+
+    def match(self, target, descriptions):
+        indices, confidence = self._get("match", target, descriptions)
+        return list(indices), confidence
+
+    def find_gap(self, bg_img_bytes):
+        gap_position, confidence = self._get("find_gap", bg_img_bytes)
+        return gap_position, confidence
+
+
+@register_backend("local")
+class LocalBackend(RecognitionBackend):
+    """本地CPU模型后端：滑块缺口使用 captcha-recognizer 识别"""
+    cost = 0.0
+    expected_latency = 0.5
+
+    def __init__(self, **kwargs):
+        pass
+
+    def warm_up(self):
+        from gap_detection import warm_up_gap_model
+        warm_up_gap_model()
+
+    def find_gap(self, bg_img_bytes):
+        from gap_detection import identify_gap_with_library_scored
+        gap_position, confidence = identify_gap_with_library_scored(bg_img_bytes)
+        if gap_position <= 0:
+            raise BackendUnavailable("captcha-recognizer 未识别到缺口")
+        return gap_position, confidence
+
+
+@register_backend("clip")
+class LocalClassifierBackend(RecognitionBackend):
+    """离线CPU格子分类器后端：九个格子一次批量推理（见 local_classifier.py）"""
+    cost = 0.0
+    expected_latency = 0.5
+
+    def __init__(self, **kwargs):
+        from local_classifier import get_classifier
+        self.classifier = get_classifier()
+
+    def identify_target(self, tip_img_bytes):
+        from grid_cells import load_grid_image
+        label, prob = self.classifier.classify([load_grid_image(tip_img_bytes)])[0]
+        if prob < 0.3:
+            raise BackendUnavailable(f"本地模型对题目图片没有把握（{label}: {prob:.2f}）")
+        return label
+
+    def solve_grid(self, grid_img_bytes, target):
+        from grid_cells import load_grid_image, crop_cells
+        result = self.classifier.solve(crop_cells(load_grid_image(grid_img_bytes)), target)
+        if result is None:
+            raise BackendUnavailable(f"题目【{target}】不在本地向量表中")
+        labels, confidences, click_indices = result
+        return {
+            "descriptions": labels,
+            "cell_confidences": confidences,
+            "click_indices": click_indices,
+            "confidence": min(confidences) if click_indices else 0.0,
+        }
+
+
+@register_backend("mock")
+class MockBackend(RecognitionBackend):
+    """模拟后端：返回固定结果，用于离线测试和路由验证"""
+    cost = 0.0
+    expected_latency = 0.01
+
+    def __init__(self, labels=("猫", "狗", "汽车"), target="猫", gap=120, latency=0.0, **kwargs):
+        self.labels = list(labels)
+        self.target = target
+        self.gap = gap
+        self.latency = latency
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def label_cells(self, row_img_bytes, row_index):
+        self._wait()
+        return list(self.labels), [0.9] * len(self.labels)
+
+    def identify_target(self, tip_img_bytes):
+        self._wait()
+        return self.target
+
+    def match(self, target, descriptions):
+        self._wait()
+        return [i + 1 for i, d in enumerate(descriptions) if d == target], 0.9
+
+    def find_gap(self, bg_img_bytes):
+        self._wait()
+        return self.gap, 0.9
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后熔断，冷却后放行一次试探请求（半开）"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.half_open = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def available(self):
+        """是否可以调用（无副作用）：未熔断，或冷却已结束且没有进行中的试探请求"""
+        if self.opened_at is None:
+            return True
+        return not self.half_open and time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def claim_probe(self):
+        """即将调用时占用调用机会：冷却结束后只放行一个试探请求（进入半开），返回是否可以调用"""
+        if not self.available():
+            return False
+        if self.opened_at is not None:
+            self.half_open = True
+        return True
+
+    def release_probe(self):
+        """试探请求没有得出成败（后端暂不可用）时退出半开，下次仍可试探"""
+        self.half_open = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.half_open = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.half_open or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.half_open = False
+
+
+class BackendStats:
+    """后端滚动统计：指数加权的延迟和错误率"""
+
+    def __init__(self, expected_latency, alpha=0.3):
+        self.alpha = alpha
+        self.latency = expected_latency
+        self.error_rate = 0.0
+        self.calls = 0
+
+    def record(self, latency, failed):
+        self.calls += 1
+        self.latency += self.alpha * (latency - self.latency)
+        self.error_rate += self.alpha * ((1.0 if failed else 0.0) - self.error_rate)
+
+
+class RecognitionRouter:
+    """识别路由：按滚动延迟、错误率和成本为每次请求挑选后端，失败时自动故障转移"""
+
+    def __init__(self, backends, cost_weight=None, error_weight=4.0, slow_call_seconds=None,
+                 failure_threshold=3, reset_timeout=30.0, logger=None):
+        self.backends = list(backends)
+        self.cost_weight = cost_weight if cost_weight is not None else float(os.getenv("RECOGNITION_COST_WEIGHT", "2.0"))
+        self.error_weight = error_weight
+        self.slow_call_seconds = slow_call_seconds if slow_call_seconds is not None else float(os.getenv("RECOGNITION_SLOW_CALL_SECONDS", "15"))
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.stats = {b.name: BackendStats(b.expected_latency) for b in self.backends}
+        self.breakers = {b.name: CircuitBreaker(failure_threshold, reset_timeout) for b in self.backends}
+        self.cache = next((b for b in self.backends if isinstance(b, CacheBackend)), None)
+
+    def score(self, backend):
+        """分数越低越优先：延迟 ×（1 + 错误率惩罚）+ 成本"""
+        stats = self.stats[backend.name]
+        return stats.latency * (1.0 + self.error_weight * stats.error_rate) + self.cost_weight * backend.cost
+
+    def supports(self, method):
+        """是否有后端支持该方法"""
+        return any(b.supports(method) for b in self.backends)
+
+    def candidates(self, method):
+        """按分数排序的可用后端；已熔断的后端直接跳过，不产生任何等待（不占用半开的试探机会）"""
+        with self.lock:
+            available = [b for b in self.backends if b.supports(method) and self.breakers[b.name].available()]
+            return sorted(available, key=self.score)
+
+    def _record(self, backend, method, outcome, elapsed):
+        failed = outcome in ("error", "slow")
+        with self.lock:
+            self.stats[backend.name].record(elapsed, failed)
+            breaker = self.breakers[backend.name]
+            if failed:
+                was_open = breaker.is_open
+                breaker.record_failure()
+                if breaker.is_open and not was_open:
+                    print(f"[WARNING] 识别后端 {backend.name} 已熔断，{breaker.reset_timeout:.0f} 秒内不再调用")
+                    if self.logger:
+                        self.logger.log_info(f"识别后端 {backend.name} 已熔断")
+            elif outcome == "ok":
+                breaker.record_success()
+            elif outcome == "unavailable":
+                breaker.release_probe()
+            BREAKER_OPEN.set(1 if breaker.is_open else 0, backend=backend.name)
+        BACKEND_CALLS.inc(backend=backend.name, method=method, outcome=outcome)
+
+    def dispatch(self, method, *args):
+        """依次尝试候选后端，返回第一个成功的结果；全部失败时抛出 BackendUnavailable"""
+        last_error = None
+        for backend in self.candidates(method):
+            # 熔断的后端冷却结束后，只有真正调用它时才占用试探机会（其他线程可能已在试探）
+            with self.lock:
+                if not self.breakers[backend.name].claim_probe():
+                    continue
+            start = time.monotonic()
+            try:
+                result = getattr(backend, method)(*args)
+            except BackendUnavailable as e:
+                self._record(backend, method, "unavailable", time.monotonic() - start)
+                last_error = e
+                continue
+            except Exception as e:
+                elapsed = time.monotonic() - start
+                print(f"[WARNING] 识别后端 {backend.name}.{method} 失败（{elapsed:.2f}s）: {e}")
+                self._record(backend, method, "error", elapsed)
+                last_error = e
+                continue
+            elapsed = time.monotonic() - start
+            # 成功但过慢也计入错误率，让路由在后端降级时尽快切走
+            self._record(backend, method, "slow" if elapsed > self.slow_call_seconds else "ok", elapsed)
+            if self.cache is not None and backend is not self.cache:
+                self.cache.store(method, args if method != "label_cells" else args[:1], result)
+            return result
+        raise BackendUnavailable(f"没有可用的识别后端处理 {method}: {last_error}")
+
+    def flush(self):
+        if self.cache is not None:
+            self.cache.flush()
+
+    def warm_up(self):
+        """预热所有后端（定时签到前的准备阶段调用）"""
+        for backend in self.backends:
+            start = time.monotonic()
+            try:
+                backend.warm_up()
+            except Exception as e:
+                print(f"[WARNING] 识别后端 {backend.name} 预热失败: {e}")
+                continue
+            print(f"[DEBUG] 识别后端 {backend.name} 预热完成，耗时 {time.monotonic() - start:.2f}s")
+
+    # ----- 与求解器对接的接口，全部后端失败时降级为空结果 -----
+    def label_cells(self, row_img_bytes, row_index):
+        try:
+            return self.dispatch("label_cells", row_img_bytes, row_index)
+        except BackendUnavailable as e:
+            print(f"[ERROR] {e}")
+            return ["未知", "未知", "未知"], [0.0, 0.0, 0.0]
+
+    def identify_target(self, tip_img_bytes):
+        try:
+            return self.dispatch("identify_target", tip_img_bytes)
+        except BackendUnavailable as e:
+            print(f"[ERROR] {e}")
+            return ""
+
+    def match(self, target, descriptions):
+        try:
+            return self.dispatch("match", target, descriptions)
+        except BackendUnavailable as e:
+            print(f"[ERROR] {e}")
+            return [], 0.0
+
+    def find_gap(self, bg_img_bytes):
+        try:
+            return self.dispatch("find_gap", bg_img_bytes)
+        except BackendUnavailable as e:
+            print(f"[ERROR] {e}")
+            return 0, 0.0
+
+    def solve_grid(self, grid_img_bytes, target):
+        """整格一次性求解，不可用时返回 None（由调用方回退到逐行识别）"""
+        try:
+            return self.dispatch("solve_grid", grid_img_bytes, target)
+        except BackendUnavailable as e:
+            print(f"[DEBUG] {e}")
+            return None
+
+
+class LazyRouter:
+    """延迟创建的识别路由：第一次调用识别方法时才执行 factory()（加载 AI SDK、模型等）
+
+    已签到等无需识别的流程不会产生任何初始化开销
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.router = None
+
+    @property
+    def loaded(self):
+        return self.router is not None
+
+    def _load(self):
+        if self.router is None:
+            self.router = self.factory()
+        return self.router
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def flush(self):
+        if self.router is not None:
+            self.router.flush()
+
+
+def build_router(ai_service=None, names=None, logger=None):
+    """按 RECOGNITION_BACKENDS（逗号分隔，默认 cache,local,zhipu）创建识别路由"""
+    if names is None:
+        names = os.getenv("RECOGNITION_BACKENDS", "cache,local,zhipu")
+    if isinstance(names, str):
+        names = [n.strip() for n in names.split(",") if n.strip()]
+
+    backends = []
+    for name in names:
+        cls = BACKENDS.get(name)
+        if cls is None:
+            print(f"[WARNING] 未知的识别后端: {name}（可选: {', '.join(BACKENDS)}）")
+            continue
+        try:
+            if cls is ZhipuBackend:
+                if ai_service is None:
+                    continue
+                backends.append(cls(ai_service=ai_service))
+            else:
+                backends.append(cls())
+        except Exception as e:
+            print(f"[WARNING] 识别后端 {name} 初始化失败，已跳过: {e}")
+            if logger:
+                logger.log_error(f"识别后端 {name} 初始化失败: {e}")
+
+    print(f"[DEBUG] 已启用识别后端: {[b.name for b in backends]}")
+    return RecognitionRouter(backends, logger=logger)
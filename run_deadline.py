@@ -0,0 +1,212 @@
+"""
+运行期限与卡死看门狗
+
+整次运行有总期限（RUN_DEADLINE_SECONDS），各阶段有各自的预算（PHASE_BUDGETS）。
+看门狗线程发现超时后：记录所有线程的调用栈，结束浏览器和 Playwright 驱动进程
+（使卡住的 Playwright 调用在主线程中抛出异常，流程随即收尾），
+若主线程在宽限期内仍未结束，则直接以 EXIT_DEADLINE 退出进程，保证单次运行的最长耗时有上限
+（守护进程模式下 hard_exit=False，不退出进程，只记录结果）。
+异步流程中各账号共用一个浏览器，不使用看门狗线程：由事件循环定期调用 check()，超时时 expire() 并取消该账号的任务。
+"""
+
+import os
+import sys
+import time
+import signal
+import threading
+import traceback
+import metrics
+
+# 与 coreutils timeout 一致
+EXIT_DEADLINE = 124
+
+# 各阶段默认预算（秒），prewarm_wait 为等待计划时间，不计入期限
+DEFAULT_PHASE_BUDGETS = {
+    "launch": 60, "navigate": 45, "login": 45, "sign_check": 30, "prewarm": 60,
+    "captcha_wait": 60, "captcha": 180, "screenshot": 20,
+}
+EXEMPT_PHASES = ("prewarm_wait",)
+
+WATCHDOG_FIRED = metrics.REGISTRY.counter(
+    "sakurafrp_watchdog_fired_total", "看门狗因超时中止运行的次数（按超时的阶段）", ["phase"])
+
+
+def parse_budgets(spec):
+    """解析 PHASE_BUDGETS，例如 navigate=30,captcha=120"""
+    budgets = dict(DEFAULT_PHASE_BUDGETS)
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        phase, _, value = item.partition("=")
+        try:
+            budgets[phase.strip()] = float(value)
+        except ValueError:
+            print(f"[WARNING] 无效的阶段预算配置: {item}")
+    return budgets
+
+
+def thread_stacks():
+    """所有线程当前的调用栈（诊断用）"""
+    names = {t.ident: t.name for t in threading.enumerate()}
+    parts = []
+    for ident, frame in sys._current_frames().items():
+        parts.append(f"--- 线程 {names.get(ident, ident)} ---\n" + "".join(traceback.format_stack(frame)))
+    return "\n".join(parts)
+
+
+def descendants(pid):
+    """Linux 下通过 /proc 查找 pid 的全部子孙进程"""
+    children = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                # 进程名可能包含空格和括号，从最后一个 ')' 之后解析
+                fields = f.read().rsplit(b")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    result, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+def kill_child_processes():
+    """结束本进程的所有子孙进程（浏览器、Playwright 驱动），返回结束的进程数"""
+    killed = 0
+    for pid in descendants(os.getpid()):
+        try:
+            os.kill(pid, signal.SIGKILL)
+            killed += 1
+        except OSError:
+            pass
+    return killed
+
+
+class RunWatchdog:
+    """运行期限看门狗
+
+    on_phase(phase) 由 PhaseTimer 在切换阶段时调用；on_expire(原因, 调用栈) 在超时时于看门狗线程中调用，
+    before_exit(原因) 在宽限期结束、即将强制退出前调用（用于保存诊断信息和记录结果）；
+    hard_exit 为 False 时宽限期结束后只调用 before_exit，不退出进程（守护进程模式）
+    """
+
+    def __init__(self, deadline=None, budgets=None, grace=None, on_expire=None, before_exit=None, poll_interval=0.5,
+                 hard_exit=True):
+        self.deadline = deadline if deadline is not None else float(os.getenv("RUN_DEADLINE_SECONDS", "300"))
+        self.budgets = budgets if budgets is not None else parse_budgets(os.getenv("PHASE_BUDGETS"))
+        self.grace = grace if grace is not None else float(os.getenv("WATCHDOG_GRACE_SECONDS", "15"))
+        self.on_expire = on_expire
+        self.before_exit = before_exit
+        self.poll_interval = poll_interval
+        self.hard_exit = hard_exit
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.thread = None
+        self.expired = None
+        self.phase = None
+        self.phase_deadline = None
+        self.run_deadline = None
+        self.paused_at = None
+
+    @property
+    def enabled(self):
+        """RUN_DEADLINE_SECONDS=0 时关闭看门狗（总期限和阶段预算都不检查）"""
+        return self.deadline > 0
+
+    def arm(self):
+        """开始计时但不启动看门狗线程（由调用方定期调用 check()），返回是否启用"""
+        if not self.enabled:
+            return False
+        self.run_deadline = time.monotonic() + self.deadline
+        return True
+
+    def start(self):
+        if self.arm():
+            self.thread = threading.Thread(target=self._loop, name="watchdog", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.finished.set()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def on_phase(self, phase):
+        """阶段切换：设置新阶段的预算；不计入期限的阶段暂停计时"""
+        now = time.monotonic()
+        with self.lock:
+            if self.paused_at is not None and self.run_deadline is not None:
+                self.run_deadline += now - self.paused_at
+                self.paused_at = None
+            self.phase = phase
+            self.phase_deadline = None
+            if phase in EXEMPT_PHASES:
+                self.paused_at = now
+            elif phase in self.budgets and self.budgets[phase] > 0:
+                self.phase_deadline = now + self.budgets[phase]
+
+    def check(self):
+        """返回超时原因，未超时时返回 None"""
+        now = time.monotonic()
+        with self.lock:
+            if self.paused_at is not None:
+                return None
+            if self.phase_deadline is not None and now >= self.phase_deadline:
+                return f"阶段 {self.phase} 超过预算 {self.budgets[self.phase]:g} 秒"
+            if self.run_deadline is not None and now >= self.run_deadline:
+                return f"运行超过总期限 {self.deadline:g} 秒（当前阶段 {self.phase}）"
+        return None
+
+    def _loop(self):
+        while not self.finished.wait(self.poll_interval):
+            reason = self.check()
+            if reason:
+                self._fire(reason)
+                return
+
+    def expire(self, reason, stacks=None):
+        """标记超时：计数并调用 on_expire（stacks 默认为所有线程的调用栈）"""
+        self.expired = reason
+        WATCHDOG_FIRED.inc(phase=self.phase or "unknown")
+        print(f"[ERROR] 看门狗: {reason}，中止本次运行")
+        if self.on_expire:
+            try:
+                self.on_expire(reason, stacks if stacks is not None else thread_stacks())
+            except Exception as e:
+                print(f"[WARNING] 看门狗回调失败: {e}")
+
+    def _fire(self, reason):
+        self.expire(reason)
+
+        # 结束浏览器和驱动进程，卡住的 Playwright 调用会立即抛出异常
+        killed = kill_child_processes() if os.name == "posix" else 0
+        print(f"[INFO] 看门狗已结束 {killed} 个子进程，等待流程收尾（最多 {self.grace:g} 秒）")
+        if self.finished.wait(self.grace):
+            return
+
+        if self.hard_exit:
+            print(f"[ERROR] 看门狗: 流程在宽限期内未结束，强制退出（退出码 {EXIT_DEADLINE}）")
+        else:
+            print("[ERROR] 看门狗: 流程在宽限期内未结束，记录超时结果（守护进程模式，不退出进程）")
+        if self.before_exit:
+            try:
+                self.before_exit(reason)
+            except Exception as e:
+                print(f"[WARNING] 看门狗退出前回调失败: {e}")
+        if self.hard_exit:
+            sys.stdout.flush()
+            os._exit(EXIT_DEADLINE)
@@ -0,0 +1,189 @@
+"""
+守护进程模式（python main.py --daemon）
+
+替代 cron 每分钟轮询 run_checkin.sh 的方式：进程内每天在 SCHEDULE_TIME ±30 分钟内抽取一个秒级随机时间，
+按单调时钟休眠到该时间后直接执行签到。配置 PREWARM_LEAD_SECONDS 后会提前启动浏览器、登录并预热模型，
+到点时只剩点击签到和处理验证码。与脚本方式一样使用 .executed_YYYY-MM-DD.lock 标记当天已执行，
+并通过文件锁保证同一目录只运行一个守护进程。
+"""
+
+import os
+import time
+import random
+from datetime import datetime, date, timedelta
+from pathlib import Path
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows 无 fcntl
+    fcntl = None
+
+BASE_DIR = Path(__file__).resolve().parent
+DAEMON_LOCK_FILE = BASE_DIR / ".daemon.lock"
+
+# 单次休眠的最长时间：定期醒来核对墙上时间，系统休眠或调整时钟后也不会错过执行时间
+MAX_SLEEP_CHUNK = 60.0
+
+NEXT_RUN = metrics.REGISTRY.gauge(
+    "sakurafrp_daemon_next_run_timestamp_seconds", "守护进程下一次计划执行时间")
+
+
+def parse_schedule_time(value):
+    """解析 HH:MM 格式的时间，返回 (小时, 分钟)"""
+    try:
+        hour, minute = (int(part) for part in value.strip().split(":"))
+    except (AttributeError, ValueError):
+        raise ValueError(f"SCHEDULE_TIME 格式错误（应为 HH:MM）: {value!r}")
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"SCHEDULE_TIME 超出范围: {value!r}")
+    return hour, minute
+
+
+def draw_run_time(day, schedule_time, window_minutes=30, earliest=None, rng=random):
+    """在 day 当天 SCHEDULE_TIME ±window_minutes 分钟内随机抽取执行时间（精确到秒）
+
+    与 generate_random_time.sh 一致：窗口限制在当天 00:00 - 23:59 内。
+    给出 earliest 时只在其之后抽取（守护进程在窗口中途启动的情况），窗口已过则返回 None
+    """
+    hour, minute = parse_schedule_time(schedule_time)
+    midnight = datetime.combine(day, datetime.min.time())
+    center = hour * 60 + minute
+    start = midnight + timedelta(minutes=max(0, center - window_minutes))
+    end = midnight + timedelta(minutes=min(1439, center + window_minutes), seconds=59)
+    if earliest is not None:
+        if earliest > end:
+            return None
+        start = max(start, earliest.replace(microsecond=0))
+    return start + timedelta(seconds=rng.randint(0, int((end - start).total_seconds())))
+
+
+def executed_marker(day):
+    """当天已执行标记（与 run_checkin.sh 共用）"""
+    return BASE_DIR / f".executed_{day.isoformat()}.lock"
+
+
+def sleep_until(target):
+    """休眠到墙上时间 target
+
+    按单调时钟分段休眠（不受时钟调整影响），每段结束后重新核对墙上时间
+    """
+    while True:
+        remaining = (target - datetime.now()).total_seconds()
+        if remaining <= 0:
+            return
+        deadline = time.monotonic() + min(remaining, MAX_SLEEP_CHUNK)
+        left = deadline - time.monotonic()
+        while left > 0:
+            time.sleep(left)
+            left = deadline - time.monotonic()
+
+
+class DaemonLock:
+    """守护进程文件锁：同一目录只允许一个守护进程运行"""
+
+    def __init__(self, path=DAEMON_LOCK_FILE):
+        self.path = Path(path)
+        self.file = None
+
+    def acquire(self):
+        if fcntl is None:
+            print("[WARNING] 当前平台不支持文件锁，无法防止多个守护进程同时运行")
+            return True
+        self.file = open(self.path, "a+", encoding="utf-8")
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.file.close()
+            self.file = None
+            return False
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(os.getpid()))
+        self.file.flush()
+        return True
+
+    def release(self):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+
+def run_day(day, run_once, schedule_time, max_retries=2, retry_delay=600, lead_seconds=0, rng=random):
+    """执行某一天的签到：抽取时间、休眠、执行，失败时按间隔重试
+
+    lead_seconds > 0 时提前这么多秒调用 run_once(start_at=计划时间)，由签到流程完成准备后等到计划时间
+    """
+    marker = executed_marker(day)
+    if marker.exists():
+        print(f"[INFO] {day} 已执行过签到，跳过")
+        return None
+
+    run_at = draw_run_time(day, schedule_time, earliest=datetime.now(), rng=rng)
+    if run_at is None:
+        print(f"[INFO] {day} 的执行时间窗口已过，跳过")
+        return None
+    NEXT_RUN.set(run_at.timestamp())
+    print(f"[INFO] {day} 的随机执行时间: {run_at:%H:%M:%S}")
+    start_at = None
+    if lead_seconds > 0:
+        print(f"[INFO] 将提前 {lead_seconds:g} 秒开始准备")
+        start_at = run_at
+        run_at = run_at - timedelta(seconds=lead_seconds)
+    sleep_until(run_at)
+
+    outcome = None
+    for attempt in range(max_retries + 1):
+        marker.write_text(datetime.now().strftime("%H:%M:%S"), encoding="utf-8")
+        print(f"[INFO] 当前时间 {datetime.now():%H:%M:%S}，开始执行签到（第 {attempt + 1} 次）...")
+        try:
+            # 只有第一次按计划时间预热，重试时立即执行
+            outcome = run_once(start_at=start_at) if attempt == 0 and start_at else run_once()
+        except Exception as e:
+            print(f"[ERROR] 签到执行异常: {e}")
+            outcome = "error"
+        if outcome in ("success", "already_signed"):
+            break
+        # 与 run_checkin.sh 一致：失败时删除标记，允许重试
+        if marker.exists():
+            marker.unlink()
+        if attempt < max_retries:
+            print(f"[WARNING] 签到结果: {outcome}，{retry_delay} 秒后重试")
+            time.sleep(retry_delay)
+    print(f"[INFO] {day} 签到结果: {outcome}")
+    return outcome
+
+
+def run_daemon(run_once, schedule_time=None):
+    """守护进程主循环，run_once(start_at=None) 执行一次签到并返回结果"""
+    schedule_time = schedule_time or os.getenv("SCHEDULE_TIME", "")
+    try:
+        parse_schedule_time(schedule_time)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
+
+    lock = DaemonLock()
+    if not lock.acquire():
+        print(f"[ERROR] 已有守护进程在运行（锁文件: {lock.path}）")
+        return 1
+
+    port = os.getenv("METRICS_PORT", "").strip()
+    if port:
+        metrics.start_http_server(int(port))
+
+    max_retries = int(os.getenv("DAEMON_MAX_RETRIES", "2"))
+    retry_delay = float(os.getenv("DAEMON_RETRY_DELAY", "600"))
+    lead_seconds = float(os.getenv("PREWARM_LEAD_SECONDS", "120"))
+    print(f"[INFO] 守护进程已启动（PID {os.getpid()}），计划时间 {schedule_time} ±30分钟")
+    try:
+        day = date.today()
+        while True:
+            run_day(day, run_once, schedule_time, max_retries, retry_delay, lead_seconds)
+            day = max(day + timedelta(days=1), date.today())
+    except KeyboardInterrupt:
+        print("[INFO] 守护进程已停止")
+        return 0
+    finally:
+        lock.release()
@@ -0,0 +1,138 @@
+"""
+验证码元素选择器顺序缓存
+
+极验元素的候选选择器按固定顺序逐个探测时，排在前面但已失效的选择器每次都要白白等待超时。
+这里按站点记录每组选择器的命中/未命中统计：上次命中的选择器优先尝试，连续多次未命中的选择器自动排到最后。
+统计保存在 selector_cache.json（路径可用 SELECTOR_CACHE_FILE 修改）。
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+import metrics
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 连续未命中达到该次数后降级到末尾
+DEMOTE_AFTER = 3
+
+SELECTOR_PROBES = metrics.REGISTRY.counter(
+    "sakurafrp_selector_probes_total", "验证码元素选择器探测次数（按选择器组和结果）", ["group", "outcome"])
+
+
+def site_of(page):
+    """页面所属站点（用于区分不同站点的选择器统计）"""
+    try:
+        return urlparse(page.url).netloc or "unknown"
+    except Exception:
+        return "unknown"
+
+
+class SelectorCache:
+    """按 站点/选择器组/选择器 记录命中统计，并给出探测顺序"""
+
+    def __init__(self, path=None, demote_after=DEMOTE_AFTER):
+        self.path = Path(path or os.getenv("SELECTOR_CACHE_FILE") or BASE_DIR / "selector_cache.json")
+        self.demote_after = demote_after
+        self.lock = threading.Lock()
+        self.sites = {}
+        self.dirty = False
+        try:
+            if self.path.exists():
+                self.sites = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"[WARNING] 读取选择器缓存失败，将重新创建: {e}")
+
+    def _stats(self, page, group):
+        return self.sites.setdefault(site_of(page), {}).setdefault(group, {})
+
+    def ordered(self, page, group, selectors):
+        """返回探测顺序：最近命中的在前，从未命中的保持原顺序，连续未命中的排到最后"""
+        with self.lock:
+            stats = self._stats(page, group)
+
+        def key(item):
+            index, selector = item
+            s = stats.get(selector, {})
+            demoted = s.get("streak", 0) >= self.demote_after
+            return (demoted, -s.get("last_hit", 0.0), index)
+
+        return [selector for _, selector in sorted(enumerate(selectors), key=key)]
+
+    def record(self, page, group, selector, hit):
+        """记录一次探测结果"""
+        with self.lock:
+            s = self._stats(page, group).setdefault(selector, {"hits": 0, "misses": 0, "streak": 0, "last_hit": 0.0})
+            if hit:
+                s["hits"] += 1
+                s["streak"] = 0
+                s["last_hit"] = time.time()
+            else:
+                s["misses"] += 1
+                s["streak"] += 1
+            self.dirty = True
+        SELECTOR_PROBES.inc(group=group, outcome="hit" if hit else "miss")
+
+    def find(self, page, group, selectors, timeout=1000):
+        """按学习到的顺序探测，返回第一个可见元素的 (locator, selector)，都不可见时返回 (None, None)"""
+        for selector in self.ordered(page, group, selectors):
+            try:
+                locator = page.locator(selector).first
+                visible = locator.is_visible(timeout=timeout)
+            except Exception:
+                visible = False
+            self.record(page, group, selector, visible)
+            if visible:
+                return locator, selector
+        return None, None
+
+    def flush(self):
+        """写回磁盘"""
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps(self.sites, ensure_ascii=False, indent=2)
+            self.dirty = False
+        try:
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            tmp_path.write_text(data, encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[WARNING] 保存选择器缓存失败: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_selector_cache():
+    """进程内共享的选择器缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SelectorCache()
+        return _cache
+
+
+def main():
+    """打印各站点选择器的命中统计"""
+    cache = SelectorCache()
+    if not cache.sites:
+        print("[INFO] 暂无选择器统计")
+        return 0
+    for site, groups in cache.sites.items():
+        print(f"{site}")
+        for group, stats in groups.items():
+            print(f"  {group}")
+            for selector, s in sorted(stats.items(), key=lambda item: -item[1].get("last_hit", 0.0)):
+                flag = "（已降级）" if s.get("streak", 0) >= cache.demote_after else ""
+                print(f"    {selector:<40} 命中 {s.get('hits', 0):>4}  未命中 {s.get('misses', 0):>4}{flag}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
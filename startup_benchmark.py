@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准
+
+在独立子进程中多次执行 python -X importtime -c "import main" 和 python main.py --help，
+统计导入耗时（取中位数）并列出最慢的模块，与 startup_budget.json 中的预算比较，超出预算时返回非零退出码。
+
+运行方式:
+  python startup_benchmark.py              # 对照预算检查
+  python startup_benchmark.py --runs 10 --top 15
+  python startup_benchmark.py --update     # 以本次结果（加余量）更新预算文件
+"""
+
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+BUDGET_FILE = BASE_DIR / "startup_budget.json"
+
+# 这些模块只应在真正需要时加载，出现在 import main 的导入链中即视为回退
+FORBIDDEN_MODULES = ("zhipuai", "playwright", "numpy", "PIL", "pytweening", "asyncio")
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 {模块名: 累计耗时(秒)}（同名模块取首次导入）"""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            cum_us = int(parts[1].strip())
+        except ValueError:
+            continue  # 表头
+        cumulative.setdefault(parts[2].strip(), cum_us / 1e6)
+    return cumulative
+
+
+def measure_import(module="main"):
+    """在子进程中导入 module，返回 {模块名: 累计耗时}；module 为 None 时只启动解释器"""
+    code = f"import {module}" if module else "pass"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BASE_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def measure_help():
+    """python main.py --help 的墙上耗时（含解释器启动）"""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "main.py", "--help"], cwd=BASE_DIR, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"main.py --help 执行失败:\n{proc.stderr[-2000:]}")
+    return elapsed
+
+
+def run_benchmark(runs=5):
+    """多次测量，返回 (import main 中位数, --help 中位数, 各模块累计耗时中位数)"""
+    # 解释器启动时就会导入的模块（site 等）不计入
+    preloaded = set(measure_import(None))
+    samples = [measure_import() for _ in range(runs)]
+    help_times = [measure_help() for _ in range(runs)]
+    modules = {}
+    for name in samples[0]:
+        if name in preloaded:
+            continue
+        modules[name] = statistics.median(s.get(name, 0.0) for s in samples)
+    return modules.get("main", 0.0), statistics.median(help_times), modules
+
+
+def load_budget(path=BUDGET_FILE):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+def check_budget(import_time, help_time, modules, budget):
+    """返回超出预算的说明列表（为空表示通过）"""
+    problems = []
+    if budget.get("import_main_seconds") is not None and import_time > budget["import_main_seconds"]:
+        problems.append(f"import main 耗时 {import_time * 1000:.0f}ms，超出预算 {budget['import_main_seconds'] * 1000:.0f}ms")
+    if budget.get("help_seconds") is not None and help_time > budget["help_seconds"]:
+        problems.append(f"main.py --help 耗时 {help_time * 1000:.0f}ms，超出预算 {budget['help_seconds'] * 1000:.0f}ms")
+    for name in budget.get("forbidden_modules", FORBIDDEN_MODULES):
+        if name in modules:
+            problems.append(f"启动时导入了 {name}（{modules[name] * 1000:.0f}ms），应改为按需导入")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量 main.py 的启动耗时并与预算比较")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数（取中位数）")
+    parser.add_argument("--top", type=int, default=10, help="列出最慢的模块数")
+    parser.add_argument("--update", action="store_true", help="以本次结果的 1.5 倍更新预算文件")
+    args = parser.parse_args()
+
+    import_time, help_time, modules = run_benchmark(max(1, args.runs))
+    print(f"import main:        {import_time * 1000:7.1f} ms")
+    print(f"main.py --help:     {help_time * 1000:7.1f} ms（含解释器启动）")
+    print(f"\n最慢的 {args.top} 个模块（累计耗时）:")
+    top = sorted((item for item in modules.items() if item[0] != "main"), key=lambda item: item[1], reverse=True)
+    for name, seconds in top[:args.top]:
+        print(f"  {seconds * 1000:7.1f} ms  {name}")
+
+    if args.update:
+        budget = load_budget()
+        budget.update({
+            "import_main_seconds": round(import_time * 1.5, 3),
+            "help_seconds": round(help_time * 1.5, 3),
+            "forbidden_modules": list(budget.get("forbidden_modules", FORBIDDEN_MODULES)),
+        })
+        BUDGET_FILE.write_text(json.dumps(budget, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"\n[INFO] 已更新预算文件: {BUDGET_FILE}")
+        return 0
+
+    problems = check_budget(import_time, help_time, modules, load_budget())
+    if problems:
+        print()
+        for problem in problems:
+            print(f"[ERROR] {problem}")
+        return 1
+    print("\n[INFO] 启动耗时在预算内")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
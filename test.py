@@ -103,11 +103,13 @@ def test_files():
     files_to_check = {
         "main.py": "主程序文件",
         "ai_service.py": "AI服务模块",
+        "mock_zhipu_server.py": "模拟API服务器",
         "logger.py": "日志模块",
         "requirements.txt": "依赖列表",
         "generate_random_time.sh": "抽签脚本",
         "run_checkin.sh": "执行脚本",
         "env.example": "环境变量示例",
+        "startup_budget.json": "启动耗时预算",
     }
     
     all_exist = True
@@ -399,6 +401,132 @@ def test_zhipu_api():
     
     return True
 
+def test_mock_api():
+    """使用本地模拟服务器测试AIService（不消耗API配额）"""
+    print_test_header("模拟API测试")
+    
+    try:
+        from mock_zhipu_server import MockZhipuServer
+        from ai_service import AIService
+    except ImportError as e:
+        print_result(False, f"模块导入失败: {e}")
+        return False
+    
+    # AIService 要求配置API Key，模拟服务器不校验，临时填入占位值
+    old_key = os.environ.get("ZHIPU_API_KEY")
+    if not old_key or old_key == "your_api_key_here":
+        os.environ["ZHIPU_API_KEY"] = "mock.key"
+    
+    script = [
+        {"match": "包含3个格子", "content": "识别结果：[\"苹果\", \"香蕉\", \"苹果\"]"},
+        {"match": "题目是", "content": "[1, 3]"},
+    ]
+    try:
+        with MockZhipuServer(script=script, latency="uniform:0.01,0.05", seed=1) as server:
+            print(f"  模拟服务器地址: {server.base_url}")
+            ai_service = AIService(base_url=server.base_url)
+            
+            row = ai_service.identify_captcha_row(b"fake-image", 1)
+            if row == ["苹果", "香蕉", "苹果"]:
+                print_result(True, f"行识别解析正常: {row}")
+            else:
+                print_result(False, f"行识别结果不正确: {row}")
+                return False
+            
+            indices = ai_service.semantic_match("苹果", row * 3)
+            if indices == [1, 3]:
+                print_result(True, f"语义裁决解析正常: {indices}")
+            else:
+                print_result(False, f"语义裁决结果不正确: {indices}")
+                return False
+            
+            if server.stats["requests"] == 2 and server.requests[0]["images"] == 1:
+                print_result(True, f"请求统计正常: {server.stats}")
+            else:
+                print_result(False, f"请求统计异常: {server.stats}")
+                return False
+        
+        # 全部返回429时应降级为“未知”，而不是抛出异常
+        with MockZhipuServer(rate_429=1.0, retry_after=0) as server:
+            ai_service = AIService(base_url=server.base_url)
+            ai_service.max_retries = 0
+            row = ai_service.identify_captcha_row(b"fake-image", 1)
+            if row == ["未知", "未知", "未知"] and server.stats["429"] >= 1:
+                print_result(True, "429限流注入与降级处理正常")
+            else:
+                print_result(False, f"429处理异常: {row}, {server.stats}")
+                return False
+        
+        return True
+    except Exception as e:
+        print_result(False, f"模拟API测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        if old_key is None:
+            os.environ.pop("ZHIPU_API_KEY", None)
+        else:
+            os.environ["ZHIPU_API_KEY"] = old_key
+
+def test_ai_cassette():
+    """测试AI磁带：对模拟服务器录制后离线回放，回复和耗时应与录制时一致"""
+    print_test_header("AI磁带录制/回放")
+    
+    try:
+        import time
+        import tempfile
+        from cassette import Cassette, CassetteMiss, RECORD, REPLAY, request_key
+        from mock_zhipu_server import MockZhipuServer
+        from ai_service import AIService
+    except ImportError as e:
+        print_result(False, f"模块导入失败: {e}")
+        return False
+    
+    old_key = os.environ.get("ZHIPU_API_KEY")
+    if not old_key or old_key == "your_api_key_here":
+        os.environ["ZHIPU_API_KEY"] = "mock.key"
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "cassette.jsonl"
+            with MockZhipuServer(latency="fixed:0.2") as server:
+                ai_service = AIService(base_url=server.base_url)
+                ai_service.cassette = Cassette(path=path, mode=RECORD)
+                recorded = (ai_service.identify_captcha_row(b"fake-image", 1), ai_service.semantic_match("猫", ["猫", "狗", "汽车"]))
+            print_result(True, f"录制 {len(path.read_text(encoding='utf-8').splitlines())} 条: {recorded}")
+            
+            # 服务器已关闭，回放不访问网络；耗时缩放为 0.5 时应约为录制时的一半
+            ai_service.cassette = Cassette(path=path, mode=REPLAY, latency_scale=0.5)
+            start = time.monotonic()
+            replayed = (ai_service.identify_captcha_row(b"fake-image", 1), ai_service.semantic_match("猫", ["猫", "狗", "汽车"]))
+            elapsed = time.monotonic() - start
+            if replayed != recorded:
+                print_result(False, f"回放结果与录制不一致: {replayed}")
+                return False
+            if not 0.15 <= elapsed < 0.4:
+                print_result(False, f"回放耗时异常: {elapsed:.2f}s（预期约 0.2s）")
+                return False
+            print_result(True, f"回放结果一致，耗时 {elapsed:.2f}s（录制约 0.4s，缩放 0.5）")
+            
+            try:
+                ai_service.cassette.replay(request_key(ai_service.model_text, [{"role": "user", "content": "未录制的请求"}]))
+                print_result(False, "未录制的请求没有报错")
+                return False
+            except CassetteMiss:
+                print_result(True, "未录制的请求抛出 CassetteMiss")
+        return True
+    except Exception as e:
+        print_result(False, f"AI磁带测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        if old_key is None:
+            os.environ.pop("ZHIPU_API_KEY", None)
+        else:
+            os.environ["ZHIPU_API_KEY"] = old_key
+
 def test_scheduled_script():
     """测试定时执行脚本"""
     print_test_header("定时执行脚本检查")
@@ -518,6 +646,24 @@ def test_dependencies():
         print_result(False, f"依赖检查失败: {e}")
         return False
 
+def test_startup_budget():
+    """测试启动耗时是否在预算内（startup_budget.json）"""
+    print_test_header("启动耗时")
+    
+    try:
+        import startup_benchmark
+        import_time, help_time, modules = startup_benchmark.run_benchmark(runs=3)
+        print(f"import main: {import_time * 1000:.1f}ms，main.py --help: {help_time * 1000:.1f}ms")
+        problems = startup_benchmark.check_budget(import_time, help_time, modules, startup_benchmark.load_budget())
+        for problem in problems:
+            print_result(False, problem)
+        if not problems:
+            print_result(True, "启动耗时在预算内")
+        return not problems
+    except Exception as e:
+        print_result(False, f"启动耗时测试失败: {e}")
+        return False
+
 def main():
     """主测试函数"""
     print("\n" + "="*60)
@@ -547,8 +693,11 @@ def main():
         ("日志模块", test_logger),
         ("AI服务模块", test_ai_service),
         ("智谱AI API", test_zhipu_api),
+        ("模拟API", test_mock_api),
+        ("AI磁带", test_ai_cassette),
         ("定时脚本", test_scheduled_script),
         ("依赖检查", test_dependencies),
+        ("启动耗时", test_startup_budget),
     ]
     
     results = []
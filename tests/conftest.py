@@ -0,0 +1,144 @@
+"""
+性能回归测试的 benchmark 夹具
+
+每个基准先按调用耗时确定每轮循环次数，重复多轮取每次调用的最短耗时；
+结果除以会话开始时测得的参考负载耗时（纯 Python 循环），得到与机器快慢基本无关的相对值，
+与 tests/perf_baselines.json 中保存的基线比较，超过 基线 × (1 + PERF_TOLERANCE) 时测试失败。
+
+  python -m pytest tests                       # 对照基线检查
+  python -m pytest tests --update-baselines    # 以本次结果更新基线文件
+  PERF_TOLERANCE=1 python -m pytest tests      # 放宽容差（默认 0.5，即慢 50% 以内不算回退）
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import warnings
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+BASELINE_FILE = Path(__file__).resolve().parent / "perf_baselines.json"
+
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+# 每轮至少运行该秒数，避免计时器精度影响很快的函数
+MIN_ROUND_SECONDS = 0.02
+
+
+def _reference_workload():
+    total = 0
+    for i in range(20000):
+        total += i * i % 7
+    return total
+
+
+def _time_rounds(func, rounds, setup=None):
+    """返回每次调用的最短耗时（秒）和最后一次调用的返回值"""
+    result = None
+    if setup is None:
+        loops = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(loops):
+                result = func()
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_ROUND_SECONDS:
+                break
+            loops *= 2 if elapsed * 10 >= MIN_ROUND_SECONDS else 10
+    best = None
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            if setup is None:
+                start = time.perf_counter()
+                for _ in range(loops):
+                    result = func()
+                per_call = (time.perf_counter() - start) / loops
+            else:
+                setup()
+                start = time.perf_counter()
+                result = func()
+                per_call = time.perf_counter() - start
+            best = per_call if best is None else min(best, per_call)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best, result
+
+
+def _load_baselines():
+    try:
+        return json.loads(BASELINE_FILE.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+def pytest_addoption(parser):
+    parser.addoption("--update-baselines", action="store_true", help="以本次测量结果更新 tests/perf_baselines.json")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "perf: 性能回归基准（对照 tests/perf_baselines.json）")
+    config._perf_results = {}
+
+
+@pytest.fixture(scope="session")
+def reference_seconds():
+    """参考负载的耗时，用于把结果换算为与机器快慢无关的相对值"""
+    seconds, _ = _time_rounds(_reference_workload, rounds=15)
+    return seconds
+
+
+@pytest.fixture
+def benchmark(request, reference_seconds):
+    """benchmark(func, setup=None, rounds=None)：测量 func() 并对照基线，返回最后一次调用的结果
+
+    setup 不为 None 时每轮先调用 setup()（不计时），再调用一次 func()，适合会修改状态的函数
+    """
+    config = request.config
+    name = request.node.name
+    tolerance = float(os.getenv("PERF_TOLERANCE", "0.5"))
+
+    def run(func, setup=None, rounds=None):
+        rounds = rounds or int(os.getenv("PERF_ROUNDS", "7"))
+        seconds, result = _time_rounds(func, rounds, setup)
+        relative = seconds / reference_seconds
+        config._perf_results[name] = {"seconds": seconds, "relative": relative}
+        if config.getoption("update_baselines"):
+            return result
+        baseline = _load_baselines().get(name)
+        if baseline is None:
+            warnings.warn(f"{name} 没有基线，请运行 python -m pytest tests --update-baselines")
+            return result
+        limit = baseline["relative"] * (1 + tolerance)
+        assert relative <= limit, (
+            f"{name} 性能回退：{seconds * 1000:.3f}ms（相对值 {relative:.2f}），"
+            f"基线 {baseline['relative']:.2f}，容差 {tolerance:.0%}")
+        return result
+
+    return run
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    results = getattr(config, "_perf_results", None)
+    if not results:
+        return
+    baselines = _load_baselines()
+    terminalreporter.section("性能基准")
+    for name, result in sorted(results.items()):
+        baseline = baselines.get(name)
+        change = f"{result['relative'] / baseline['relative'] - 1:+.0%}" if baseline else "无基线"
+        terminalreporter.write_line(
+            f"{name:<48}{result['seconds'] * 1000:>10.3f}ms  相对值 {result['relative']:>9.2f}  {change}")
+    if config.getoption("update_baselines"):
+        baselines.update({name: {"relative": round(r["relative"], 3), "seconds": round(r["seconds"], 6)}
+                          for name, r in results.items()})
+        BASELINE_FILE.write_text(json.dumps(baselines, ensure_ascii=False, indent=2, sort_keys=True) + "\n",
+                                 encoding="utf-8")
+        terminalreporter.write_line(f"基线已更新: {BASELINE_FILE}")
@@ -0,0 +1,172 @@
+"""纯函数的性能回归基准（基线见 tests/perf_baselines.json，说明见 conftest.py）"""
+
+import io
+import os
+import base64
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+pytestmark = pytest.mark.perf
+
+
+def _png(img):
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture(scope="module")
+def slider_background():
+    """320×160 的滑块背景图：随机纹理上有一个 x=200 处的亮色缺口"""
+    np = pytest.importorskip("numpy")
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    arr = rng.integers(60, 120, size=(160, 320, 3), dtype=np.uint8)
+    arr[50:100, 200:250] = 235
+    return _png(Image.fromarray(arr))
+
+
+def _grid_image(distinct):
+    """300×300 的九宫格截图，distinct 种不同的格子按顺序循环填充"""
+    from PIL import Image, ImageDraw
+    rng = random.Random(distinct)
+    tiles = []
+    for _ in range(distinct):
+        tile = Image.new("RGB", (100, 100), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(tile)
+        for _ in range(12):
+            x, y = rng.randrange(90), rng.randrange(90)
+            draw.ellipse((x, y, x + rng.randrange(5, 40), y + rng.randrange(5, 40)),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        tiles.append(tile)
+    grid = Image.new("RGB", (300, 300), "white")
+    for index in range(9):
+        row, col = divmod(index, 3)
+        grid.paste(tiles[index % distinct], (col * 100, row * 100))
+    return grid
+
+
+def test_identify_gap_local(benchmark, slider_background):
+    from gap_detection import identify_gap_local
+    position = benchmark(lambda: identify_gap_local(slider_background))
+    # 边缘检测命中缺口的左边缘或右边缘
+    assert min(abs(position - 200), abs(position - 250)) <= 2
+
+
+def test_identify_gap_with_library(benchmark, slider_background):
+    pytest.importorskip("captcha_recognizer")
+    from gap_detection import get_slider, identify_gap_with_library
+    get_slider()  # 模型加载不计入
+    identify_gap_with_library(slider_background)
+    benchmark(lambda: identify_gap_with_library(slider_background), rounds=3)
+
+
+@pytest.fixture
+def ai_service(monkeypatch):
+    pytest.importorskip("zhipuai")
+    monkeypatch.setenv("ZHIPU_API_KEY", "perf-test")
+    from ai_service import AIService
+    return AIService()
+
+
+AI_RESPONSES = [
+    '{"labels": ["猫", "狗", "汽车"], "confidence": [0.9, 0.8, 0.7]}',
+    '好的，识别结果如下：\n```json\n{"labels": ["猫", "狗", "汽车"],}\n```\n以上。',
+    '｛"indices"：［1，4，7］，"confidence"：0.82｝',
+    "{'labels': ['自行车', '飞机', '船'], 'confidence': [0.6, 0.5, 0.4]} 希望对你有帮助",
+    "我无法确定图片内容。",
+]
+
+
+def test_safe_parse_json(benchmark, ai_service):
+    def parse_all():
+        return [ai_service.safe_parse_json(text) for text in AI_RESPONSES]
+
+    results = benchmark(parse_all)
+    assert results[0]["labels"] == ["猫", "狗", "汽车"]
+    assert results[-1] is None
+
+
+@pytest.fixture
+def replay_service(monkeypatch, tmp_path):
+    """对模拟服务器录制一次九宫格求解的AI调用，然后切换为不等待的回放"""
+    pytest.importorskip("zhipuai")
+    monkeypatch.setenv("ZHIPU_API_KEY", "perf-test")
+    from ai_service import AIService
+    from cassette import Cassette, RECORD, REPLAY
+    from mock_zhipu_server import MockZhipuServer
+    path = tmp_path / "cassette.jsonl"
+    with MockZhipuServer() as server:
+        ai_service = AIService(base_url=server.base_url)
+        ai_service.cassette = Cassette(path=path, mode=RECORD)
+        _solve_grid(ai_service)
+    ai_service.cassette = Cassette(path=path, mode=REPLAY, latency_scale=0)
+    return ai_service
+
+
+def _solve_grid(ai_service):
+    labels = []
+    for row in range(3):
+        labels.extend(ai_service.identify_captcha_row_scored(f"row-{row}".encode(), row + 1)[0])
+    return labels, ai_service.semantic_match("猫", labels)
+
+
+def test_solver_ai_path_replay(benchmark, replay_service):
+    """九宫格求解中AI部分的本地开销（提示词构造、base64、解析），AI调用由磁带回放"""
+    labels, indices = benchmark(lambda: _solve_grid(replay_service))
+    assert labels == ["猫", "狗", "汽车"] * 3
+    assert indices == [1]
+
+
+@pytest.mark.parametrize("distinct", [9, 3], ids=["distinct", "duplicates"])
+def test_grid_crop_encode(benchmark, distinct):
+    """截图解码 → 去重裁剪 → 逐行 PNG → base64（与发送给识别后端的数据一致）"""
+    pytest.importorskip("PIL")
+    from grid_cells import load_grid_image, plan_grid_rows
+    grid_bytes = _png(_grid_image(distinct))
+
+    def crop_encode():
+        plan = plan_grid_rows(load_grid_image(grid_bytes))
+        return plan, [base64.b64encode(row).decode("utf-8") for row in plan["rows"]]
+
+    plan, encoded = benchmark(crop_encode)
+    assert len(plan["groups"]) == distinct
+    assert len(encoded) == (3 if distinct == 9 else 1)
+
+
+def test_logger_write_throughput(benchmark, tmp_path):
+    from logger import CheckinLogger
+    logger = CheckinLogger(base_dir=tmp_path)
+
+    def write_batch():
+        for i in range(200):
+            logger.log_info(f"第 {i} 条日志：验证码步骤 {i % 9} 完成，耗时 {i * 0.37:.2f}s")
+
+    benchmark(write_batch)
+    assert logger.log_file.stat().st_size > 0
+
+
+def test_clean_old_logs_large_directory(benchmark, tmp_path, capsys):
+    """5000 个文件的日志目录（近期日志、其他文件和每轮重新生成的 200 个过期日志）"""
+    from main import clean_old_logs
+    logs_dir = tmp_path / "logs"
+    logs_dir.mkdir()
+    today = datetime.now()
+    for day in range(25):
+        (logs_dir / f"checkin_{today - timedelta(days=day):%Y-%m-%d}.log").write_text("x")
+    for i in range(4775):
+        (logs_dir / f"debug_{i}.txt").touch()
+    os.mkdir(logs_dir / "archive")
+    old_names = [f"checkin_{today - timedelta(days=40 + day):%Y-%m-%d}.log" for day in range(200)]
+
+    def create_old_logs():
+        for name in old_names:
+            (logs_dir / name).touch()
+
+    benchmark(lambda: clean_old_logs(tmp_path), setup=create_old_logs, rounds=5)
+    capsys.readouterr()
+    remaining = {p.name for p in logs_dir.iterdir()}
+    assert not remaining.intersection(old_names)
+    assert len(remaining) == 25 + 4775 + 1
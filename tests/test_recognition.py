@@ -0,0 +1,84 @@
+"""识别路由的熔断与故障转移"""
+
+from recognition import BackendUnavailable, MockBackend, RecognitionRouter
+
+
+class FlakyBackend(MockBackend):
+    """按 fail 属性决定 find_gap 抛出的异常（None 表示成功）"""
+
+    def __init__(self, name, expected_latency, **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        self.expected_latency = expected_latency
+        self.fail = None
+        self.calls = 0
+
+    def find_gap(self, bg_img_bytes):
+        self.calls += 1
+        if self.fail is not None:
+            raise self.fail
+        return super().find_gap(bg_img_bytes)
+
+
+def make_router(**kwargs):
+    primary = FlakyBackend("primary", 0.01, gap=100)
+    secondary = FlakyBackend("secondary", 1.0, gap=200)
+    router = RecognitionRouter([primary, secondary], cost_weight=0, failure_threshold=1, **kwargs)
+    return router, primary, secondary
+
+
+def trip(router, backend):
+    """让 backend 失败一次（failure_threshold=1，立即熔断）"""
+    backend.fail = RuntimeError("boom")
+    router._record(backend, "find_gap", "error", 0.0)
+    backend.fail = None
+
+
+def test_open_breaker_ranked_second_is_not_claimed_when_first_succeeds():
+    router, primary, secondary = make_router(reset_timeout=0)
+    trip(router, secondary)
+    breaker = router.breakers["secondary"]
+    assert breaker.is_open
+
+    # 冷却已结束，secondary 出现在候选中，但排在前面的 primary 成功了，试探机会不应被占用
+    assert [b.name for b in router.candidates("find_gap")] == ["primary", "secondary"]
+    assert router.dispatch("find_gap", b"") == (100, 0.9)
+    assert secondary.calls == 0
+    assert not breaker.half_open
+    assert breaker.available()
+
+    # primary 故障时 secondary 作为试探请求被调用，成功后熔断器关闭
+    primary.fail = RuntimeError("down")
+    assert router.dispatch("find_gap", b"") == (200, 0.9)
+    assert secondary.calls == 1
+    assert not breaker.is_open
+
+
+def test_open_breaker_skipped_during_cooldown():
+    router, primary, secondary = make_router(reset_timeout=60)
+    trip(router, primary)
+    assert [b.name for b in router.candidates("find_gap")] == ["secondary"]
+    assert router.dispatch("find_gap", b"") == (200, 0.9)
+    assert primary.calls == 0
+
+
+def test_unavailable_probe_releases_half_open():
+    router, primary, secondary = make_router(reset_timeout=0)
+    trip(router, primary)
+    primary.fail = BackendUnavailable("cache miss")
+    assert router.dispatch("find_gap", b"") == (200, 0.9)
+    assert primary.calls == 1
+    breaker = router.breakers["primary"]
+    assert breaker.is_open and not breaker.half_open
+    assert breaker.available()
+
+
+def test_half_open_allows_single_probe():
+    router, primary, _ = make_router(reset_timeout=0)
+    trip(router, primary)
+    breaker = router.breakers["primary"]
+    assert breaker.claim_probe()
+    # 试探进行中：不再出现在候选中，也不能再次占用
+    assert not breaker.available()
+    assert not breaker.claim_probe()
+    assert [b.name for b in router.candidates("find_gap")] == ["secondary"]
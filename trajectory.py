@@ -0,0 +1,291 @@
+"""
+滑块拖动轨迹
+
+先用 numpy 一次性算出完整的拖动计划（按下、缓动移动、抖动、超调、回位、松开，以及每个事件的计划时刻），
+再按绝对时刻统一下发。Chromium 下通过 CDP Input.dispatchMouseEvent 直接注入鼠标事件
+（不受 slow_mo 影响，事件时间戳即计划时刻），其他浏览器回退到 page.mouse。
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import random
+import itertools
+from pathlib import Path
+import numpy as np
+import pytweening
+
+try:
+    import fcntl
+except ImportError:  # Windows 无 fcntl，保存时不加锁
+    fcntl = None
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 事件类型（计划数组第4列）
+EVENT_MOVE, EVENT_DOWN, EVENT_UP = 0, 1, 2
+
+# 可选的缓动函数（pytweening 函数名）
+EASINGS = ("easeInOutQuad", "easeOutQuad", "easeInOutCubic")
+# 步数区间、抖动幅度（像素）、是否超调
+STEP_RANGES = ((20, 24), (25, 30))
+JITTERS = (1.0, 2.0)
+OVERSHOOTS = (False, True)
+
+# 参数组合（老虎机的“臂”）：(缓动函数, 步数区间, 抖动, 是否超调)
+ARMS = list(itertools.product(EASINGS, STEP_RANGES, JITTERS, OVERSHOOTS))
+
+
+def arm_key(arm):
+    easing, (lo, hi), jitter, overshoot = arm
+    return f"{easing}/{lo}-{hi}/j{jitter:g}/{'overshoot' if overshoot else 'direct'}"
+
+
+def params_for_arm(arm, rng=random):
+    """在某个参数组合内随机生成具体的轨迹参数"""
+    easing, (lo, hi), jitter, overshoot = arm
+    return {
+        "arm": arm_key(arm),
+        "easing": easing,
+        "steps": rng.randint(lo, hi),
+        "jitter": jitter,
+        "overshoot": rng.uniform(2, 5) if overshoot else 0.0,
+    }
+
+
+def random_params(rng=random):
+    """随机生成一组轨迹参数"""
+    return params_for_arm(rng.choice(ARMS), rng)
+
+
+def plan_drag(start_x, start_y, distance, params, rng=None):
+    """计算完整拖动计划
+
+    返回形状为 (N, 4) 的数组，每行为 (计划时刻秒, x, y, 事件类型)，时刻从移动到滑块按钮开始计算
+    """
+    rng = rng or np.random.default_rng()
+    steps = int(params["steps"])
+    jitter = float(params["jitter"])
+    overshoot = float(params.get("overshoot") or 0.0)
+    easing = getattr(pytweening, params["easing"])
+
+    # 缓动进度与抖动
+    fraction = np.arange(steps) / steps
+    progress = np.fromiter((easing(f) for f in fraction), dtype=float, count=steps)
+    xs = start_x + distance * progress + rng.uniform(-jitter, jitter, steps)
+    ys = start_y + rng.uniform(-jitter * 4 / 3, jitter * 4 / 3, steps)
+
+    # 间隔：前30%快速移动，后30%减速，中间适中
+    intervals = np.where(
+        fraction < 0.3, rng.uniform(0.005, 0.015, steps),
+        np.where(fraction > 0.7, rng.uniform(0.02, 0.04, steps), rng.uniform(0.01, 0.025, steps)))
+
+    target_x = start_x + distance
+    rows = [(0.0, start_x, start_y, EVENT_MOVE)]
+    t = rng.uniform(0.1, 0.2)
+    rows.append((t, start_x, start_y, EVENT_DOWN))
+    t += rng.uniform(0.1, 0.2)
+    times = t + np.concatenate(([0.0], np.cumsum(intervals[:-1])))
+    rows.extend(zip(times, xs, ys, np.full(steps, EVENT_MOVE)))
+    t = times[-1] + intervals[-1]
+
+    # 轻微超调后回位（模拟人类操作的不精确性）
+    if overshoot > 0:
+        rows.append((t, target_x + overshoot, start_y + rng.uniform(-1, 1), EVENT_MOVE))
+        t += rng.uniform(0.05, 0.1)
+    rows.append((t, target_x, start_y, EVENT_MOVE))
+    t += rng.uniform(0.15, 0.25)
+    rows.append((t, target_x, start_y, EVENT_UP))
+    return np.array(rows, dtype=float)
+
+
+def _open_cdp_session(page):
+    """仅 Chromium 支持 CDP，其他浏览器返回 None"""
+    try:
+        return page.context.new_cdp_session(page)
+    except Exception:
+        return None
+
+
+def _drag_events(plan, wall_start):
+    """把计划转换为 (计划时刻, 事件类型, x, y, CDP 鼠标事件参数) 列表，在下发前一次性算好"""
+    events = []
+    pressed = False
+    for t, x, y, event in plan:
+        t, x, y = float(t), float(x), float(y)
+        params = {"x": x, "y": y, "timestamp": wall_start + t, "button": "left"}
+        if event == EVENT_DOWN:
+            pressed = True
+            params.update(type="mousePressed", buttons=1, clickCount=1)
+        elif event == EVENT_UP:
+            pressed = False
+            params.update(type="mouseReleased", buttons=0, clickCount=1)
+        else:
+            params.update(type="mouseMoved", buttons=1 if pressed else 0)
+            if not pressed:
+                params["button"] = "none"
+        events.append((t, event, x, y, params))
+    return events
+
+
+def dispatch_drag(page, plan):
+    """按计划时刻下发整条轨迹，返回实际耗时（秒）
+
+    每个事件按相对起点的绝对时刻调度，单次调用的延迟不会累积到后续事件上
+    """
+    session = _open_cdp_session(page)
+    events = _drag_events(plan, time.time())
+    start = time.perf_counter()
+    try:
+        for t, event, x, y, params in events:
+            delay = start + t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if session is not None:
+                session.send("Input.dispatchMouseEvent", params)
+            elif event == EVENT_DOWN:
+                page.mouse.down()
+            elif event == EVENT_UP:
+                page.mouse.up()
+            else:
+                page.mouse.move(x, y)
+    finally:
+        if session is not None:
+            try:
+                session.detach()
+            except Exception:
+                pass
+    return time.perf_counter() - start
+
+
+async def dispatch_drag_async(page, plan):
+    """dispatch_drag 的异步版本（playwright.async_api 页面）"""
+    try:
+        session = await page.context.new_cdp_session(page)
+    except Exception:
+        session = None
+    events = _drag_events(plan, time.time())
+    start = time.perf_counter()
+    try:
+        for t, event, x, y, params in events:
+            delay = start + t - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if session is not None:
+                await session.send("Input.dispatchMouseEvent", params)
+            elif event == EVENT_DOWN:
+                await page.mouse.down()
+            elif event == EVENT_UP:
+                await page.mouse.up()
+            else:
+                await page.mouse.move(x, y)
+    finally:
+        if session is not None:
+            try:
+                await session.detach()
+            except Exception:
+                pass
+    return time.perf_counter() - start
+
+
+class TrajectoryTuner:
+    """根据历史通过率选择轨迹参数（Thompson 采样）
+
+    每个参数组合的通过率服从 Beta(1+通过, 1+失败) 后验，每次从后验中采样并选取采样值最大的组合：
+    通过率高的组合被更多地使用，尝试次数少的组合仍有机会被探索
+    """
+
+    def __init__(self, path=None, max_attempts=500, rng=None):
+        self.path = Path(path or os.getenv("TRAJECTORY_STATS_FILE") or BASE_DIR / "trajectory_stats.json")
+        self.max_attempts = max_attempts
+        self.rng = rng or random.Random()
+        # 本进程尚未写回磁盘的增量，保存时合并到文件中的最新统计上
+        self.pending = {}
+        self.pending_attempts = []
+        self.arms, self.attempts = self._load()
+
+    def _load(self):
+        try:
+            if self.path.exists():
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+                return data.get("arms", {}), data.get("attempts", [])
+        except Exception as e:
+            print(f"[WARNING] 读取轨迹统计失败，将重新创建: {e}")
+        return {}, []
+
+    def _counts(self, key):
+        stats = self.arms.get(key, {})
+        return stats.get("passed", 0), stats.get("failed", 0)
+
+    def choose(self):
+        """选择本次使用的轨迹参数"""
+        best_arm, best_score = None, -1.0
+        for arm in ARMS:
+            passed, failed = self._counts(arm_key(arm))
+            score = self.rng.betavariate(1 + passed, 1 + failed)
+            if score > best_score:
+                best_arm, best_score = arm, score
+        return params_for_arm(best_arm, self.rng)
+
+    def record(self, params, passed):
+        """记录一次拖动结果并写回磁盘"""
+        key = params.get("arm")
+        if not key:
+            return
+        field = "passed" if passed else "failed"
+        self.pending.setdefault(key, {"passed": 0, "failed": 0})[field] += 1
+        self.pending_attempts.append({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "passed": bool(passed), **params})
+        self.save()
+
+    def save(self):
+        """加锁后重新读取文件，把本进程的增量合并进去再写回（多个进程同时签到时不会互相覆盖）"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # 数据文件通过 os.replace 整体替换，锁加在单独的锁文件上
+            with open(self.path.with_name(self.path.name + ".lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    arms, attempts = self._load()
+                    for key, delta in self.pending.items():
+                        stats = arms.setdefault(key, {"passed": 0, "failed": 0})
+                        for field, count in delta.items():
+                            stats[field] = stats.get(field, 0) + count
+                    attempts.extend(self.pending_attempts)
+                    del attempts[:-self.max_attempts]
+                    data = json.dumps({"arms": arms, "attempts": attempts}, ensure_ascii=False)
+                    tmp_path = self.path.with_name(self.path.name + f".{os.getpid()}.tmp")
+                    tmp_path.write_text(data, encoding="utf-8")
+                    os.replace(tmp_path, self.path)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except Exception as e:
+            print(f"[WARNING] 保存轨迹统计失败: {e}")
+            return
+        self.arms, self.attempts = arms, attempts
+        self.pending, self.pending_attempts = {}, []
+
+    def summary(self):
+        """按后验均值排序的 (组合, 通过, 失败, 估计通过率) 列表"""
+        rows = []
+        for arm in ARMS:
+            key = arm_key(arm)
+            passed, failed = self._counts(key)
+            rows.append((key, passed, failed, (1 + passed) / (2 + passed + failed)))
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+def main():
+    """打印各参数组合的拖动通过率统计"""
+    tuner = TrajectoryTuner()
+    print(f"{'参数组合':<44}{'通过':>4}{'失败':>4}{'估计通过率':>9}")
+    for key, passed, failed, rate in tuner.summary():
+        print(f"{key:<48}{passed:>6}{failed:>6}{rate:>14.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
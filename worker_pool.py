@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+多主机签到工作池
+
+账号较多、分布在多台主机上时，由协调者把账号写入 SQLite 任务队列，各主机上的 worker 租用任务并执行签到：
+
+  python worker_pool.py enqueue [account.txt]   # 把账号加入今天的队列（已存在的跳过）
+  python worker_pool.py work                    # 租用并执行任务，队列为空时退出（--wait 持续等待）
+  python worker_pool.py status                  # 查看今天各任务的状态
+
+- 每个任务在独立子进程中运行 main.py（独立的账号文件和登录状态文件），结果从签到台账读取；
+- 同一主机上同时租用的任务数不超过 WORKER_HOST_CONCURRENCY（按主机名统计，多个 worker 进程共享上限）；
+- 租约有效期为 WORKER_LEASE_SECONDS，执行期间定期续约；worker 异常退出后租约过期，任务自动被其他 worker 回收；
+- 失败的任务在 WORKER_RETRY_DELAY 秒后重试，最多尝试 WORKER_MAX_ATTEMPTS 次。
+
+队列文件（WORKER_POOL_DB，默认 worker_pool.db）需放在所有 worker 都能访问、且支持文件锁的存储上。
+"""
+
+import os
+import sys
+import time
+import socket
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import date
+from pathlib import Path
+import ledger
+from run_deadline import EXIT_DEADLINE
+
+BASE_DIR = Path(__file__).resolve().parent
+MAIN_SCRIPT = BASE_DIR / "main.py"
+STATES_DIR = BASE_DIR / "states"
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    password TEXT NOT NULL,
+    day TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_host TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0,
+    outcome TEXT,
+    updated_at REAL NOT NULL DEFAULT 0,
+    UNIQUE (account, day)
+);
+CREATE INDEX IF NOT EXISTS jobs_day_status ON jobs (day, status);
+"""
+
+
+class WorkerPool:
+    """SQLite 任务队列：入队、租用、续约、上报结果"""
+
+    def __init__(self, path=None, lease_seconds=None, max_attempts=None, retry_delay=None):
+        self.path = Path(path or os.getenv("WORKER_POOL_DB") or BASE_DIR / "worker_pool.db")
+        self.lease_seconds = lease_seconds or float(os.getenv("WORKER_LEASE_SECONDS", "600"))
+        self.max_attempts = max_attempts or int(os.getenv("WORKER_MAX_ATTEMPTS", "3"))
+        self.retry_delay = float(os.getenv("WORKER_RETRY_DELAY", "300")) if retry_delay is None else retry_delay
+        created = not self.path.exists()
+        conn = self._connect()
+        try:
+            # 队列文件可能位于多台主机共享的网络文件系统上，WAL 依赖本机共享内存索引，跨主机不可靠；
+            # 使用默认的回滚日志（租用时的 BEGIN IMMEDIATE 已足够），并把旧版本创建的 WAL 文件改回来
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+        if created:
+            # 队列中保存了密码
+            os.chmod(self.path, 0o600)
+
+    def _connect(self):
+        # isolation_level=None：由 BEGIN IMMEDIATE 显式控制事务，租用时直接取得写锁
+        return sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+
+    def enqueue(self, accounts, day=None):
+        """把 (用户名, 密码) 加入 day（默认今天）的队列，返回新增的任务数"""
+        day = (day or date.today()).isoformat()
+        conn = self._connect()
+        try:
+            before = conn.total_changes
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (account, password, day, updated_at) VALUES (?, ?, ?, ?)",
+                [(u, pw, day, time.time()) for u, pw in accounts])
+            conn.execute("COMMIT")
+            return conn.total_changes - before
+        finally:
+            conn.close()
+
+    def lease(self, owner, host, host_limit, day=None):
+        """为 owner 租用一个任务，返回 (id, 用户名, 密码) 或 None
+
+        本主机未过期的租约已达 host_limit 时不租用；过期的租约视为 worker 已失效，任务直接回收
+        """
+        day = (day or date.today()).isoformat()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            active = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND lease_host = ? AND lease_expires > ?",
+                (LEASED, host, now)).fetchone()[0]
+            while active < host_limit:
+                row = conn.execute(
+                    "SELECT id, account, password, attempts, status FROM jobs"
+                    " WHERE day = ? AND not_before <= ? AND (status = ? OR (status = ? AND lease_expires <= ?))"
+                    " ORDER BY attempts, id LIMIT 1",
+                    (day, now, PENDING, LEASED, now)).fetchone()
+                if row is None:
+                    break
+                job_id, account, password, attempts, status = row
+                if status == LEASED:
+                    print(f"[WARNING] 任务 {account} 的租约已过期，回收重新分配")
+                if attempts >= self.max_attempts:
+                    conn.execute("UPDATE jobs SET status = ?, outcome = COALESCE(outcome, 'error'), lease_owner = NULL,"
+                                 " updated_at = ? WHERE id = ?", (FAILED, now, job_id))
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = ?, lease_owner = ?, lease_host = ?, lease_expires = ?,"
+                    " attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (LEASED, owner, host, now + self.lease_seconds, now, job_id))
+                conn.execute("COMMIT")
+                return job_id, account, password
+            conn.execute("COMMIT")
+            return None
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def renew(self, job_id, owner):
+        """续约，租约已被回收时返回 False"""
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+                (time.time() + self.lease_seconds, time.time(), job_id, owner, LEASED))
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete(self, job_id, owner, outcome):
+        """上报结果：成功/已签到标记完成，否则延迟重试（达到最大次数后标记失败）"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT attempts FROM jobs WHERE id = ? AND lease_owner = ? AND status = ?",
+                               (job_id, owner, LEASED)).fetchone()
+            if row is None:
+                # 租约已被回收，结果以新的持有者为准
+                conn.execute("COMMIT")
+                return False
+            if outcome in ledger.DONE_OUTCOMES:
+                status, not_before = DONE, 0
+            elif row[0] >= self.max_attempts:
+                status, not_before = FAILED, 0
+            else:
+                status, not_before = PENDING, now + self.retry_delay
+            conn.execute(
+                "UPDATE jobs SET status = ?, outcome = ?, not_before = ?, lease_owner = NULL, lease_expires = 0,"
+                " updated_at = ? WHERE id = ?", (status, outcome, not_before, now, job_id))
+            conn.execute("COMMIT")
+            return True
+        finally:
+            conn.close()
+
+    def has_work(self, day=None):
+        """今天是否还有未结束的任务（含尚未到重试时间和正在执行的）"""
+        day = (day or date.today()).isoformat()
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM jobs WHERE day = ? AND status IN (?, ?) LIMIT 1",
+                                (day, PENDING, LEASED)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def status(self, day=None):
+        day = (day or date.today()).isoformat()
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT account, status, attempts, outcome, lease_host, lease_expires FROM jobs WHERE day = ? ORDER BY id",
+                (day,)).fetchall()
+        finally:
+            conn.close()
+
+
+def state_file_for(account):
+    """每个账号独立的登录状态文件"""
+    digest = hashlib.sha1(account.encode("utf-8")).hexdigest()[:12]
+    return STATES_DIR / f"state_{digest}.json"
+
+
+def run_job(pool, job_id, owner, account, password, extra_args=()):
+    """在子进程中执行一个账号的签到，执行期间定期续约，返回结果"""
+    # 台账已记录当天完成（例如 worker 在签到成功后、上报前退出，任务被重新租用）时不再启动浏览器
+    if "--force" not in extra_args and ledger.safe_is_done(account):
+        return "already_signed"
+    STATES_DIR.mkdir(exist_ok=True)
+    fd, account_path = tempfile.mkstemp(prefix="account_", suffix=".txt", dir=str(STATES_DIR))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(f"{account}\n{password}\n")
+        env = dict(os.environ, CHECKIN_ACCOUNT_FILE=account_path, CHECKIN_STATE_FILE=str(state_file_for(account)))
+        # 只采用本次子进程写入的台账记录（子进程未写入结果就退出时不能误用当天更早的记录）
+        last_id = ledger.Ledger().last_id()
+        proc = subprocess.Popen([sys.executable, str(MAIN_SCRIPT), "--log-only", *extra_args], cwd=str(BASE_DIR), env=env)
+        interval = max(5.0, pool.lease_seconds / 3)
+        while True:
+            try:
+                returncode = proc.wait(timeout=interval)
+                break
+            except subprocess.TimeoutExpired:
+                if not pool.renew(job_id, owner):
+                    print(f"[WARNING] 任务 {account} 的租约已被回收，终止本地执行")
+                    proc.kill()
+                    proc.wait()
+                    return None
+    finally:
+        os.unlink(account_path)
+    if returncode == EXIT_DEADLINE:
+        return "timeout"
+    outcome = ledger.Ledger().last_outcome(account, after_id=last_id)
+    if outcome is None:
+        if returncode:
+            outcome = "error"
+        else:
+            # 子进程按台账提前退出时可能没有写入新记录
+            outcome = "already_signed" if ledger.safe_is_done(account) else "failed"
+    return outcome
+
+
+def work(pool, concurrency, wait=False, poll_interval=30.0, extra_args=()):
+    """启动 concurrency 个执行线程，直到队列中没有今天的任务（wait 为 True 时一直运行）"""
+    host = socket.gethostname()
+    base_owner = f"{host}:{os.getpid()}"
+    print(f"[INFO] worker {base_owner} 已启动，本机并发上限 {concurrency}")
+
+    def loop(index):
+        owner = f"{base_owner}:{index}"
+        while True:
+            job = pool.lease(owner, host, concurrency)
+            if job is None:
+                if not wait and not pool.has_work():
+                    return
+                time.sleep(poll_interval)
+                continue
+            job_id, account, password = job
+            print(f"[INFO] [{owner}] 开始执行 {account}")
+            start = time.monotonic()
+            try:
+                outcome = run_job(pool, job_id, owner, account, password, extra_args)
+            except Exception as e:
+                print(f"[ERROR] [{owner}] 执行 {account} 异常: {e}")
+                outcome = "error"
+            if outcome is not None:
+                pool.complete(job_id, owner, outcome)
+                print(f"[INFO] [{owner}] {account}: {outcome}（{time.monotonic() - start:.1f}s）")
+
+    threads = [threading.Thread(target=loop, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        # 未完成的任务在租约过期后由其他 worker 回收
+        print("[INFO] worker 已停止")
+        return 130
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多主机签到工作池")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_enqueue = sub.add_parser("enqueue", help="把账号文件中的账号加入今天的队列")
+    p_enqueue.add_argument("account_file", nargs="?", default=str(BASE_DIR / "account.txt"))
+    p_work = sub.add_parser("work", help="租用并执行任务")
+    p_work.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_HOST_CONCURRENCY", "2")),
+                        help="本机同时执行的任务数上限")
+    p_work.add_argument("--wait", action="store_true", help="队列为空时继续等待新任务")
+    sub.add_parser("status", help="查看今天的任务状态")
+    args = parser.parse_args()
+
+    pool = WorkerPool()
+    if args.command == "enqueue":
+        from main import load_accounts
+        added = pool.enqueue(load_accounts(Path(args.account_file)))
+        print(f"[INFO] 已加入 {added} 个任务")
+        return 0
+    if args.command == "work":
+        return work(pool, max(1, args.concurrency), wait=args.wait)
+
+    rows = pool.status()
+    if not rows:
+        print("[INFO] 今天没有任务")
+        return 0
+    now = time.time()
+    for account, status, attempts, outcome, host, expires in rows:
+        lease = f"  {host} 租约剩余 {expires - now:.0f}s" if status == LEASED else ""
+        print(f"{account:<24}{status:<10}尝试 {attempts}  结果 {outcome or '-'}{lease}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())